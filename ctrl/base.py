@@ -1,10 +1,19 @@
+import time
+
+from ctrl.link import LinkMonitor, JogStreamer, JOG
+from ctrl.timing import PeriodEstimator
+from sdk import apis
 from sdk.base import Robot
 
 
 class BaseController:
     def __init__(self, robot: Robot):
         self.robot = robot
-        self.act = lambda time, *args: None  # default act function, args are not defined
+
+    def act(self, period, *args):
+        # default act function, args are not defined.
+        # must be a method: an instance attribute would shadow the act of every subclass
+        pass
 
     def get_robot(self):
         return self.robot
@@ -29,11 +38,11 @@ class DebounceController(ButtonController):
         self.last_act_state = False
 
     def act(self, period, status):
-        self.last_act_state += period
+        self.last_act_time += period
         if status != self.last_act_state:
             self.last_act_state = status
             self.last_act_time = 0
-        elif self.last_act_state >= self.debounce_time:
+        elif self.last_act_time >= self.debounce_time:
             self.last_act_time = 0
             self.wrapped_controller.act(period, status)
 
@@ -77,3 +86,136 @@ class MotionController(BaseController):
 
     def act(self, period, horizontal, vertical):
         pass
+
+
+class SetpointPipeline:
+    def __init__(self, robot: Robot, motion, mode=2, estimator: PeriodEstimator = None, geofence=None,
+                 link: LinkMonitor = None, clock=time):
+        """
+        Collects the servo increments of all MotionControllers for one packet,
+        so the robot receives one servo command per packet instead of one per controller.
+        :param robot: The robot to send the setpoints to.
+        :param motion: The sdk.apis.Motion providing the speed.
+        :param mode: servo_cart mode, 1 - base frame increment, 2 - tool frame increment.
+        :param estimator: The period estimator deriving cmd_time, a default one if None.
+        :param geofence: The sdk.geofence.Geofence the translation of every setpoint is limited by,
+                         None for no limits. Needs the pose from sync before it takes effect.
+        :param link: The link monitor switching to JOG commands on a poor link, None to always servo.
+        :param clock: Provides monotonic_ns() for the round trip measured for the link monitor.
+        """
+        self.robot = robot
+        self.motion = motion
+        self.mode = mode
+        self.estimator = estimator if estimator is not None else PeriodEstimator()
+        self.delta = [0.0] * 6
+        self.geofence = geofence
+        self.position = None  # commanded TCP position in the base frame, [mm]
+        self.rotation = None  # commanded TCP orientation in the base frame, 3x3
+        self.link = link
+        self.jog = JogStreamer(robot, motion, ref=4 if mode == 2 else 2) if link is not None else None
+        self.jogging = False
+        self.latency = None  # round trip of the last command, [ms]
+        self.clock = clock
+
+    def sync(self, pose):
+        """
+        Reset the tracked TCP pose, e.g. to the actual one when servoing starts.
+        Between syncs the pose is integrated from the commanded increments.
+        :param pose: [x, y, z, rx, ry, rz] in [mm][°], None to stop limiting
+        """
+        if pose is None:
+            self.position = self.rotation = None
+            return
+        from sdk.kinematics import pose_to_matrix
+        t = pose_to_matrix(pose)
+        self.position = t[:3, 3].copy()
+        self.rotation = t[:3, :3].copy()
+
+    def reset(self):
+        """
+        Forget the command state, e.g. when servoing is (re)started from outside.
+        """
+        self.delta = [0.0] * 6
+        self.jogging = False
+        self.latency = None
+        if self.jog is not None:
+            self.jog.command = None
+
+    def halt(self):
+        """
+        For the stop paths: stop a JOG the link monitor may have started at once, it would
+        otherwise run on up to max_dis, and forget the command state.
+        """
+        jog = self.jog is not None
+        self.reset()
+        if jog:
+            self.robot.call(apis.Motion.jog_stop_immediately())
+
+    def add(self, delta):
+        for i in range(6):
+            self.delta[i] += delta[i]
+
+    def flush(self, period):
+        self.estimator.update(period)
+        delta, self.delta = self.delta, [0.0] * 6
+        if self.link is not None:
+            mode = self.link.update(period, self.latency)
+            self.latency = None
+            if mode == JOG:
+                self.flush_jog(delta, period)
+                return
+            if self.jogging:
+                self.leave_jog()
+        cmd_time = self.estimator.cmd_time(self.robot.stats.ewma_ms("Motion.servo_cart"))
+        if self.geofence is not None and self.position is not None:
+            delta = self.limit(delta)
+        start = self.clock.monotonic_ns()
+        self.robot.call(self.motion.servo_cart(
+            self.mode, delta, cmd_time=cmd_time, vel=self.motion.vel))
+        self.latency = (self.clock.monotonic_ns() - start) / 1e6
+
+    def flush_jog(self, delta, period):
+        if not self.jogging:
+            self.robot.call(apis.Motion.servo_end())
+            self.jogging = True
+        start = self.clock.monotonic_ns()
+        if self.jog.send(delta, period, self.jog_limit if self.geofence is not None else None):
+            self.latency = (self.clock.monotonic_ns() - start) / 1e6
+
+    def jog_limit(self, axis, direction, distance):
+        """
+        :return: how far a JOG along axis may go inside the geofence
+        """
+        if axis >= 3:
+            return distance
+        # the tracked pose is lost while jogging, a JOG command is rare enough to read it
+        self.sync(self.robot.call(apis.Common.get_actual_tcp_pose()))
+        step = [0.0, 0.0, 0.0]
+        step[axis] = distance if direction else -distance
+        if self.mode == 2:
+            step = self.rotation @ step
+        return distance * self.geofence.limit_step(self.position, step)
+
+    def leave_jog(self):
+        self.jog.stop()
+        self.jogging = False
+        self.robot.call(apis.Motion.servo_start())
+        if self.geofence is not None:
+            self.sync(self.robot.call(apis.Common.get_actual_tcp_pose()))
+
+    def limit(self, delta):
+        """
+        Scale the increment so the TCP stays inside the geofence, and advance the tracked pose.
+        """
+        from sdk.kinematics import rpy_to_matrix
+        step = [delta[0], delta[1], delta[2]]
+        if self.mode == 2:
+            step = self.rotation @ step
+        scale = self.geofence.limit_step(self.position, step)
+        if scale < 1.0:
+            # the whole increment is scaled, so the direction of the motion is kept
+            delta = [value * scale for value in delta]
+        self.position = self.position + scale * step
+        turn = rpy_to_matrix(delta[3:])
+        self.rotation = self.rotation @ turn if self.mode == 2 else turn @ self.rotation
+        return delta
@@ -0,0 +1,222 @@
+import threading
+import time
+
+import numpy as np
+
+from sdk import apis
+from sdk.base import Robot
+from sdk.log import log
+
+
+class ArmChannel(threading.Thread):
+    def __init__(self, robot: Robot, name, alpha=0.1, on_sent=None):
+        """
+        Sends the servo commands of one arm from its own thread, so the blocking RPCs of both
+        arms are in flight at the same time, each at the send time the scheduler chose.
+        :param robot: the arm
+        :param name: for the thread and the logs
+        :param alpha: weight of the newest round trip in the latency estimate
+        :param on_sent: function(channel, tick, start_ns, end_ns, error) called after each command
+        """
+        super().__init__(daemon=True, name=f"servo-{name}")
+        self.robot = robot
+        self.alpha = alpha
+        self.on_sent = on_sent
+        self.latency = None  # moving average of the round trip [ms]
+        self.overruns = 0  # ticks dropped while the previous command of this arm was still in flight
+        self.condition = threading.Condition()
+        self.pending = None  # (tick, api, send_at_ns)
+        self.busy = False
+        self.stopped = False
+
+    def submit(self, tick, api, send_at_ns) -> bool:
+        """
+        :return: False if the previous command is still in flight, the command is dropped then
+        """
+        with self.condition:
+            if self.busy:
+                self.overruns += 1
+                return False
+            self.busy = True
+            self.pending = (tick, api, send_at_ns)
+            self.condition.notify()
+            return True
+
+    def ready(self) -> bool:
+        with self.condition:
+            return not self.busy
+
+    def idle(self, timeout=None) -> bool:
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.busy, timeout)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending is not None or self.stopped)
+                if self.stopped:
+                    return
+                tick, api, send_at = self.pending
+                self.pending = None
+            remaining = send_at - time.monotonic_ns()
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+            error = None
+            start = time.monotonic_ns()
+            try:
+                self.robot.call(api)
+            except Exception as e:
+                # transport errors may come through raw, e.g. ConnectionResetError
+                error = e
+            end = time.monotonic_ns()
+            rtt = (end - start) / 1e6
+            self.latency = rtt if self.latency is None else self.latency + self.alpha * (rtt - self.latency)
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+            if self.on_sent is not None:
+                self.on_sent(self, tick, start, end, error)
+
+
+class DualArmStreamer(threading.Thread):
+    def __init__(self, left: Robot, right: Robot, setpoints, period=0.008, compensate=True, capacity=4096):
+        """
+        Streams coupled servo commands to two arms on one shared tick.
+
+        Every period both arms get the command of the same tick. The command of the arm with
+        the shorter round trip is sent later by the difference of the one-way latencies, so
+        both controllers receive their command at the same time; one-way latency is taken as
+        half the moving average of the round trip. The skew is estimated per tick as the
+        difference of start + round trip / 2 of the two calls.
+
+        A tick goes to both arms or to neither: if the previous command of either arm is still in
+        flight, the tick is dropped for both, so incremental commands keep the arms in step.
+        If a command of one arm fails, streaming stops and both arms are stopped.
+        :param left: the first arm
+        :param right: the second arm
+        :param setpoints: function(tick) -> (api for left, api for right), e.g. Motion.servo_cart with
+                          cmd_time=period; None for an arm skips it in this tick, None instead of the
+                          pair ends streaming
+        :param period: tick period [s]
+        :param compensate: whether send times are offset by the latency difference
+        :param capacity: number of skew samples kept for the statistics
+        """
+        super().__init__(daemon=True, name="dual-servo")
+        self.robots = (left, right)
+        self.setpoints = setpoints
+        self.period_ns = int(period * 1e9)
+        self.compensate = compensate
+        self.channels = (ArmChannel(left, "left", on_sent=self.on_sent),
+                         ArmChannel(right, "right", on_sent=self.on_sent))
+        self.lock = threading.Lock()
+        self.sent = {}  # tick -> {channel index: arrival estimate [ns]}
+        self.skews = np.zeros(capacity)
+        self.skew_count = 0
+        self.error = None
+        self.stopped = False
+        self.ticks = 0
+        self.late_ticks = 0
+        self.dropped_ticks = 0
+
+    def on_sent(self, channel, tick, start, end, error):
+        if error is not None:
+            if self.error is None:
+                self.error = error
+                log.error("%s servo command failed: %r", channel.name, error)
+            self.stopped = True
+            return
+        index = self.channels.index(channel)
+        with self.lock:
+            arrivals = self.sent.setdefault(tick, {})
+            arrivals[index] = start + (end - start) // 2
+            if len(arrivals) == 2:
+                del self.sent[tick]
+                self.skews[self.skew_count % len(self.skews)] = abs(arrivals[0] - arrivals[1]) / 1e6
+                self.skew_count += 1
+            # ticks where the other arm skipped or failed never complete, do not keep them
+            for old in [t for t in self.sent if t < tick - 8]:
+                del self.sent[old]
+
+    def offsets(self):
+        """
+        :return: send delay per arm after the tick [ns]
+        """
+        if not self.compensate:
+            return 0, 0
+        one_way = [(channel.latency or 0.0) / 2.0 for channel in self.channels]
+        latest = max(one_way)
+        return tuple(int((latest - d) * 1e6) for d in one_way)
+
+    def run(self):
+        for channel in self.channels:
+            channel.start()
+        try:
+            for robot in self.robots:
+                robot.call(apis.Motion.servo_start())
+            tick_at = time.monotonic_ns()
+            tick = 0
+            while not self.stopped:
+                commands = self.setpoints(tick)
+                if commands is None:
+                    break
+                offsets = self.offsets()
+                busy = [channel for channel, api in zip(self.channels, commands)
+                        if api is not None and not channel.ready()]
+                if busy:
+                    for channel in busy:
+                        channel.overruns += 1
+                    self.dropped_ticks += 1
+                else:
+                    for channel, api, offset in zip(self.channels, commands, offsets):
+                        if api is not None:
+                            channel.submit(tick, api, tick_at + offset)
+                self.ticks += 1
+                tick += 1
+                tick_at += self.period_ns
+                remaining = tick_at - time.monotonic_ns()
+                if remaining > 0:
+                    time.sleep(remaining / 1e9)
+                else:
+                    # keep the tick grid, skip the ticks that already passed
+                    missed = -remaining // self.period_ns + 1
+                    self.late_ticks += missed
+                    tick_at += missed * self.period_ns
+        finally:
+            for channel in self.channels:
+                channel.idle(1.0)
+                channel.stop()
+            self.finish()
+
+    def finish(self):
+        # each call on its own: the arm that failed must not keep the other one from stopping
+        calls = [apis.Motion.servo_end] + ([apis.Motion.stop_motion] if self.error is not None else [])
+        for robot in self.robots:
+            for call in calls:
+                try:
+                    robot.call(call())
+                except Exception as e:
+                    log.error("stopping an arm failed: %r", e)
+
+    def stop(self):
+        self.stopped = True
+
+    def skew_stats(self) -> dict:
+        """
+        :return: count, mean_ms, p50_ms, p99_ms, max_ms of the skew over the kept samples,
+                 latency_ms (round trip moving average) and overruns per arm, late_ticks, dropped_ticks
+        """
+        samples = self.skews[:min(self.skew_count, len(self.skews))]
+        stats = {"count": self.skew_count}
+        if len(samples):
+            stats.update(mean_ms=float(samples.mean()), p50_ms=float(np.percentile(samples, 50)),
+                         p99_ms=float(np.percentile(samples, 99)), max_ms=float(samples.max()))
+        stats["latency_ms"] = [channel.latency for channel in self.channels]
+        stats["overruns"] = [channel.overruns for channel in self.channels]
+        stats["late_ticks"] = self.late_ticks
+        stats["dropped_ticks"] = self.dropped_ticks
+        return stats
@@ -0,0 +1,245 @@
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from ctrl.source import InputSource, encode_joy_packet
+
+
+class VirtualClock:
+    """
+    Stands in for the time module where a clock is injectable (RosJoy, Watchdog, SetpointPipeline).
+    Time only moves when advanced, so a run does not depend on how fast the host is.
+    """
+
+    def __init__(self, start_ns=0):
+        self.now = start_ns
+
+    def monotonic_ns(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += int(seconds * 1e9)
+
+    def advance_to(self, time_ns):
+        if time_ns > self.now:
+            self.now = time_ns
+
+
+class ScriptedSource(InputSource):
+    """
+    Feeds a scripted packet stream on a VirtualClock: the clock is advanced to the time of
+    each event before it is returned. The source closes after the last event, which ends
+    RosJoy.run.
+    """
+
+    def __init__(self, clock: VirtualClock, events):
+        """
+        :param clock: the clock shared with the RosJoy under test
+        :param events: (time_ms, frame) in time order, frame being a dict for encode_joy_packet,
+                       raw bytes, or None for time passing without a packet arriving
+        """
+        super().__init__()
+        self.clock = clock
+        self.events = iter(events)
+
+    def receive(self):
+        if self.closed:
+            return None
+        event = next(self.events, None)
+        if event is None:
+            self.close()
+            return None
+        time_ms, frame = event
+        self.clock.advance_to(int(time_ms * 1e6))
+        if frame is None:
+            return None
+        raw = frame if isinstance(frame, bytes) else encode_joy_packet(frame)
+        return raw, self.clock.monotonic_ns()
+
+
+class Script:
+    def __init__(self, period=8.0, jitter=0.0, loss=0.0, seed=0):
+        """
+        Builds the events of a ScriptedSource from operator actions, e.g.
+        Script(jitter=3).idle(100).press("START").hold(500, left_x=1.0).gap(300).
+        Jitter and loss are drawn from a generator seeded with seed, so a script is reproducible.
+        :param period: nominal time between packets [ms]
+        :param jitter: packets arrive up to jitter early or late [ms]
+        :param loss: probability that a packet is lost
+        :param seed: seed of the jitter and loss
+        """
+        self.period = period
+        self.jitter = jitter
+        self.loss = loss
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.time = 0.0  # nominal time of the next packet [ms]
+        self.state = {}
+        self.events = []
+
+    def emit(self, frame):
+        offset = self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        lost = self.loss and self.random.random() < self.loss
+        time_ms = max(self.time + offset, self.events[-1][0] if self.events else 0.0)
+        self.events.append((time_ms, None if lost else frame))
+
+    def set(self, **values):
+        """
+        Change the held inputs from now on, e.g. set(left_x=0.5, LB=1).
+        """
+        self.state.update(values)
+        return self
+
+    def hold(self, duration, **values):
+        """
+        Send packets for duration [ms] with values applied on top of the held inputs.
+        """
+        frame = dict(self.state, **values)
+        end = self.time + duration
+        while self.time < end:
+            self.emit(frame)
+            self.time += self.period
+        return self
+
+    def idle(self, duration):
+        return self.hold(duration)
+
+    def press(self, button, duration=100.0):
+        """
+        Hold button for duration [ms] and release it. Presses shorter than the debounce
+        time of RosJoy are ignored by it.
+        """
+        return self.hold(duration, **{button: 1.0})
+
+    def gap(self, duration):
+        """
+        No packets for duration [ms], e.g. a dropout of the link. The clock still ticks every
+        period, so the watchdog sees the deadline pass as it would in real time.
+        """
+        end = self.time + duration
+        while self.time < end:
+            self.events.append((self.time, None))
+            self.time += self.period
+        return self
+
+    def burst(self, count, spacing=0.1):
+        """
+        count packets spacing [ms] apart, e.g. packets that were queued in the network.
+        """
+        for _ in range(count):
+            self.events.append((self.time, dict(self.state)))
+            self.time += spacing
+        return self
+
+
+class CallLog:
+    """
+    Wraps the SDK object of a Robot and records the virtual time of every call, so scenarios
+    can check when a command went out, e.g. the servo_end after a dropout.
+    """
+
+    def __init__(self, instance, clock: VirtualClock):
+        self.instance = instance
+        self.clock = clock
+        self.calls = []  # (time [ms], method name)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.instance, name)
+        if not callable(attribute):
+            return attribute
+
+        def logged(*args):
+            self.calls.append((self.clock.monotonic_ns() / 1e6, name))
+            return attribute(*args)
+        return logged
+
+
+class NullInstance:
+    """
+    An SDK object that accepts every call: commands succeed and queries return RESPONSES.
+    For scenarios about the control logic alone, where the kinematics of a SimRobot would
+    take most of the run time.
+    """
+
+    RESPONSES = {
+        "GetActualTCPPose": (0, [0.0] * 6),
+        "GetActualJointPosDegree": (0, [0.0] * 6),
+        "GetRobotMotionDone": (0, 1),
+        "GetGripperMotionDone": (0, [0, 1]),
+        "GetRobotErrorCode": (0, [0, 0]),
+        "IsInDragTeach": (0, 0),
+    }
+
+    def __init__(self, responses=None):
+        """
+        :param responses: method name -> return value, merged over RESPONSES; anything else returns 0
+        """
+        self.responses = dict(self.RESPONSES)
+        if responses is not None:
+            self.responses.update(responses)
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        response = self.responses.get(name, 0)
+        return lambda *args: response
+
+
+def null_robot(responses=None):
+    """
+    A Robot on a NullInstance, with call timeouts off like sdk.sim.sim_robot.
+    """
+    from sdk.base import Robot
+    from sdk.policy import CallPolicy, DEFAULT_POLICIES
+    policies = {key: CallPolicy(timeout=None) for key in DEFAULT_POLICIES}
+    return Robot(instance=NullInstance(responses), policies=policies)
+
+
+def run_script(script: Script, robot=None, sim=True, **kwargs) -> dict:
+    """
+    Run RosJoy over a script on virtual time, in the calling thread.
+    :param script: the operator input
+    :param robot: the robot, if None a sdk.sim.sim_robot() or, without sim, a null_robot().
+                  Its SDK object is wrapped in a CallLog.
+    :param sim: whether the default robot is simulated
+    :param kwargs: passed to RosJoy, e.g. input_timeout or link
+    :return: "calls": (time [ms], method) sent to the robot, "watchdog": number of watchdog stops,
+             "started", "in_err": final state of RosJoy, "time": virtual time at the end [ms],
+             "sim": SimRobot.report() if the robot is simulated
+    """
+    from ctrl.rosjoy import RosJoy
+    if robot is None:
+        from sdk.sim import sim_robot
+        robot = sim_robot() if sim else null_robot()
+    clock = VirtualClock()
+    instance = robot.instance
+    robot.instance = CallLog(instance, clock)
+    if robot.urgent_instance is instance:
+        robot.urgent_instance = robot.instance
+    rosjoy = RosJoy(robot, source=ScriptedSource(clock, script.events), clock=clock, **kwargs)
+    rosjoy.run()
+    return {
+        "calls": robot.instance.calls,
+        "watchdog": rosjoy.watchdog.fired,
+        "started": rosjoy.started,
+        "in_err": rosjoy.in_err,
+        "time": clock.monotonic_ns() / 1e6,
+        "sim": instance.report() if hasattr(instance, "report") else None,
+    }
+
+
+def _run_script(args):
+    script, sim, kwargs = args
+    return run_script(script, sim=sim, **kwargs)
+
+
+def run_scripts(scripts, workers=None, sim=True, **kwargs) -> list:
+    """
+    Run scripts in parallel processes, each on a fresh robot, see run_script.
+    :param scripts: the Scripts
+    :param workers: number of processes, one per core if None
+    :param sim: whether the robots are simulated or null_robot()s
+    :param kwargs: passed to RosJoy, must be picklable
+    :return: the result of run_script per script, in order
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_script, [(script, sim, kwargs) for script in scripts], chunksize=16))
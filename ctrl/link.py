@@ -0,0 +1,142 @@
+from sdk import apis
+
+SERVO = "servo"
+JOG = "jog"
+
+
+class LinkMonitor:
+    def __init__(self, alpha=0.05, jitter_high=4.0, jitter_low=2.0, latency_high=8.0, latency_low=4.0,
+                 degrade_after=25, recover_after=250):
+        """
+        Chooses between servo streaming and JOG from the measured link quality, with hysteresis.
+
+        Servo streaming needs a setpoint every period: jitter of the input packets or slow RPCs
+        starve the controller and the arm stutters. JOG needs one command per change of the
+        operator's intent and keeps moving on its own in between.
+
+        The link is bad once jitter or latency exceeds its high threshold for degrade_after
+        packets in a row, and good again only once both stay below their low thresholds for
+        recover_after packets in a row, so a marginal link does not flap between the modes.
+        :param alpha: weight of the newest sample in the moving averages
+        :param jitter_high: input period jitter that counts as bad [ms]
+        :param jitter_low: input period jitter that counts as good [ms]
+        :param latency_high: RPC round trip that counts as bad [ms]
+        :param latency_low: RPC round trip that counts as good [ms]
+        :param degrade_after: bad packets in a row before switching to JOG
+        :param recover_after: good packets in a row before switching back to servo
+        """
+        self.alpha = alpha
+        self.jitter_high = jitter_high
+        self.jitter_low = jitter_low
+        self.latency_high = latency_high
+        self.latency_low = latency_low
+        self.degrade_after = degrade_after
+        self.recover_after = recover_after
+
+        self.period = None  # moving average of the input period [ms]
+        self.jitter = 0.0  # moving average of |period - average period| [ms]
+        self.latency = 0.0  # moving average of the RPC round trip [ms]
+        self.mode = SERVO
+        self.streak = 0
+        self.switches = 0
+
+    def update(self, period, latency=None):
+        """
+        :param period: time since the previous packet [ms]
+        :param latency: round trip of the last command [ms], None if none was sent
+        :return: the mode to use, SERVO or JOG
+        """
+        if period > 0:
+            if self.period is None:
+                self.period = period
+            else:
+                self.jitter += self.alpha * (abs(period - self.period) - self.jitter)
+                self.period += self.alpha * (period - self.period)
+        if latency is not None:
+            self.latency += self.alpha * (latency - self.latency)
+
+        if self.mode == SERVO:
+            bad = self.jitter > self.jitter_high or self.latency > self.latency_high
+            self.streak = self.streak + 1 if bad else 0
+            if self.streak >= self.degrade_after:
+                self.switch(JOG)
+        else:
+            good = self.jitter < self.jitter_low and self.latency < self.latency_low
+            self.streak = self.streak + 1 if good else 0
+            if self.streak >= self.recover_after:
+                self.switch(SERVO)
+        return self.mode
+
+    def switch(self, mode):
+        self.mode = mode
+        self.streak = 0
+        self.switches += 1
+
+    def reset(self):
+        self.period = None
+        self.jitter = 0.0
+        self.latency = 0.0
+        self.mode = SERVO
+        self.streak = 0
+
+
+class JogStreamer:
+    def __init__(self, robot, motion: apis.Motion, ref=4, max_dis=10.0, max_delta=0.5, steps=5, refresh=100.0):
+        """
+        Turns servo increments into JOG commands along the dominant axis.
+
+        A command is only sent when the axis, the direction or the quantized speed changes,
+        or to renew a running JOG before it has covered max_dis. When commands stop
+        arriving, the JOG stops by itself after max_dis.
+        :param robot: the robot
+        :param motion: the Motion providing the speed
+        :param ref: 0 - joint, 2 - base frame, 4 - tool frame, 8 - workpiece frame
+        :param max_dis: distance of one JOG command [mm] or [°]
+        :param max_delta: increment per packet at full stick deflection
+        :param steps: number of speed levels between 0 and motion.vel
+        :param refresh: interval after which a running JOG is renewed [ms]
+        """
+        self.robot = robot
+        self.motion = motion
+        self.ref = ref
+        self.max_dis = max_dis
+        self.max_delta = max_delta
+        self.steps = steps
+        self.refresh = refresh
+        self.command = None  # (axis, direction, level) of the running JOG
+        self.elapsed = 0.0
+
+    def send(self, delta, period, limit=None) -> bool:
+        """
+        :param delta: the collected servo increment of one packet
+        :param period: time since the previous packet [ms]
+        :param limit: function(axis, direction, distance) returning a shorter distance, e.g. from
+                      a geofence, called only when a command is about to be sent
+        :return: whether a command was sent
+        """
+        axis = max(range(6), key=lambda i: abs(delta[i]))
+        magnitude = min(1.0, abs(delta[axis]) / self.max_delta)
+        level = int(round(magnitude * self.steps))
+        if level == 0:
+            return self.stop()
+        command = (axis, 1 if delta[axis] > 0 else 0, level)
+        self.elapsed += period
+        if command == self.command and self.elapsed < self.refresh:
+            return False
+        distance = self.max_dis
+        if limit is not None:
+            distance = limit(axis, command[1], distance)
+            if distance < 0.1:
+                return self.stop()
+        vel = max(1.0, self.motion.vel * level / self.steps)
+        self.robot.call(self.motion.jog_move(self.ref, axis + 1, command[1], distance, vel=vel))
+        self.command = command
+        self.elapsed = 0.0
+        return True
+
+    def stop(self) -> bool:
+        if self.command is None:
+            return False
+        self.command = None
+        self.robot.call(apis.Motion.jog_stop(self.ref + 1))
+        return True
@@ -1,27 +1,47 @@
 import threading
 import time
-import socket
 
-from ctrl.base import ButtonController, TriggerController, DebounceController, MotionController, BaseController
+from ctrl.base import ButtonController, TriggerController, DebounceController, MotionController, BaseController, \
+    SetpointPipeline
+from ctrl.source import InputSource, UdpJoySource, decode_joy_packet
+from ctrl.watchdog import Watchdog
 from sdk import apis
 from sdk.base import Robot, RobotException
+from sdk.log import log
+from sdk.state import StateSequencer, RUNNING, STOPPED
+from sdk.trace import tracer
 
 port = 25656
 host = '127.0.0.1'
 
 
 class RosJoy(threading.Thread):
-    def __init__(self, robot: Robot, host=host, port=port):
+    def __init__(self, robot: Robot, host=host, port=port, source: InputSource = None, input_timeout=100,
+                 geofence=None, link=None, clock=time):
+        """
+        :param robot: the robot to control
+        :param host: address of the default UDP source
+        :param port: port of the default UDP source
+        :param source: the input source, a UdpJoySource on (host, port) if None
+        :param input_timeout: milliseconds without valid input after which the motion is stopped
+        :param geofence: sdk.geofence.Geofence limiting the TCP, None for no limits
+        :param link: ctrl.link.LinkMonitor switching between servo streaming and JOG on a poor link,
+                     None to always stream
+        :param clock: provides monotonic_ns() to the watchdog and the timing of the loop, e.g. a
+                      ctrl.harness.VirtualClock, which the source then has to advance
+        """
         super().__init__(daemon=False)
-        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp.bind((host, port))
+        self.source = source if source is not None else UdpJoySource(host, port)
         self.prev_data = None
+        self.clock = clock
 
         self.robot = robot
         self.in_err = False
         self.started = False
         self.motion = apis.Motion()
         self.gripper = apis.Gripper()
+        self.sequencer = StateSequencer(robot, self.gripper)
+        self.setpoint = SetpointPipeline(robot, self.motion, geofence=geofence, link=link, clock=clock)
 
         self.start_control = DebounceController(TriggerController(self.StartControl(self)))
         self.select_control = DebounceController(TriggerController(self.SelectControl(self)))
@@ -29,26 +49,61 @@ class RosJoy(threading.Thread):
         self.y_control = DebounceController(TriggerController(self.MotionSpeedControl(self, 5)))
         self.lb_control = DebounceController(TriggerController(self.GripperControl(self, 0)))
         self.rb_control = DebounceController(TriggerController(self.GripperControl(self, 90)))
-        self.lj_control = self.MotionControl(self, 2, [0.5, 0, 0, 0, 0, 0], [0, 0.5, 0, 0, 0, 0])
-        self.rj_control = self.MotionControl(self, 2, [0, 0, 0.5, 0, 0, 0], [0, 0, 0, 0, 0, 0.5])
-        self.cross_control = self.MotionControl(self, 2, [0, 0, 0, 0, 0.5, 0], [0, 0, 0, 0.5, 0, 0])
+        self.lj_control = self.MotionControl(self, [0.5, 0, 0, 0, 0, 0], [0, 0.5, 0, 0, 0, 0])
+        self.rj_control = self.MotionControl(self, [0, 0, 0.5, 0, 0, 0], [0, 0, 0, 0, 0, 0.5])
+        self.cross_control = self.MotionControl(self, [0, 0, 0, 0, 0.5, 0], [0, 0, 0, 0.5, 0, 0])
         self.stop_control = self.StopControl(self, 0.7)
 
+        self.input_timeout = input_timeout
+        self.watchdog = Watchdog(self.on_input_lost, input_timeout, clock=clock)
+
+    def set_source(self, source: InputSource):
+        """
+        Swap the input source while running. The old source is closed,
+        the loop picks up the new one with its next read.
+        :param source: the new input source
+        """
+        old, self.source = self.source, source
+        self.prev_data = None
+        old.close()
+
+    def on_input_lost(self):
+        """
+        Called by the watchdog when no valid input arrived within input_timeout while moving.
+        The stops are urgent APIs, they do not queue behind a servo command stuck in the RPC worker.
+        """
+        self.started = False
+        try:
+            self.robot.call(apis.Motion.servo_end())
+        finally:
+            try:
+                self.setpoint.halt()
+            finally:
+                self.robot.call(apis.Motion.stop_motion())
+
     def run(self):
+        if self.watchdog.threaded and not self.watchdog.is_alive():
+            self.watchdog.start()
         while True:
-            data, _ = self.udp.recvfrom(256)  # raw float data, not string
-            current_ms = time.time_ns() // 1000000
-            if self.prev_data is not None and self.prev_data["time"] - current_ms < 2:
+            source = self.source
+            data = source.read()
+            if not self.watchdog.threaded:
+                self.watchdog.poll()
+            if data is None:
+                if source.closed and source is self.source:
+                    # the source ran out (e.g. end of a replay) and nobody swapped it
+                    break
                 continue
-            if len(data) != 16 * 4:
+            current_ms = data["time"]  # monotonic, sub-millisecond resolution
+            if self.prev_data is not None and current_ms - self.prev_data["time"] < 2:
+                # rate limit, packets closer than 2 ms to the previous one are dropped
                 continue
-            data = self.data_unpack(data, current_ms)
 
             period = data["time"] - self.prev_data["time"] if self.prev_data is not None else 0
             if period < 0:
                 # ?
                 continue
-            elif period > 100:
+            elif period > self.input_timeout:
                 # when the period is too long, the data is not valid
                 self.robot.call(apis.Motion.stop_motion())
                 self.robot.call(apis.Safety.clear_error())
@@ -56,6 +111,8 @@ class RosJoy(threading.Thread):
                 self.in_err = False
 
             self.prev_data = data
+            self.watchdog.feed()
+            control_start = self.clock.monotonic_ns()
             try:
                 self.start_control.act(period, data["buttons"]["START"])
                 self.select_control.act(period, data["buttons"]["SELECT"])
@@ -67,46 +124,41 @@ class RosJoy(threading.Thread):
                     self.lj_control.act(period, data["left_x"], data["left_y"])
                     self.rj_control.act(period, data["right_x"], data["right_y"])
                     self.cross_control.act(period, data["cross_x"], data["cross_y"])
+                    self.setpoint.flush(period)
                     self.stop_control.act(period, data["buttons"]["LT"], data["buttons"]["RT"])
             except RobotException as e:
-                print(e)
-                self.in_err = True
+                log.error("%s", e.args[0])
+                self.in_err = not self.recover(e)
+                if self.in_err:
+                    log.on_fault()
             except Exception as e:
-                self.robot.call(apis.Motion.stop_motion())
+                log.error("control loop failed: %r", e)
+                try:
+                    self.robot.call(apis.Motion.stop_motion())
+                finally:
+                    # the dump writes synchronously, only after the stop is out
+                    log.on_fault()
                 raise e
+            finally:
+                tracer.span("controller", control_start, self.clock.monotonic_ns())
+
+    @staticmethod
+    def recover(e: RobotException) -> bool:
+        """
+        Run the minimal recovery the error table prescribes for the error.
+        :return: whether control can go on, False leaves the robot in error until START
+        """
+        if not e.revocable:
+            return False
+        try:
+            e.revoke()
+        except RobotException:
+            return False
+        return True
 
     @staticmethod
     def data_unpack(raw_data: bytes, current_time) -> dict:
-        import struct
-        raw_data = [x[0] for x in struct.iter_unpack('f', raw_data)]
-        button_data = [False if x == 0 else True for x in raw_data[6:]]
-        # 第一行6个数分别代表左摇杆横轴，左摇杆纵轴，右摇杆横轴，右摇杆纵轴，十字按键横向，十字按键纵向，均为左正右负。摇杆取值为[-1, 1]之间的6位浮点数，十字按键取值为-1或0或1
-        # 第二行所有数均代表按钮状态，按下是1，未按下是0
-        res_data = {
-            "time": current_time,
-            "left_x": raw_data[0],
-            "left_y": raw_data[1],
-            "right_x": raw_data[2],
-            "right_y": raw_data[3],
-            "cross_x": raw_data[4],
-            "cross_y": raw_data[5],
-            "buttons": {
-                "A": button_data[0],
-                "B": button_data[1],
-                "X": button_data[2],
-                "Y": button_data[3],
-                "LB": button_data[4],
-                "RB": button_data[5],
-                "LT": raw_data[6 + 6],
-                "RT": raw_data[6 + 7],  # they are not buttons, but triggers
-                "SELECT": button_data[8],
-                "START": button_data[9]
-            }
-        }
-
-        res_data["cross_x"] = 0 if res_data["cross_x"] == 0 else (1 if res_data["cross_x"] > 0 else -1)
-        res_data["cross_y"] = 0 if res_data["cross_y"] == 0 else (1 if res_data["cross_y"] > 0 else -1)
-        return res_data
+        return decode_joy_packet(raw_data, current_time)
 
     class StartControl(ButtonController):
         def __init__(self, outer):
@@ -116,12 +168,12 @@ class RosJoy(threading.Thread):
         def act(self, _, status):
             if status:
                 self.outer.started = True
-                self.robot.call(apis.Safety.clear_error())
                 self.outer.in_err = False
-                self.robot.call(apis.Safety.enable_robot())
-                self.robot.call(apis.Safety.mode_switch_auto())
-                self.robot.call(apis.Motion.servo_start())
-                self.robot.call(self.outer.gripper.activate(0))
+                if self.outer.setpoint.geofence is not None:
+                    self.outer.setpoint.sync(self.robot.call(apis.Common.get_actual_tcp_pose()))
+                self.outer.setpoint.reset()
+                self.outer.sequencer.apply(RUNNING)
+                self.outer.watchdog.arm()
 
     class SelectControl(ButtonController):
         """
@@ -135,12 +187,12 @@ class RosJoy(threading.Thread):
         def act(self, _, status):
             if status:
                 self.outer.started = False
-                self.robot.call(apis.Motion.servo_end())
+                self.outer.watchdog.disarm()
+                self.outer.sequencer.apply({"servoing": False})
+                self.outer.setpoint.halt()
                 self.robot.call(apis.Motion.stop_motion())
-                self.robot.call(apis.Safety.clear_error())
+                self.outer.sequencer.apply(STOPPED)
                 self.outer.in_err = False
-                self.robot.call(self.outer.gripper.reset())
-                self.robot.call(apis.Safety.disable_robot())
                 # self.robot.call(apis.Safety.mode_switch_manual())
 
     class MotionSpeedControl(ButtonController):
@@ -156,7 +208,7 @@ class RosJoy(threading.Thread):
                     speed = 0
                 elif speed > 100:
                     speed = 100
-                print(f"Speed changed: {speed}")
+                log.info("Speed changed: %s", speed)
                 self.robot.call(self.outer.motion.set_speed(speed))
 
     class GripperControl(ButtonController):
@@ -171,24 +223,21 @@ class RosJoy(threading.Thread):
 
         def act(self, _, status):
             if status:
-                print(f"Gripper Position changed: {self.pos}")
+                log.info("Gripper Position changed: %s", self.pos)
                 self.robot.call(self.outer.gripper.move(self.pos, block=False))
 
     class MotionControl(MotionController):
-        def __init__(self, outer, mode, delta_h, delta_v):
+        def __init__(self, outer, delta_h, delta_v):
             super().__init__(outer.robot)
             self.outer = outer
             self.motion = outer.motion
-            self.mode = mode
             self.delta_h = delta_h
             self.delta_v = delta_v
             self.motion.set_speed(50)
 
         def act(self, period, horizontal, vertical):
             now_pos = [horizontal * self.delta_h[i] + vertical * self.delta_v[i] for i in range(6)]
-
-            self.robot.call(self.motion.servo_cart(
-                self.mode, now_pos, cmd_time=period / 1000.0, vel=self.motion.vel))
+            self.outer.setpoint.add(now_pos)
 
     class StopControl(BaseController):
         def __init__(self, outer, trigger_gate=0.7):
@@ -197,5 +246,7 @@ class RosJoy(threading.Thread):
 
         def act(self, _, lt, rt):
             if lt > 0.7 and rt > 0.7:
+                self.outer.watchdog.disarm()
                 self.robot.call(apis.Motion.servo_end())
+                self.outer.setpoint.halt()
                 self.robot.call(apis.Motion.stop_motion())
@@ -0,0 +1,341 @@
+import socket
+import struct
+import time
+from typing import Optional
+
+from sdk.trace import tracer
+
+JOY_PACKET_SIZE = 16 * 4
+"""
+Size of the raw joystick frame: 16 little-endian float32 values.
+"""
+
+
+def decode_joy_packet(raw_data: bytes, current_time) -> dict:
+    """
+    Decode one raw joystick frame into the packet dict consumed by the controllers.
+    :param raw_data: 16 float32 values, see JOY_PACKET_SIZE
+    :param current_time: receive timestamp of the frame
+    :return: the packet dict
+    """
+    raw_data = [x[0] for x in struct.iter_unpack('f', raw_data)]
+    button_data = [False if x == 0 else True for x in raw_data[6:]]
+    # 第一行6个数分别代表左摇杆横轴，左摇杆纵轴，右摇杆横轴，右摇杆纵轴，十字按键横向，十字按键纵向，均为左正右负。摇杆取值为[-1, 1]之间的6位浮点数，十字按键取值为-1或0或1
+    # 第二行所有数均代表按钮状态，按下是1，未按下是0
+    res_data = {
+        "time": current_time,
+        "left_x": raw_data[0],
+        "left_y": raw_data[1],
+        "right_x": raw_data[2],
+        "right_y": raw_data[3],
+        "cross_x": raw_data[4],
+        "cross_y": raw_data[5],
+        "buttons": {
+            "A": button_data[0],
+            "B": button_data[1],
+            "X": button_data[2],
+            "Y": button_data[3],
+            "LB": button_data[4],
+            "RB": button_data[5],
+            "LT": raw_data[6 + 6],
+            "RT": raw_data[6 + 7],  # they are not buttons, but triggers
+            "SELECT": button_data[8],
+            "START": button_data[9]
+        }
+    }
+
+    res_data["cross_x"] = 0 if res_data["cross_x"] == 0 else (1 if res_data["cross_x"] > 0 else -1)
+    res_data["cross_y"] = 0 if res_data["cross_y"] == 0 else (1 if res_data["cross_y"] > 0 else -1)
+    return res_data
+
+
+JOY_FIELDS = ["left_x", "left_y", "right_x", "right_y", "cross_x", "cross_y",
+              "A", "B", "X", "Y", "LB", "RB", "LT", "RT", "SELECT", "START"]
+"""
+Slot names of the joystick frame, in wire order.
+"""
+
+
+def encode_joy_packet(values: dict) -> bytes:
+    """
+    Build a raw joystick frame, the inverse of decode_joy_packet.
+    :param values: slot name (see JOY_FIELDS) -> value, missing slots are 0
+    :return: the raw frame
+    """
+    return struct.pack('16f', *[float(values.get(name, 0)) for name in JOY_FIELDS])
+
+
+class InputSource:
+    """
+    An input source feeding RosJoy.
+
+    A source owns its transport, stamps every frame when it arrives and decodes it into
+    the packet dict of decode_joy_packet. New devices only implement receive (and decode
+    if they do not speak the joystick frame); the control loop stays in RosJoy.
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def receive(self):
+        """
+        Block until the next raw frame arrives.
+        :return: (raw, time_ns) with time_ns the arrival time from time.monotonic_ns(),
+                 or None if nothing usable was received
+        """
+        raise NotImplementedError("Not implemented")
+
+    def decode(self, raw, current_time) -> Optional[dict]:
+        """
+        Decode a raw frame.
+        :param raw: the raw frame returned by receive
+        :param current_time: the receive timestamp in milliseconds
+        :return: the packet dict, or None if the frame is invalid
+        """
+        if len(raw) != JOY_PACKET_SIZE:
+            return None
+        return decode_joy_packet(raw, current_time)
+
+    def read(self) -> Optional[dict]:
+        """
+        Receive and decode the next frame.
+        :return: the packet dict, or None if nothing valid was received
+        """
+        try:
+            received = self.receive()
+        except OSError:
+            if self.closed:
+                return None
+            raise
+        if received is None:
+            return None
+        raw, received_ns = received
+        tracer.next_packet()
+        tracer.instant("receive", received_ns)
+        data = self.decode(raw, received_ns / 1e6)
+        tracer.span("decode", received_ns, time.monotonic_ns())
+        return data
+
+    def close(self):
+        """
+        Release the transport. A blocked receive returns None afterwards.
+        """
+        self.closed = True
+
+
+class UdpJoySource(InputSource):
+    """
+    The ROS joystick bridge: one 64-byte frame per UDP datagram.
+    """
+
+    def __init__(self, host='127.0.0.1', port=25656):
+        super().__init__()
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind((host, port))
+
+    def receive(self):
+        data, _ = self.udp.recvfrom(256)  # raw float data, not string
+        if self.closed:
+            return None
+        return data, time.monotonic_ns()
+
+    def close(self):
+        super().close()
+        try:
+            # wakes up a thread blocked in recvfrom, close alone does not
+            self.udp.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.udp.close()
+
+
+class TcpJoySource(InputSource):
+    """
+    A stream of back-to-back 64-byte frames over TCP, e.g. from a remote bridge.
+    Listens on (host, port) and serves one client at a time.
+    """
+
+    def __init__(self, host='127.0.0.1', port=25657):
+        super().__init__()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.conn = None
+        self.buffer = bytearray(JOY_PACKET_SIZE)
+        self.view = memoryview(self.buffer)
+
+    def receive(self):
+        if self.conn is None:
+            self.conn, _ = self.server.accept()
+            self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        received = 0
+        while received < JOY_PACKET_SIZE:
+            n = self.conn.recv_into(self.view[received:])
+            if n == 0:
+                # client gone, wait for the next one
+                self.conn.close()
+                self.conn = None
+                return None
+            received += n
+        return bytes(self.buffer), time.monotonic_ns()
+
+    def close(self):
+        super().close()
+        for sock in (self.conn, self.server):
+            if sock is None:
+                continue
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
+
+
+class EvdevSource(InputSource):
+    """
+    A 6-DoF spacemouse (or any evdev device) read through python-evdev.
+
+    Axis events are accumulated and one frame is emitted per EV_SYN report. EV_ABS axes keep
+    their value until the next event, EV_REL axes report motion since the last report and are
+    zeroed after each frame.
+    Translation drives the left stick and right_x, rotation drives right_y and the cross,
+    the same axes the gamepad sticks are mapped to.
+    """
+
+    AXIS_MAP = {
+        "REL_X": "left_x", "REL_Y": "left_y", "REL_Z": "right_x",
+        "REL_RZ": "right_y", "REL_RX": "cross_y", "REL_RY": "cross_x",
+        "ABS_X": "left_x", "ABS_Y": "left_y", "ABS_Z": "right_x",
+        "ABS_RZ": "right_y", "ABS_RX": "cross_y", "ABS_RY": "cross_x",
+    }
+
+    BUTTON_MAP = {"BTN_0": "LB", "BTN_1": "RB"}
+
+    def __init__(self, path, scale=350.0, axis_map=None, button_map=None):
+        """
+        :param path: device node, e.g. /dev/input/event5
+        :param scale: raw axis value mapped to full deflection
+        :param axis_map: evdev axis name -> joystick slot, defaults to AXIS_MAP
+        :param button_map: evdev key name -> joystick slot, defaults to BUTTON_MAP
+        """
+        super().__init__()
+        import evdev  # optional dependency, only needed for this source
+        self.ecodes = evdev.ecodes
+        self.device = evdev.InputDevice(path)
+        self.scale = scale
+        self.axis_map = self._resolve(axis_map or self.AXIS_MAP)
+        self.button_map = self._resolve(button_map or self.BUTTON_MAP)
+        self.state = {}
+        self.relative = set()  # slots set by EV_REL events since the last frame
+
+    def _resolve(self, mapping):
+        return {getattr(self.ecodes, name): slot for name, slot in mapping.items() if hasattr(self.ecodes, name)}
+
+    def receive(self):
+        ecodes = self.ecodes
+        for event in self.device.read_loop():
+            if event.type in (ecodes.EV_REL, ecodes.EV_ABS):
+                slot = self.axis_map.get(event.code)
+                if slot is not None:
+                    value = event.value / self.scale
+                    self.state[slot] = -1.0 if value < -1 else (1.0 if value > 1 else value)
+                    if event.type == ecodes.EV_REL:
+                        self.relative.add(slot)
+            elif event.type == ecodes.EV_KEY:
+                slot = self.button_map.get(event.code)
+                if slot is not None:
+                    self.state[slot] = 1.0 if event.value else 0.0
+            elif event.type == ecodes.EV_SYN:
+                raw = encode_joy_packet(self.state)
+                for slot in self.relative:
+                    self.state[slot] = 0.0
+                self.relative.clear()
+                return raw, time.monotonic_ns()
+        return None
+
+    def decode(self, raw, current_time):
+        data = super().decode(raw, current_time)
+        # rotations are analog here, do not snap them to -1/0/1 like the gamepad cross
+        data["cross_x"], data["cross_y"] = struct.unpack_from('2f', raw, 4 * 4)
+        return data
+
+    def close(self):
+        super().close()
+        self.device.close()
+
+
+class ReplaySource(InputSource):
+    """
+    Replays a file written by RecordingSource.
+
+    Each record is an int64 receive time in ns followed by one raw frame.
+    Frames are re-stamped with the current time and, if realtime is set, paced with
+    their recorded spacing. Without restamp they keep their recorded time, so a replay
+    that is not paced (e.g. against a sdk.sim.SimRobot) still has the recorded periods.
+    """
+
+    RECORD = struct.Struct('<q')
+
+    def __init__(self, path, realtime=True, loop=False, restamp=True):
+        super().__init__()
+        self.file = open(path, 'rb')
+        self.realtime = realtime
+        self.loop = loop
+        self.restamp = restamp
+        self.prev_recorded = None
+        self.prev_replayed = None
+
+    def receive(self):
+        if self.closed:
+            return None
+        header = self.file.read(self.RECORD.size)
+        if len(header) < self.RECORD.size:
+            if not self.loop:
+                self.close()
+                return None
+            self.file.seek(0)
+            self.prev_recorded = None
+            return None
+        recorded, = self.RECORD.unpack(header)
+        raw = self.file.read(JOY_PACKET_SIZE)
+        if self.realtime and self.prev_recorded is not None:
+            delay = (recorded - self.prev_recorded) - (time.monotonic_ns() - self.prev_replayed)
+            if delay > 0:
+                time.sleep(delay / 1e9)
+        self.prev_recorded = recorded
+        self.prev_replayed = time.monotonic_ns()
+        return raw, self.prev_replayed if self.restamp else recorded
+
+    def close(self):
+        super().close()
+        self.file.close()
+
+
+class RecordingSource(InputSource):
+    """
+    Wraps another source and appends every received frame to a file for ReplaySource.
+    Records have a fixed size, so frames of another length are zero padded or truncated
+    to JOY_PACKET_SIZE.
+    """
+
+    def __init__(self, wrapped: InputSource, path):
+        super().__init__()
+        self.wrapped = wrapped
+        self.file = open(path, 'ab')
+
+    def receive(self):
+        received = self.wrapped.receive()
+        if received is not None:
+            raw, current_time = received
+            self.file.write(ReplaySource.RECORD.pack(current_time))
+            self.file.write(bytes(raw[:JOY_PACKET_SIZE]).ljust(JOY_PACKET_SIZE, b'\0'))
+        return received
+
+    def decode(self, raw, current_time):
+        return self.wrapped.decode(raw, current_time)
+
+    def close(self):
+        super().close()
+        self.wrapped.close()
+        self.file.close()
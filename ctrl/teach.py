@@ -0,0 +1,199 @@
+import threading
+import time
+
+import numpy as np
+
+from sdk import apis
+from sdk.base import Robot
+from sdk.kinematics import rpy_to_matrix
+from sdk.log import log
+
+
+def _log_rotation(r):
+    """
+    :param r: (..., 3, 3) rotation matrices
+    :return: (..., 3) rotation vectors [rad]
+    """
+    cos = np.clip((np.trace(r, axis1=-2, axis2=-1) - 1.0) / 2.0, -1.0, 1.0)
+    angle = np.arccos(cos)
+    axis = np.stack([r[..., 2, 1] - r[..., 1, 2], r[..., 0, 2] - r[..., 2, 0], r[..., 1, 0] - r[..., 0, 1]], axis=-1)
+    sin = np.sin(angle)
+    # angle / (2 sin angle) -> 1/2 for small angles
+    scale = np.where(sin > 1e-9, angle / (2.0 * np.maximum(sin, 1e-9)), 0.5)
+    return axis * scale[..., None]
+
+
+class DragTeachRecorder(threading.Thread):
+    """
+    Records a drag-teach demonstration as a short list of waypoints for Motion.move_line.
+
+    Samples of the TCP pose and joints are taken as fast as the controller answers into a
+    preallocated ring buffer. They are simplified while recording with an opening window,
+    the streaming form of Douglas-Peucker: the segment from the last waypoint is stretched
+    sample by sample, and once a sample in between deviates more than the tolerance (which
+    also catches corners) the previous sample becomes a waypoint. Memory is bounded by the
+    ring and by the number of waypoints, not by the duration of the demonstration.
+    """
+
+    def __init__(self, robot: Robot, motion: apis.Motion = None, capacity=4096, tolerance=1.0,
+                 angle_tolerance=1.0, max_span=1000, period=0.0, teach_mode=True):
+        """
+        :param robot: the robot to record
+        :param motion: the Motion whose tool and user frame the poses are recorded in
+        :param capacity: raw samples kept in the ring buffer
+        :param tolerance: largest position deviation of the path from the waypoints [mm]
+        :param angle_tolerance: largest orientation deviation [°]
+        :param max_span: most samples between two waypoints, bounds the work per sample. While the arm
+                         rests no waypoint is added, the window restarts at the newest sample instead
+        :param period: minimum time between samples [s], 0 for as fast as possible
+        :param teach_mode: switch drag teach mode on while recording, and off afterwards
+        """
+        super().__init__(daemon=True, name="drag-teach")
+        if max_span >= capacity:
+            raise ValueError("max_span must be smaller than capacity")
+        self.robot = robot
+        self.motion = motion if motion is not None else apis.Motion()
+        self.capacity = capacity
+        self.tolerance = tolerance
+        self.angle_tolerance = np.radians(angle_tolerance)
+        self.max_span = max_span
+        self.period = period
+        self.teach_mode = teach_mode
+
+        # ring buffer: time [s], pose [mm][°], joints [°], and the rotation of each sample
+        self.times = np.zeros(capacity)
+        self.poses = np.zeros((capacity, 6))
+        self.joints = np.zeros((capacity, 6))
+        self.rotations = np.zeros((capacity, 3, 3))
+        self.count = 0  # samples taken, the newest is at (count - 1) % capacity
+        self.anchor = -1  # sample number of the last waypoint
+
+        self.waypoints = []  # (pose, joints) rows
+        self.stopped = False
+        self.error = None
+
+    def stop(self):
+        self.stopped = True
+
+    def run(self):
+        try:
+            if self.teach_mode:
+                self.robot.call(apis.Safety.teach_mode_switch(True))
+            while not self.stopped:
+                start = time.monotonic()
+                pose = self.robot.call(apis.Common.get_actual_tcp_pose())
+                joints = self.robot.call(apis.Common.get_actual_joint_pos())
+                self.add(start, pose, joints)
+                if self.period:
+                    remaining = self.period - (time.monotonic() - start)
+                    if remaining > 0:
+                        time.sleep(remaining)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finish()
+            if self.teach_mode:
+                try:
+                    self.robot.call(apis.Safety.teach_mode_switch(False))
+                except Exception as e:
+                    # do not replace the error that ended the recording
+                    log.error("drag teach mode not switched off: %r", e)
+                    if self.error is None:
+                        self.error = e
+
+    def add(self, timestamp, pose, joints):
+        """
+        Add one sample, e.g. from another sampling loop.
+        :param timestamp: [s]
+        :param pose: [x, y, z, rx, ry, rz] in [mm][°]
+        :param joints: [j1 ... j6] in [°]
+        """
+        n = self.count
+        slot = n % self.capacity
+        self.times[slot] = timestamp
+        self.poses[slot] = pose
+        self.joints[slot] = joints
+        self.rotations[slot] = rpy_to_matrix(self.poses[slot, 3:])
+        self.count = n + 1
+
+        if self.anchor < 0:
+            self.keep(n)
+        elif n - self.anchor > self.max_span and not self.moved(self.anchor, n):
+            # at rest at the last waypoint, which already holds this pose
+            self.anchor = n
+        elif n - self.anchor >= 2 and (n - self.anchor > self.max_span or self.deviates(self.anchor, n)):
+            self.keep(n - 1)
+
+    def moved(self, first, last) -> bool:
+        """
+        Whether a sample after first is off the pose of the last waypoint by more than the tolerances.
+        Compared with the waypoint rather than sample first, so a slow creep is not lost.
+        """
+        slots = np.arange(first + 1, last + 1) % self.capacity
+        pose = self.waypoints[-1][0]
+        offsets = self.poses[slots, :3] - pose[:3]
+        if (np.einsum('ij,ij->i', offsets, offsets) > self.tolerance ** 2).any():
+            return True
+        turns = _log_rotation(rpy_to_matrix(pose[3:]).T @ self.rotations[slots])
+        return bool((np.linalg.norm(turns, axis=1) > self.angle_tolerance).any())
+
+    def deviates(self, first, last) -> bool:
+        """
+        Whether a sample strictly between first and last is off the segment first -> last.
+        """
+        slots = np.arange(first, last + 1) % self.capacity
+        points = self.poses[slots, :3]
+        a, b = points[0], points[-1]
+        chord = b - a
+        length2 = chord @ chord
+        inner = points[1:-1]
+        if length2 > 1e-12:
+            s = np.clip((inner - a) @ chord / length2, 0.0, 1.0)
+        else:
+            s = np.zeros(len(inner))
+        offsets = inner - (a + s[:, None] * chord)
+        if (np.einsum('ij,ij->i', offsets, offsets) > self.tolerance ** 2).any():
+            return True
+
+        # orientation against the rotation interpolated over the sample index
+        rotations = self.rotations[slots]
+        r_a = rotations[0]
+        turn = _log_rotation(r_a.T @ rotations[-1])
+        fraction = np.arange(1, len(slots) - 1) / (len(slots) - 1)
+        expected = fraction[:, None] * turn
+        actual = _log_rotation(np.swapaxes(r_a, -1, -2) @ rotations[1:-1])
+        # for small deviations the difference of rotation vectors is the rotation between them
+        return bool((np.linalg.norm(actual - expected, axis=1) > self.angle_tolerance).any())
+
+    def keep(self, n):
+        slot = n % self.capacity
+        self.waypoints.append((self.poses[slot].copy(), self.joints[slot].copy()))
+        self.anchor = n
+
+    def finish(self):
+        """
+        Keep the last sample as the final waypoint.
+        """
+        if self.count and self.anchor != self.count - 1:
+            self.keep(self.count - 1)
+
+    def samples(self):
+        """
+        :return: (times, poses, joints) of the raw samples still in the ring, oldest first
+        """
+        first = max(0, self.count - self.capacity)
+        slots = np.arange(first, self.count) % self.capacity
+        return self.times[slots], self.poses[slots], self.joints[slots]
+
+    def program(self, blend_radius=5.0, vel=-1):
+        """
+        :param blend_radius: blend radius of the intermediate waypoints [mm]
+        :param vel: speed percentage, the speed of motion if negative
+        :return: list of Motion.move_line APIs replaying the demonstration,
+                 the last one stops at the final waypoint
+        """
+        program = []
+        for i, (pose, joints) in enumerate(self.waypoints):
+            blend = -1.0 if i == len(self.waypoints) - 1 else blend_radius
+            program.append(self.motion.move_line(pose, joint_pos=joints, vel=vel, blend_radius=blend))
+        return program
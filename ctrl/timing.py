@@ -0,0 +1,91 @@
+class PeriodEstimator:
+    """
+    Estimates the input packet period and derives a stable cmd_time for ServoCart / ServoJ.
+
+    The estimate is an exponential moving average. Samples further than outlier_gate mean
+    deviations away from the estimate are rejected; after max_rejects rejections in a row
+    the input rate is assumed to have changed and the estimate restarts from the new samples.
+    """
+
+    def __init__(self, default_period=8.0, alpha=0.1, outlier_gate=4.0, max_rejects=5,
+                 min_cmd_time=0.001, max_cmd_time=0.016):
+        """
+        :param default_period: period used until the first sample, in milliseconds
+        :param alpha: weight of a new sample in the moving average
+        :param outlier_gate: samples deviating more than this many mean deviations are rejected
+        :param max_rejects: consecutive rejections after which the estimate is restarted
+        :param min_cmd_time: lower bound of cmd_time, in seconds, see Motion.servo_cart
+        :param max_cmd_time: upper bound of cmd_time, in seconds
+        """
+        self.default_period = default_period
+        self.alpha = alpha
+        self.outlier_gate = outlier_gate
+        self.max_rejects = max_rejects
+        self.min_cmd_time = min_cmd_time
+        self.max_cmd_time = max_cmd_time
+
+        self.period = None
+        self.deviation = 0.0
+        self.rejects = 0
+
+    def reset(self):
+        self.period = None
+        self.deviation = 0.0
+        self.rejects = 0
+
+    def update(self, period):
+        """
+        Feed the measured time since the previous packet.
+        :param period: in milliseconds, non-positive values (first packet) are ignored
+        :return: the current estimate, in milliseconds
+        """
+        if period <= 0:
+            return self.get_period()
+        if self.period is None:
+            self.period = float(period)
+            self.deviation = self.period * 0.25
+            return self.period
+
+        error = period - self.period
+        # the deviation floor keeps a perfectly regular stream from rejecting every sample
+        gate = self.outlier_gate * max(self.deviation, self.period * 0.05)
+        if abs(error) > gate:
+            self.rejects += 1
+            if self.rejects < self.max_rejects:
+                return self.period
+            # the rate really changed, start over from here
+            self.period = float(period)
+            self.deviation = self.period * 0.25
+            self.rejects = 0
+            return self.period
+
+        self.rejects = 0
+        self.period += self.alpha * error
+        self.deviation += self.alpha * (abs(error) - self.deviation)
+        return self.period
+
+    def get_period(self):
+        """
+        :return: the current estimate in milliseconds, default_period before the first sample
+        """
+        return self.default_period if self.period is None else self.period
+
+    def cmd_time(self, rpc_latency=0.0):
+        """
+        The cmd_time for the next servo command.
+
+        Commands cannot reach the controller faster than one round trip of the blocking RPC,
+        so the interpolation period is the longer of the packet period and the measured RPC
+        latency: shorter and the interpolator runs dry between commands, longer and it lags.
+        :param rpc_latency: measured round trip of the servo RPC, in milliseconds
+        :return: cmd_time in seconds, clamped to [min_cmd_time, max_cmd_time]
+        """
+        period = self.get_period()
+        if rpc_latency > period:
+            period = rpc_latency
+        cmd_time = period / 1000.0
+        if cmd_time < self.min_cmd_time:
+            return self.min_cmd_time
+        if cmd_time > self.max_cmd_time:
+            return self.max_cmd_time
+        return cmd_time
@@ -0,0 +1,106 @@
+import os
+import threading
+import time
+
+
+class Watchdog(threading.Thread):
+    def __init__(self, on_expire, timeout=100, realtime=True, clock=None):
+        """
+        Deadman watchdog: calls on_expire once if it is not fed within timeout while armed.
+
+        The owner feeds it on every valid input with a single store of the time, so the hot path
+        takes no lock and cannot re-arm a disarmed watchdog: the deadline is timeout after the
+        later of the last feed and the last arm, and only counts while armed. The watchdog thread
+        sleeps until the current deadline and checks again; the stop is issued at most timeout
+        plus the sleep granularity after the last feed, independent of whether any further input
+        arrives.
+        :param on_expire: called from the watchdog thread when the deadline passes
+        :param timeout: in milliseconds
+        :param realtime: try to run the watchdog thread with SCHED_FIFO priority (Linux,
+                         needs CAP_SYS_NICE, silently ignored otherwise)
+        :param clock: provides monotonic_ns(), the time module if None. With any other clock,
+                      e.g. a ctrl.harness.VirtualClock, the thread is not used: the owner calls
+                      poll whenever its clock has moved on.
+        """
+        super().__init__(daemon=True, name="watchdog")
+        self.on_expire = on_expire
+        self.timeout_ns = int(timeout * 1000000)
+        self.realtime = realtime
+        self.clock = clock if clock is not None else time
+        self.threaded = self.clock is time
+        self.fed = 0  # monotonic_ns() of the last feed
+        self.armed_at = 0  # monotonic_ns() of the last arm, 0 while disarmed
+        self.generation = 0  # changed by every arm and disarm
+        self.lock = threading.Lock()  # arm, disarm and expiry only, never feed
+        self.fired = 0
+        self.armed = threading.Event()
+        self.stopped = False
+
+    def feed(self):
+        self.fed = self.clock.monotonic_ns()
+
+    @property
+    def deadline(self):
+        """
+        :return: monotonic_ns() of the expiry, 0 while disarmed
+        """
+        armed_at = self.armed_at
+        return max(self.fed, armed_at) + self.timeout_ns if armed_at else 0
+
+    def arm(self):
+        with self.lock:
+            self.generation += 1
+            self.armed_at = self.clock.monotonic_ns()
+            self.armed.set()
+
+    def disarm(self):
+        with self.lock:
+            self.generation += 1
+            self.armed_at = 0
+            self.armed.clear()
+
+    def stop(self):
+        self.stopped = True
+        self.disarm()
+        self.armed.set()
+
+    def expire(self, generation) -> bool:
+        """
+        Disarm and call on_expire if still armed as of generation and past the deadline.
+        """
+        with self.lock:
+            deadline = self.deadline
+            if generation != self.generation or not deadline or self.clock.monotonic_ns() < deadline:
+                return False
+            self.generation += 1
+            self.armed_at = 0
+            self.armed.clear()
+        self.fired += 1
+        self.on_expire()
+        return True
+
+    def poll(self) -> bool:
+        """
+        Check the deadline against the clock once, instead of the thread.
+        :return: whether it expired
+        """
+        return self.expire(self.generation)
+
+    def run(self):
+        if self.realtime and hasattr(os, "sched_setscheduler"):
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+            except OSError:
+                pass
+        while not self.stopped:
+            generation = self.generation
+            deadline = self.deadline
+            if deadline == 0:
+                self.armed.wait()
+                continue
+            remaining = deadline - self.clock.monotonic_ns()
+            if remaining > 0:
+                time.sleep(remaining / 1e9)
+                continue
+            # rechecked under the lock: fed, disarmed or re-armed meanwhile
+            self.expire(generation)
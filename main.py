@@ -1,8 +1,13 @@
 from ctrl.rosjoy import RosJoy
 from sdk.base import Robot
+from sdk.sampler import SamplingProfiler
 
 # Path: main.py
 if __name__ == "__main__":
     robot = Robot()
     rosjoy = RosJoy(robot)
+    # kill -USR2 <pid> or `echo profile 10 | nc -U /tmp/rosjoy-profiler-<pid>.sock` to profile
+    profiler = SamplingProfiler(robot)
+    profiler.install_signal()
+    profiler.install_socket()
     rosjoy.start()
@@ -1,4 +1,4 @@
-from sdk.util import RobotApiBuilder
+from sdk.util import RobotApiBuilder, to_rpc_list
 
 
 class Common:
@@ -81,10 +81,17 @@ class Common:
         :param value: 变量值
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.SetSysVarValue(var_id, value)
+            if ret == 0:
+                robot.sys_vars.update({var_id: value})
+            else:
+                robot.sys_vars.invalidate([var_id])
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.SetSysVarValue(var_id, value))
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -94,9 +101,74 @@ class Common:
         :param var_id: 变量编号，范围[1~20]
         :return: [var_value]
         """
+        def call(robot):
+            ret = robot.instance.GetSysVarValue(var_id)
+            if isinstance(ret, (tuple, list)) and ret[0] == 0:
+                robot.sys_vars.update({var_id: ret[1]})
+            return ret
+
         return (RobotApiBuilder()
-                .api_call(
-            lambda robot: robot.instance.GetSysVarValue(var_id))
+                .api_call(call)
+                .build())
+
+    @staticmethod
+    def get_sys_vars(var_ids):
+        """
+        批量获取系统变量值，一次往返（控制器不支持 multicall 时逐个读取），并刷新 robot.sys_vars 缓存
+        :param var_ids: 变量编号列表，范围[1~20]
+        :return: {var_id: var_value}
+        """
+        from sdk.sysvar import batch_call, _check_ids
+        var_ids = list(var_ids)
+        _check_ids(var_ids)
+
+        def call(robot):
+            values = {}
+            for var_id, ret in zip(var_ids, batch_call(robot, "GetSysVarValue", [(i,) for i in var_ids])):
+                if not isinstance(ret, (tuple, list)):
+                    return ret
+                if ret[0] != 0:
+                    return ret[0]
+                values[var_id] = ret[1]
+            robot.sys_vars.update(values)
+            return 0, values
+
+        return (RobotApiBuilder()
+                .api_call(call)
+                .build())
+
+    @staticmethod
+    def set_sys_vars(values, force=False):
+        """
+        批量设置系统变量，一次往返；与 robot.sys_vars 缓存中相同的值不再下发
+        :param values: {var_id: value}，变量编号范围[1~20]
+        :param force: 忽略缓存，全部下发（变量也被程序或PLC写入时）
+        :return: null
+        """
+        from sdk.sysvar import batch_call, _check_ids
+        values = dict(values)
+        _check_ids(values)
+
+        def call(robot):
+            pending = {var_id: value for var_id, value in values.items()
+                       if force or not robot.sys_vars.is_cached(var_id, value)}
+            if not pending:
+                return 0
+            results = batch_call(robot, "SetSysVarValue", list(pending.items()))
+            # cache what was written, up to the first failure
+            written = {}
+            for (var_id, value), ret in zip(pending.items(), results):
+                if ret != 0:
+                    robot.sys_vars.update(written)
+                    robot.sys_vars.invalidate(list(pending)[len(written):])
+                    return ret
+                written[var_id] = value
+            robot.sys_vars.update(written)
+            return 0
+
+        return (RobotApiBuilder()
+                .set_only_error_code()
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -112,6 +184,64 @@ class Common:
             lambda data: data == 1)
                 .build())
 
+    @staticmethod
+    def get_actual_tcp_pose(flag=1):
+        """
+        获取当前工具位姿
+        :param flag: 0-阻塞，1-非阻塞
+        :return: Pose [x, y, z, rx, ry, rz]，单位[mm][°]
+        """
+        from sdk.pose import Pose
+        return (RobotApiBuilder()
+                .api_call(
+            lambda robot: robot.instance.GetActualTCPPose(flag))
+                .post_data_process(
+            lambda data: Pose(data))
+                .build())
+
+    @staticmethod
+    def get_actual_joint_pos(flag=1):
+        """
+        获取关节当前位置(角度)
+        :param flag: 0-阻塞，1-非阻塞
+        :return: JointState [j1, j2, j3, j4, j5, j6]，单位[°]
+        """
+        from sdk.pose import JointState
+        return (RobotApiBuilder()
+                .api_call(
+            lambda robot: robot.instance.GetActualJointPosDegree(flag))
+                .post_data_process(
+            lambda data: JointState(data))
+                .build())
+
+    @staticmethod
+    def get_tool_coord():
+        """
+        获取当前工具坐标系
+        :return: Pose [x, y, z, rx, ry, rz]，工具中心点在末端法兰坐标系中的位姿，单位[mm][°]
+        """
+        from sdk.pose import Pose
+        return (RobotApiBuilder()
+                .api_call(
+            lambda robot: robot.instance.GetCurToolCoord())
+                .post_data_process(
+            lambda data: Pose(data))
+                .build())
+
+    @staticmethod
+    def get_wobj_coord():
+        """
+        获取当前工件坐标系
+        :return: Pose [x, y, z, rx, ry, rz]，工件坐标系在基坐标系中的位姿，单位[mm][°]
+        """
+        from sdk.pose import Pose
+        return (RobotApiBuilder()
+                .api_call(
+            lambda robot: robot.instance.GetCurWObjCoord())
+                .post_data_process(
+            lambda data: Pose(data))
+                .build())
+
 
 class Safety:
     """
@@ -128,10 +258,15 @@ class Safety:
         错误状态清除，只能清除可复位的错误
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.ResetAllError()
+            if ret == 0:
+                robot.state.error = 0
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.ResetAllError())
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -154,10 +289,16 @@ class Safety:
         """
         if mode not in [0, 1]:
             raise ValueError("Invalid mode")
+
+        def call(robot):
+            ret = robot.instance.Mode(mode)
+            if ret == 0:
+                robot.state.mode = mode
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.Mode(mode))
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -205,10 +346,16 @@ class Safety:
             state = 1
         else:
             state = 0
+
+        def call(robot):
+            ret = robot.instance.RobotEnable(state)
+            if ret == 0:
+                robot.state.enabled = state == 1
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.RobotEnable(state))
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -277,6 +424,43 @@ class Motion:
         self.acc = acc
         self.tool = tool
         self.user = user
+        self.kinematics = None
+        self.joint_seed = None
+        self.frames = None
+        self.frame_tool = 0
+
+    def set_kinematics(self, kinematics, joint_seed=None):
+        """
+        设置本地运动学，在本地补全 move_joint 的 desc_pos 与 move_line 的 joint_pos，
+        不再由 SDK 通过 RPC 调用控制器正/逆运动学。仅在工具号与工件号均为 0 时补全。
+        :param kinematics: sdk.kinematics.Kinematics
+        :param joint_seed: 当前关节位置，单位[°]，逆运动学从此处求解最近解；为 None 时不补全 joint_pos
+        :return: self
+        """
+        self.kinematics = kinematics
+        self.joint_seed = joint_seed
+        return self
+
+    def set_frames(self, frames, tool=0):
+        """
+        设置本地坐标系缓存 sdk.frames.FrameCache：move_joint/move_cart/move_line/move_circle/move_circle_descartes
+        的目标位姿在本地按其工具号与工件号换算到基坐标系，指令始终以工具号 tool、工件号 0 发送，
+        控制器不再切换坐标系。此时 offset_flag=1 的偏移量按基坐标系解释；move_spiral 不换算。
+        :param frames: sdk.frames.FrameCache，为 None 时取消
+        :param tool: 控制器固定使用的工具号，为 0 时可与 set_kinematics 的本地运动学一起使用
+        :return: self
+        """
+        self.frames = frames
+        self.frame_tool = tool
+        return self
+
+    def localize(self, desc_pos, tool, user):
+        """
+        :return: (desc_pos, tool, user)，设置了 frames 时为换算到基坐标系后的位姿与固定的工具号、工件号
+        """
+        if self.frames is None:
+            return desc_pos, tool, user
+        return self.frames.to_base(desc_pos, tool, user, self.frame_tool), self.frame_tool, 0
 
     def set_vel(self, vel):
         """
@@ -340,7 +524,9 @@ class Motion:
                 .set_acc(self.acc)
                 .set_vel(self.vel)
                 .set_tool(self.tool)
-                .set_user(self.user))
+                .set_user(self.user)
+                .set_kinematics(self.kinematics, self.joint_seed)
+                .set_frames(self.frames, self.frame_tool))
 
     def jog_move(self, ref, nb, direction, max_dis, vel=-1, acc=-1):
         """
@@ -383,6 +569,7 @@ class Motion:
 
         return (RobotApiBuilder()
                 .set_only_error_code()
+                .set_urgent()
                 .api_call(
             lambda robot: robot.instance.StopJOG(ref))
                 .build())
@@ -395,6 +582,7 @@ class Motion:
         """
         return (RobotApiBuilder()
                 .set_only_error_code()
+                .set_urgent()
                 .api_call(
             lambda robot: robot.instance.ImmStopJOG())
                 .build())
@@ -405,10 +593,15 @@ class Motion:
         伺服运动开始
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.ServoMoveStart()
+            if ret == 0:
+                robot.state.servoing = True
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.ServoMoveStart())
+                .api_call(call)
                 .build())
 
     @staticmethod
@@ -426,7 +619,7 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.ServoJ(joint_pos, acc, vel, cmd_time, filter_time, gain))
+            lambda robot: robot.instance.ServoJ(to_rpc_list(joint_pos), acc, vel, cmd_time, filter_time, gain))
                 .build())
 
     @staticmethod
@@ -448,7 +641,8 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.ServoCart(mode, desc_pos, pos_gain, acc, vel, cmd_time, filter_time, gain))
+            lambda robot: robot.instance.ServoCart(mode, to_rpc_list(desc_pos), pos_gain, acc, vel, cmd_time,
+                                                   filter_time, gain))
                 .build())
 
     @staticmethod
@@ -457,10 +651,16 @@ class Motion:
         伺服运动结束
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.ServoMoveEnd()
+            if ret == 0:
+                robot.state.servoing = False
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.ServoMoveEnd())
+                .set_urgent()
+                .api_call(call)
                 .build())
 
     def move_joint(self, joint_pos, tool=-1, user=-1, desc_pos=None, vel=-1, acc=-1, ovl=100.0,
@@ -479,6 +679,19 @@ class Motion:
         :param offset_flag: [0] - 不偏移，[1] - 工件 / 基坐标系下偏移，[2] - 工具坐标系下偏移 默认 0;
         :param offset_pos: 位姿
         """
+        if tool < 0:
+            tool = self.tool
+        if user < 0:
+            user = self.user
+        if desc_pos is not None:
+            desc_pos, tool, user = self.localize(desc_pos, tool, user)
+        elif self.frames is not None:
+            tool, user = self.frame_tool, 0
+
+        if desc_pos is None and self.kinematics is not None and tool == 0 and user == 0:
+            desc_pos = self.kinematics.forward(joint_pos)
+            self.joint_seed = joint_pos
+
         if offset_pos is None:
             offset_pos = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         if exaxis_pos is None:
@@ -486,10 +699,6 @@ class Motion:
         if desc_pos is None:
             desc_pos = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
 
-        if tool < 0:
-            tool = self.tool
-        if user < 0:
-            user = self.user
         if vel < 0:
             vel = self.vel
         if acc < 0:
@@ -498,9 +707,9 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.MoveJ(joint_pos, tool, user,
-                                               desc_pos, vel, acc, ovl, exaxis_pos, blend_time, offset_flag,
-                                               offset_pos))
+            lambda robot: robot.instance.MoveJ(to_rpc_list(joint_pos), tool, user,
+                                               to_rpc_list(desc_pos), vel, acc, ovl, exaxis_pos, blend_time,
+                                               offset_flag, offset_pos))
                 .build())
 
     def move_cart(self, desc_pos, tool=-1, user=-1, vel=-1, acc=0.0, ovl=100.0, blend_time=-1.0, config=-1):
@@ -519,6 +728,7 @@ class Motion:
             tool = self.tool
         if user < 0:
             user = self.user
+        desc_pos, tool, user = self.localize(desc_pos, tool, user)
         if vel < 0:
             vel = self.vel
         if acc < 0:
@@ -527,7 +737,7 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.MoveCart(desc_pos, tool, user, vel, acc, ovl, blend_time, config))
+            lambda robot: robot.instance.MoveCart(to_rpc_list(desc_pos), tool, user, vel, acc, ovl, blend_time, config))
                 .build())
 
     def move_line(self, desc_pos, tool=-1, user=-1, joint_pos=None, vel=-1, acc=0.0, ovl=100.0, blend_radius=-1.0,
@@ -548,6 +758,18 @@ class Motion:
         :param offset_pos: 位姿偏移量，单位 [mm][°] 默认[0.0,0.0,0.0,0.0,0.0,0.0]
         :return: null
         """
+        if tool < 0:
+            tool = self.tool
+        if user < 0:
+            user = self.user
+        desc_pos, tool, user = self.localize(desc_pos, tool, user)
+
+        if (joint_pos is None and self.kinematics is not None and self.joint_seed is not None
+                and tool == 0 and user == 0):
+            solution, ok = self.kinematics.inverse(desc_pos, seed=self.joint_seed)
+            if ok:
+                joint_pos = self.joint_seed = solution
+
         if offset_pos is None:
             offset_pos = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
         if exaxis_pos is None:
@@ -555,10 +777,6 @@ class Motion:
         if joint_pos is None:
             joint_pos = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
 
-        if tool < 0:
-            tool = self.tool
-        if user < 0:
-            user = self.user
         if vel < 0:
             vel = self.vel
         if acc < 0:
@@ -567,8 +785,8 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.MoveL(desc_pos, tool, user,
-                                               joint_pos, vel, acc, ovl, blend_radius, exaxis_pos, search,
+            lambda robot: robot.instance.MoveL(to_rpc_list(desc_pos), tool, user,
+                                               to_rpc_list(joint_pos), vel, acc, ovl, blend_radius, exaxis_pos, search,
                                                offset_flag, offset_pos))
                 .build())
 
@@ -609,6 +827,8 @@ class Motion:
             exaxis_pos_t = [0.0, 0.0, 0.0, 0.0]
         if exaxis_pos_p is None:
             exaxis_pos_p = [0.0, 0.0, 0.0, 0.0]
+        desc_pos_p, tool_p, user_p = self.localize(desc_pos_p, tool_p, user_p)
+        desc_pos_t, tool_t, user_t = self.localize(desc_pos_t, tool_t, user_t)
 
         if vel_p < 0:
             vel_p = self.vel
@@ -622,8 +842,10 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.MoveC(desc_pos_p, tool_p, user_p, desc_pos_t, tool_t, user_t,
-                                               joint_pos_p, joint_pos_t, vel_p, acc_p, exaxis_pos_p, offset_flag_p,
+            lambda robot: robot.instance.MoveC(to_rpc_list(desc_pos_p), tool_p, user_p,
+                                               to_rpc_list(desc_pos_t), tool_t, user_t,
+                                               to_rpc_list(joint_pos_p), to_rpc_list(joint_pos_t),
+                                               vel_p, acc_p, exaxis_pos_p, offset_flag_p,
                                                vel_t, acc_t, exaxis_pos_t, offset_flag_t, offset_pos_t, ovl,
                                                blend_radius))
                 .build())
@@ -671,6 +893,8 @@ class Motion:
             tool_t = tool_p
         if user_t < 0:
             user_t = user_p
+        desc_pos_p, tool_p, user_p = self.localize(desc_pos_p, tool_p, user_p)
+        desc_pos_t, tool_t, user_t = self.localize(desc_pos_t, tool_t, user_t)
         if vel_p < 0:
             vel_p = self.vel
         if acc_p < 0:
@@ -683,8 +907,10 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.Circle(desc_pos_p, tool_p, user_p, desc_pos_t, tool_t, user_t,
-                                                joint_pos_p, joint_pos_t, vel_p, acc_p, exaxis_pos_p,
+            lambda robot: robot.instance.Circle(to_rpc_list(desc_pos_p), tool_p, user_p,
+                                                to_rpc_list(desc_pos_t), tool_t, user_t,
+                                                to_rpc_list(joint_pos_p), to_rpc_list(joint_pos_t),
+                                                vel_p, acc_p, exaxis_pos_p,
                                                 vel_t, acc_t, exaxis_pos_t, ovl, offset_flag, offset_pos))
                 .build())
 
@@ -724,8 +950,9 @@ class Motion:
         return (RobotApiBuilder()
                 .set_only_error_code()
                 .api_call(
-            lambda robot: robot.instance.NewSpiral(desc_pos, tool, user, param,
-                                                   joint_pos, vel, acc, exaxis_pos, ovl, offset_flag, offset_pos))
+            lambda robot: robot.instance.NewSpiral(to_rpc_list(desc_pos), tool, user, param,
+                                                   to_rpc_list(joint_pos), vel, acc, exaxis_pos, ovl, offset_flag,
+                                                   offset_pos))
                 .build())
 
     @staticmethod
@@ -736,6 +963,7 @@ class Motion:
         """
         return (RobotApiBuilder()
                 .set_only_error_code()
+                .set_urgent()
                 .api_call(
             lambda robot: robot.instance.StopMotion())
                 .build())
@@ -791,10 +1019,15 @@ class Gripper:
         激活夹爪
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.ActGripper(self.index, 1)
+            if ret == 0:
+                robot.state.gripper_active = True
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.ActGripper(self.index, 1))
+                .api_call(call)
                 .build())
 
     def reset(self):
@@ -802,10 +1035,15 @@ class Gripper:
         复位夹爪
         :return: null
         """
+        def call(robot):
+            ret = robot.instance.ActGripper(self.index, 0)
+            if ret == 0:
+                robot.state.gripper_active = False
+            return ret
+
         return (RobotApiBuilder()
                 .set_only_error_code()
-                .api_call(
-            lambda robot: robot.instance.ActGripper(self.index, 0))
+                .api_call(call)
                 .build())
 
     def deactivate(self):
@@ -874,10 +1112,14 @@ class Gripper:
         :param desc_pos: 夹抓取点笛卡尔位姿
         :param z_length: z轴偏移量
         :param z_angle: 绕z轴旋转偏移量
+        :return: Pose
         """
+        from sdk.pose import Pose
         return (RobotApiBuilder()
                 .api_call(
-            lambda robot: robot.instance.ComputePrePick(desc_pos, z_length, z_angle))
+            lambda robot: robot.instance.ComputePrePick(to_rpc_list(desc_pos), z_length, z_angle))
+                .post_data_process(
+            lambda data: Pose(data))
                 .build())
 
     @staticmethod
@@ -888,8 +1130,12 @@ class Gripper:
         :param desc_pos: 夹抓取点笛卡尔位姿
         :param z_length: z轴偏移量
         :param z_angle: 绕z轴旋转偏移量
+        :return: Pose
         """
+        from sdk.pose import Pose
         return (RobotApiBuilder()
                 .api_call(
-            lambda robot: robot.instance.ComputePostPick(desc_pos, z_length, z_angle))
+            lambda robot: robot.instance.ComputePostPick(to_rpc_list(desc_pos), z_length, z_angle))
+                .post_data_process(
+            lambda data: Pose(data))
                 .build())
@@ -1,6 +1,13 @@
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Any
 
-from fairino import Robot as FrRobot
+from sdk import errors
+from sdk.policy import CallPolicy, CircuitBreaker, DEFAULT_POLICIES, TIMEOUT_ERRORS, TRANSPORT_ERRORS
+from sdk.state import ControllerState
+from sdk.sysvar import SysVarCache
+from sdk.trace import tracer, RpcStats
 
 
 # SDK: https://fr-documentation.readthedocs.io/zh-cn/latest/SDKManual/python_intro.html
@@ -8,19 +15,174 @@ from fairino import Robot as FrRobot
 
 
 class Robot:
-    def __init__(self, ip="192.168.58.2"):
-        self.instance = FrRobot.RPC(ip)
+    def __init__(self, ip="192.168.58.2", policies=None, breaker: CircuitBreaker = None, instance=None,
+                 urgent_instance=None):
+        """
+        :param ip: controller address
+        :param policies: call policies by API class or name, merged over DEFAULT_POLICIES
+        :param breaker: circuit breaker shared by all calls, a default one if None
+        :param instance: the SDK object the APIs call, e.g. a sdk.sim.SimRobot;
+                         a fairino RPC connection to ip if None
+        :param urgent_instance: the SDK object urgent APIs (stops, servo end) call from their own worker,
+                                so they never queue behind a hung call; a second XML-RPC connection to
+                                ip if instance is None, instance otherwise
+        """
+        self.ip = ip
+        self.own_urgent = False
+        if instance is None:
+            from fairino import Robot as FrRobot
+            instance = FrRobot.RPC(ip)
+            self.own_urgent = urgent_instance is None
+        self.instance = instance
+        self.urgent_instance = urgent_instance if urgent_instance is not None or self.own_urgent else instance
+        self.stats = RpcStats()
+        self.policies = dict(DEFAULT_POLICIES)
+        if policies is not None:
+            self.policies.update(policies)
+        self.resolved_policies = {}
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        # one worker: calls from several threads are serialized like on the wire,
+        # and a timed out call does not block the caller
+        self.executor = None
+        self.urgent_executor = None
+        self.sys_vars = SysVarCache(self)
+        self.multicall = True  # cleared when the controller rejects system.multicall
+        self.state = ControllerState()
+
+    def set_policy(self, key, policy: CallPolicy):
+        """
+        Set the call policy of an API class or of a single API.
+        :param key: API class name, e.g. "Gripper", or API name, e.g. "Gripper.move"
+        :param policy: the policy
+        """
+        self.policies[key] = policy
+        self.resolved_policies.clear()
+
+    def get_policy(self, name) -> CallPolicy:
+        policy = self.resolved_policies.get(name)
+        if policy is None:
+            policy = self.policies.get(name)
+            if policy is None:
+                policy = self.policies.get(name.split(".")[0], self.policies[None])
+            self.resolved_policies[name] = policy
+        return policy
 
     def call(self, api):
-        return api.invoke(self)
+        start = time.monotonic_ns()
+        try:
+            return api.invoke(self)
+        except RobotException:
+            # the controller may have changed state on its own, e.g. disabled on an error
+            self.state.invalidate()
+            raise
+        finally:
+            end = time.monotonic_ns()
+            self.stats.record(api.name, end - start)
+            tracer.span(api.name, start, end)
+
+    def dispatch(self, api):
+        """
+        Run the raw RPC of an API under its call policy and the circuit breaker.
+        :param api: the RobotApi being invoked
+        :return: the raw return value of the RPC
+        """
+        policy = self.get_policy(api.name)
+        retries = 0 if api.only_error_code else policy.retries
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenException(self, api.name)
+            try:
+                ret = self.execute(api, policy.timeout)
+                if errors.is_communication_error(ret[0] if isinstance(ret, (tuple, list)) else ret):
+                    # the SDK reports some link failures as return codes instead of raising
+                    self.breaker.on_failure()
+                    return ret
+            except TRANSPORT_ERRORS as e:
+                self.breaker.on_failure()
+                if isinstance(e, TIMEOUT_ERRORS):
+                    # not retried: a retry would queue behind the hung call on the same worker
+                    raise RobotTimeoutException(self, api.name, policy.timeout) from e
+                if attempt >= retries:
+                    raise RobotConnectionException(self, api.name, e) from e
+                time.sleep(policy.delay(attempt))
+                attempt += 1
+                continue
+            except BaseException:
+                # e.g. a Fault: a trial call proved nothing, let the next one try
+                self.breaker.on_abort()
+                raise
+            if self.breaker.on_success():
+                # the controller was unreachable for a while, a program or the PLC may have written them
+                self.sys_vars.invalidate()
+            return ret
+
+    def execute(self, api, timeout):
+        if api.urgent:
+            return self.execute_urgent(api, timeout)
+        if timeout is None:
+            return api.__call_api__(self)
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="robot-rpc")
+        future = self.executor.submit(api.__call_api__, self)
+        try:
+            return future.result(timeout)
+        except TIMEOUT_ERRORS:
+            # still queued behind a hung call: it must never go out late
+            future.cancel()
+            raise
+
+    def execute_urgent(self, api, timeout):
+        """
+        Run an urgent API on its own worker and connection, next to whatever the RPC worker is
+        stuck in. A worker that times out is abandoned together with its connection, so the
+        next urgent call is not queued behind it either.
+        """
+        if self.urgent_instance is None:
+            self.urgent_instance = xmlrpc.client.ServerProxy(f"http://{self.ip}:20003/RPC2")
+        if timeout is None:
+            return api.__call_api__(UrgentConnection(self))
+        if self.urgent_executor is None:
+            self.urgent_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="robot-rpc-urgent")
+        executor = self.urgent_executor
+        future = executor.submit(api.__call_api__, UrgentConnection(self))
+        try:
+            return future.result(timeout)
+        except TIMEOUT_ERRORS:
+            future.cancel()
+            self.urgent_executor = None
+            executor.shutdown(wait=False)
+            if self.own_urgent:
+                self.urgent_instance = None
+            raise
+
+
+class UrgentConnection:
+    """
+    The robot as seen by an urgent API: its calls go to the urgent instance.
+    """
+
+    def __init__(self, robot: Robot):
+        self.robot = robot
+        self.instance = robot.urgent_instance
+
+    def __getattr__(self, name):
+        return getattr(self.robot, name)
 
 
 class RobotException(Exception):
-    def __init__(self, robot: Robot, code: int, revocable=True):
-        super().__init__(f"Robot error: {code}")
+    def __init__(self, robot: Robot, code: int, revocable=None, info: errors.ErrorInfo = None):
+        """
+        :param robot: the robot raising the error
+        :param code: the controller return code
+        :param revocable: whether revoke may clear it, taken from the error table if None
+        :param info: the decoded error, looked up from code if None
+        """
+        self.info = info if info is not None else errors.lookup(code)
+        super().__init__(f"Robot error: {code} {self.info.name} ({self.info.description})")
         self.robot = robot
         self.code = code
-        self.revocable = revocable
+        self.revocable = self.info.recoverable if revocable is None else revocable
 
     def get_robot(self):
         return self.robot
@@ -28,15 +190,46 @@ class RobotException(Exception):
     def get_code(self):
         return self.code
 
+    def get_info(self) -> errors.ErrorInfo:
+        return self.info
+
     def revoke(self):
-        # Actually this is not a good idea to revoke an error,
-        # since the api will revoke all the errors.
-        if self.revocable:
-            ref = self.robot.instance.ResetAllError()
-            if ref != 0 and ref is not None:
-                raise RobotException(self.robot, ref)
-        else:
+        """
+        Run the minimal recovery of the error, see the ACTION_ constants of sdk.errors.
+        Only errors that put the controller into an error state get a ResetAllError,
+        which clears all errors and not just this one.
+        """
+        if not self.revocable:
             raise RuntimeError("This error is not revocable")
+        from sdk import apis
+        action = self.info.action
+        if action == errors.ACTION_RESET:
+            self.robot.call(apis.Safety.clear_error())
+        elif action == errors.ACTION_STOP:
+            self.robot.call(apis.Motion.stop_motion())
+
+
+class RobotTimeoutException(RobotException):
+    def __init__(self, robot: Robot, api_name, timeout):
+        super().__init__(robot, None, revocable=False, info=errors.NO_RESPONSE)
+        self.args = (f"Robot call {api_name} timed out after {timeout}s",)
+        self.api_name = api_name
+        self.timeout = timeout
+
+
+class RobotConnectionException(RobotException):
+    def __init__(self, robot: Robot, api_name, error):
+        super().__init__(robot, -3, revocable=False)
+        self.args = (f"Robot call {api_name} failed: {error!r}",)
+        self.api_name = api_name
+        self.error = error
+
+
+class CircuitOpenException(RobotException):
+    def __init__(self, robot: Robot, api_name):
+        super().__init__(robot, None, revocable=False, info=errors.NO_RESPONSE)
+        self.args = (f"Robot unreachable, {api_name} rejected",)
+        self.api_name = api_name
 
 
 class RobotApi:
@@ -48,7 +241,9 @@ class RobotApi:
     """
 
     def __init__(self):
+        self.name = type(self).__name__
         self.only_error_code = False
+        self.urgent = False  # run on the urgent worker and connection, see Robot.execute_urgent
         self.has_invoked = False
         self.data = None
 
@@ -81,14 +276,17 @@ class RobotApi:
             raise RuntimeError("This API has been invoked")
         self.has_invoked = True
 
-        ret = self.__call_api__(robot)
+        ret = robot.dispatch(self)
         if self.only_error_code:
             if ret != 0:
                 raise RobotException(robot, ret)
             self.data = self.__post_data_process__(None)
         else:
+            if not isinstance(ret, (tuple, list)):
+                # the SDK returns the bare code when a query fails
+                raise RobotException(robot, ret)
             ret, data = ret
             if ret != 0:
                 raise RobotException(robot, ret)
             self.data = self.__post_data_process__(data)
-            return data
+            return self.data
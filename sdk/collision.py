@@ -0,0 +1,326 @@
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import numpy as np
+
+from sdk.kinematics import Kinematics
+
+# 位置单位毫米(mm)，基坐标系；关节单位度(°)
+
+GRID_MAGIC = b"OGRD"
+GRID_HEADER = struct.Struct("<4s3dd3I")
+"""
+Occupancy grid file: magic, origin [x, y, z] of voxel (0, 0, 0) [mm], voxel size [mm],
+shape (nx, ny, nz), followed by nx * ny * nz uint8 voxels in C order, non-zero is occupied.
+"""
+
+
+class OccupancyGrid:
+    def __init__(self, voxels, origin, resolution):
+        """
+        :param voxels: (nx, ny, nz) uint8 array, non-zero is occupied, may be a np.memmap
+        :param origin: [x, y, z] of the corner of voxel (0, 0, 0) [mm]
+        :param resolution: voxel edge length [mm]
+        """
+        self.voxels = voxels
+        self.origin = np.asarray(origin, dtype=float).reshape(3)
+        self.resolution = float(resolution)
+        self.shape = np.array(voxels.shape)
+        self.path = None  # the file the grid is mapped from, see load
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a grid file into memory. Voxels are paged in on access,
+        and processes mapping the same file share the pages.
+        """
+        with open(path, "rb") as f:
+            magic, x, y, z, resolution, nx, ny, nz = GRID_HEADER.unpack(f.read(GRID_HEADER.size))
+        if magic != GRID_MAGIC:
+            raise ValueError(f"{path} is not an occupancy grid file")
+        voxels = np.memmap(path, dtype=np.uint8, mode="r", offset=GRID_HEADER.size, shape=(nx, ny, nz))
+        grid = cls(voxels, [x, y, z], resolution)
+        grid.path = path
+        return grid
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(GRID_HEADER.pack(GRID_MAGIC, *self.origin.tolist(), self.resolution, *self.voxels.shape))
+            f.write(np.ascontiguousarray(self.voxels, dtype=np.uint8).tobytes())
+
+    @classmethod
+    def empty(cls, lower, upper, resolution):
+        """
+        :param lower: [x, y, z] minimum corner [mm]
+        :param upper: [x, y, z] maximum corner [mm]
+        :param resolution: voxel edge length [mm]
+        """
+        lower = np.asarray(lower, dtype=float)
+        shape = np.ceil((np.asarray(upper, dtype=float) - lower) / resolution).astype(int)
+        return cls(np.zeros(tuple(shape), dtype=np.uint8), lower, resolution)
+
+    def fill_box(self, lower, upper):
+        """
+        Mark every voxel overlapping the box as occupied.
+        """
+        start = np.clip(np.floor((np.asarray(lower, float) - self.origin) / self.resolution).astype(int), 0, self.shape)
+        stop = np.clip(np.ceil((np.asarray(upper, float) - self.origin) / self.resolution).astype(int), 0, self.shape)
+        self.voxels[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]] = 1
+
+    def dilate(self, radius) -> np.ndarray:
+        """
+        :param radius: [mm]
+        :return: bool voxels occupied or within radius of an occupied voxel. The neighbourhood
+                 is a cube, so it errs on the safe side by up to sqrt(3) * radius in the corners.
+        """
+        grown = self.voxels != 0
+        cells = int(np.ceil(radius / self.resolution))
+        for axis in range(3):
+            source = grown
+            grown = source.copy()
+            for shift in range(1, min(cells, grown.shape[axis] - 1) + 1):
+                head = [slice(None)] * 3
+                tail = [slice(None)] * 3
+                head[axis], tail[axis] = slice(shift, None), slice(None, -shift)
+                grown[tuple(head)] |= source[tuple(tail)]
+                grown[tuple(tail)] |= source[tuple(head)]
+        return grown
+
+    def dilated(self, radius) -> np.ndarray:
+        """
+        dilate, cached next to the grid file if the grid was loaded from one: the dilated grid is
+        written once as a grid file of its own and mapped, so all processes share its pages
+        instead of each holding a copy. The cache is rebuilt when the grid file is newer.
+        :param radius: [mm]
+        :return: bool voxels, see dilate
+        """
+        if self.path is None:
+            return self.dilate(radius)
+        cells = int(np.ceil(radius / self.resolution))
+        path = f"{self.path}.dilated-{cells}"
+        try:
+            if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(self.path):
+                grown = OccupancyGrid(self.dilate(radius).view(np.uint8), self.origin, self.resolution)
+                # written under a private name and renamed, so no process maps a partial file
+                partial = f"{path}.{os.getpid()}"
+                grown.save(partial)
+                os.replace(partial, path)
+            return OccupancyGrid.load(path).voxels.view(bool)
+        except OSError:
+            # e.g. a read-only directory
+            return self.dilate(radius)
+
+
+class Capsule:
+    def __init__(self, start, end, radius, offset=None):
+        """
+        A link as a segment between two frames of Kinematics.frames, swept by a sphere.
+        :param start: frame index of the first end point, 0 is the base, 6 the flange
+        :param end: frame index of the second end point
+        :param radius: [mm]
+        :param offset: [x, y, z] of the second end point in frame end [mm], the frame origin if None,
+                       e.g. [0, 0, tool_length] for a tool on the flange
+        """
+        self.start = start
+        self.end = end
+        self.radius = float(radius)
+        self.offset = None if offset is None else np.asarray(offset, dtype=float).reshape(3)
+
+
+def default_capsules(tool_length=0.0, tool_radius=40.0):
+    """
+    A coarse capsule model of the Fairino arms, one capsule per link between joint frames.
+    The base link (frames 0 - 1) is left out: it turns in place on its mount, which is usually
+    part of the grid.
+    :param tool_length: length of the tool along the flange z axis [mm], 0 for none
+    :param tool_radius: [mm]
+    """
+    capsules = [
+        Capsule(1, 2, 65.0),
+        Capsule(2, 3, 55.0),
+        Capsule(3, 4, 50.0),
+        Capsule(4, 5, 50.0),
+        Capsule(5, 6, 50.0),
+    ]
+    if tool_length > 0:
+        capsules.append(Capsule(6, 6, tool_radius, offset=[0.0, 0.0, tool_length]))
+    return capsules
+
+
+class CollisionChecker:
+    """
+    Checks joint trajectories of the arm against an occupancy grid.
+
+    Every capsule is sampled along its axis at the grid resolution, and the samples are looked
+    up in the grid dilated by the capsule radius, precomputed once per radius (see
+    OccupancyGrid.dilated). A trajectory is checked in vectorized passes over chunks of samples,
+    which bounds the memory of the lookup. Only the environment is checked, not the arm against itself.
+    Samples outside the grid count as free.
+    """
+
+    def __init__(self, grid: OccupancyGrid, kinematics: Kinematics = None, capsules=None, chunk=1024):
+        """
+        :param grid: the environment
+        :param kinematics: the arm, Kinematics("FR5") if None
+        :param capsules: list of Capsule, default_capsules() if None
+        :param chunk: trajectory samples checked per pass
+        """
+        self.grid = grid
+        self.kinematics = kinematics if kinematics is not None else Kinematics()
+        self.capsules = capsules if capsules is not None else default_capsules()
+        self.starts = np.array([c.start for c in self.capsules])
+        self.ends = np.array([c.end for c in self.capsules])
+        self.offsets = np.array([c.offset if c.offset is not None else np.zeros(3) for c in self.capsules])
+        # capsules sharing a radius share a dilated grid
+        self.groups = {}
+        for i, capsule in enumerate(self.capsules):
+            self.groups.setdefault(capsule.radius, []).append(i)
+        self.dilated = {radius: grid.dilated(radius) for radius in self.groups}
+        self.chunk = chunk
+
+    def segments(self, joints):
+        """
+        :param joints: (N, 6) in [°]
+        :return: (N, C, 2, 3) capsule end points
+        """
+        frames = self.kinematics.frames(joints)
+        a = frames[:, self.starts][..., :3, 3]
+        end_frames = frames[:, self.ends]
+        b = end_frames[..., :3, 3] + np.einsum('ncij,cj->nci', end_frames[..., :3, :3], self.offsets)
+        return np.stack([a, b], axis=2)
+
+    def collisions(self, joints) -> np.ndarray:
+        """
+        :param joints: (N, 6) or (6,) in [°]
+        :return: (N,) bool, whether the arm collides at each sample
+        """
+        joints = np.asarray(joints, dtype=float).reshape(-1, 6)
+        hit = np.zeros(len(joints), dtype=bool)
+        for begin in range(0, len(joints), self.chunk):
+            hit[begin:begin + self.chunk] = self.check(joints[begin:begin + self.chunk])
+        return hit
+
+    def check(self, joints) -> np.ndarray:
+        """
+        collisions of one chunk, in one pass.
+        :param joints: (N, 6) in [°]
+        :return: (N,) bool
+        """
+        segments = self.segments(joints)
+        grid = self.grid
+        hit = np.zeros(len(joints), dtype=bool)
+        for radius, members in self.groups.items():
+            a = segments[:, members, 0]
+            b = segments[:, members, 1]
+            length = np.linalg.norm(b - a, axis=-1).max(initial=0.0)
+            count = max(2, int(np.ceil(length / grid.resolution)) + 1)
+            t = np.linspace(0.0, 1.0, count)[:, None]
+            # (N, capsules, samples, 3)
+            points = a[:, :, None, :] + (b - a)[:, :, None, :] * t
+            index = np.floor((points - grid.origin) / grid.resolution).astype(np.intp)
+            inside = np.all((index >= 0) & (index < grid.shape), axis=-1)
+            np.clip(index, 0, grid.shape - 1, out=index)
+            occupied = self.dilated[radius][index[..., 0], index[..., 1], index[..., 2]] & inside
+            hit |= occupied.reshape(len(joints), -1).any(axis=1)
+        return hit
+
+    def first_collision(self, joints) -> int:
+        """
+        :param joints: (N, 6) in [°], a trajectory
+        :return: index of the first colliding sample, -1 if the trajectory is free
+        """
+        joints = np.asarray(joints, dtype=float).reshape(-1, 6)
+        # chunk by chunk, the rest is not checked after a collision
+        for begin in range(0, len(joints), self.chunk):
+            hit = self.check(joints[begin:begin + self.chunk])
+            if hit.any():
+                return begin + int(np.argmax(hit))
+        return -1
+
+    def first_invalid_pose(self, desc_pos, seed) -> int:
+        """
+        Check a cartesian trajectory (e.g. servo_cart targets, tool 0 / user 0).
+        :param desc_pos: (N, 6) in [mm][°]
+        :param seed: joint position at the start of the trajectory [°]
+        :return: index of the first sample that collides or has no inverse kinematics solution,
+                 -1 if the trajectory is free
+        """
+        desc_pos = np.asarray(desc_pos, dtype=float).reshape(-1, 6)
+        joints = np.empty((len(desc_pos), 6))
+        # chunks seeded with the end of the previous one, so the solution follows the path
+        chunk = 64
+        for begin in range(0, len(desc_pos), chunk):
+            result, ok = self.kinematics.inverse(desc_pos[begin:begin + chunk], seed=seed)
+            if not ok.all():
+                bad = begin + int(np.argmin(ok))
+                hit = self.first_collision(np.concatenate([joints[:begin], result[:bad - begin]]))
+                return hit if hit >= 0 else bad
+            joints[begin:begin + chunk] = result
+            seed = result[-1]
+        return self.first_collision(joints)
+
+
+class CollisionException(Exception):
+    def __init__(self, index):
+        super().__init__(f"trajectory collides at sample {index}")
+        self.index = index
+
+
+_worker_checker = None
+
+
+def _init_worker(grid_path, model, capsules):
+    global _worker_checker
+    _worker_checker = CollisionChecker(OccupancyGrid.load(grid_path), Kinematics(model), capsules)
+
+
+def _worker_first_collision(joints):
+    return _worker_checker.first_collision(joints)
+
+
+def _worker_first_invalid_pose(desc_pos, seed):
+    return _worker_checker.first_invalid_pose(desc_pos, seed)
+
+
+class AsyncCollisionChecker:
+    """
+    CollisionChecker in worker processes, so checking a long trajectory does not hold the GIL
+    of the servo loop. Each worker maps the grid file itself, only the trajectories are pickled.
+    """
+
+    def __init__(self, grid_path, model="FR5", capsules=None, workers=1):
+        """
+        :param grid_path: occupancy grid file, see OccupancyGrid.load
+        :param model: arm model accepted by Kinematics
+        :param capsules: list of Capsule, default_capsules() if None
+        :param workers: number of worker processes
+        """
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(grid_path, model, capsules))
+
+    def submit(self, joints) -> Future:
+        """
+        :param joints: (N, 6) in [°]
+        :return: future of CollisionChecker.first_collision
+        """
+        return self.executor.submit(_worker_first_collision, np.asarray(joints, dtype=float))
+
+    def submit_poses(self, desc_pos, seed) -> Future:
+        """
+        :return: future of CollisionChecker.first_invalid_pose
+        """
+        return self.executor.submit(_worker_first_invalid_pose, np.asarray(desc_pos, dtype=float),
+                                    np.asarray(seed, dtype=float))
+
+    def validate(self, joints, timeout=None):
+        """
+        Block until the trajectory is checked, call before sending any of it.
+        :raise CollisionException: if a sample collides
+        """
+        index = self.submit(joints).result(timeout)
+        if index >= 0:
+            raise CollisionException(index)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,120 @@
+# 错误码: https://fr-documentation.readthedocs.io/zh-cn/latest/SDKManual/python_intro.html
+
+COMMUNICATION = "communication"
+PARAMETER = "parameter"
+KINEMATICS = "kinematics"
+MOTION = "motion"
+STATE = "state"
+FILE = "file"
+GRIPPER = "gripper"
+CONTROLLER = "controller"
+UNKNOWN = "unknown"
+
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+FATAL = "fatal"
+
+ACTION_NONE = "none"
+"""
+The command was rejected, the controller is not in an error state. Nothing to reset.
+"""
+ACTION_RECONNECT = "reconnect"
+"""
+The controller was not reached. Nothing to reset, retry once the link is back.
+"""
+ACTION_STOP = "stop"
+"""
+Another motion or program is running. Stop it (StopMotion) before commanding again.
+"""
+ACTION_RESET = "reset"
+"""
+The controller entered an error state. Reset it (ResetAllError).
+"""
+ACTION_MANUAL = "manual"
+"""
+Not resettable from the SDK, an operator has to power cycle or inspect the robot.
+"""
+
+
+class ErrorInfo:
+    __slots__ = ("code", "name", "description", "category", "severity", "recoverable", "action")
+
+    def __init__(self, code, name, description, category, severity, action):
+        self.code = code
+        self.name = name
+        self.description = description
+        self.category = category
+        self.severity = severity
+        self.action = action
+        self.recoverable = action != ACTION_MANUAL
+
+    def __repr__(self):
+        return f"ErrorInfo({self.code}, {self.name}, {self.category}, {self.severity}, {self.action})"
+
+
+def _table(*entries):
+    return {entry[0]: ErrorInfo(*entry) for entry in entries}
+
+
+ERROR_TABLE = _table(
+    (-4, "ERR_XMLRPC_CMD_FAILED", "xmlrpc接口执行失败", COMMUNICATION, ERROR, ACTION_RECONNECT),
+    (-3, "ERR_XMLRPC_COM_FAILED", "xmlrpc通讯失败，请检查网络连接及服务器IP地址", COMMUNICATION, ERROR, ACTION_RECONNECT),
+    (-2, "ERR_SOCKET_COM_FAILED", "与控制器通讯异常，检查与控制器硬件连接", COMMUNICATION, ERROR, ACTION_RECONNECT),
+    (-1, "ERR_OTHER", "其他错误", UNKNOWN, ERROR, ACTION_RESET),
+    (1, "ERR_PARAM_NUM", "接口参数个数不一致", PARAMETER, WARNING, ACTION_NONE),
+    (3, "ERR_PARAM_VALUE", "接口参数值异常，不在合理范围", PARAMETER, WARNING, ACTION_NONE),
+    (8, "ERR_TPD_FILE_OPEN_FAILED", "轨迹文件打开失败", FILE, WARNING, ACTION_NONE),
+    (9, "ERR_TPD_FILE_NAME_SEND_FAILED", "TPD文件名发送失败", FILE, WARNING, ACTION_NONE),
+    (10, "ERR_TPD_FILE_CONTENT_SEND_FAILED", "TPD文件内容发送失败", FILE, WARNING, ACTION_NONE),
+    (14, "ERR_EXECUTION_FAILED", "接口执行失败", UNKNOWN, ERROR, ACTION_RESET),
+    (18, "ERR_PROGRAM_IS_RUNNING", "机器人程序正在运行", STATE, WARNING, ACTION_STOP),
+    (25, "ERR_COMPUTE_FAILED", "数据异常，计算失败", KINEMATICS, WARNING, ACTION_NONE),
+    (28, "ERR_INVERSE_KINEMATICS_COMPUTE_FAILED", "逆运动学计算失败", KINEMATICS, WARNING, ACTION_NONE),
+    (29, "ERR_SERVOJ_JOINT_OVERRUN", "伺服关节超限", MOTION, ERROR, ACTION_RESET),
+    (30, "ERR_NON_RESSETABLE_FAILURE", "不可复位故障，请断电重启控制箱", CONTROLLER, FATAL, ACTION_MANUAL),
+    (34, "ERR_EXTAXIS_CONFIG_FAILURE", "外部轴未处于零位", STATE, ERROR, ACTION_MANUAL),
+    (36, "ERR_WORKPIECE_NUM", "工件号错误", PARAMETER, WARNING, ACTION_NONE),
+    (38, "ERR_FILENAME_TOO_LONG", "文件名过长", FILE, WARNING, ACTION_NONE),
+    (64, "ERR_NOT_ADD_CMD_QUEUE", "未加入指令队列", STATE, WARNING, ACTION_NONE),
+    (66, "ERR_CIRCLE_SPIRAL_MIDDLE_POINT1", "整圆/螺旋线指令中间点1错误", PARAMETER, WARNING, ACTION_NONE),
+    (67, "ERR_CIRCLE_SPIRAL_MIDDLE_POINT2", "整圆/螺旋线指令中间点2错误", PARAMETER, WARNING, ACTION_NONE),
+    (68, "ERR_CIRCLE_SPIRAL_MIDDLE_POINT3", "整圆/螺旋线指令中间点3错误", PARAMETER, WARNING, ACTION_NONE),
+    (69, "ERR_MOVEC_MIDDLE_POINT", "圆弧指令中间点错误", PARAMETER, WARNING, ACTION_NONE),
+    (70, "ERR_MOVEC_TARGET_POINT", "圆弧指令目标点错误", PARAMETER, WARNING, ACTION_NONE),
+    (73, "ERR_GRIPPER_MOTION", "夹爪运动报错", GRIPPER, ERROR, ACTION_RESET),
+    (74, "ERR_LINE_POINT", "直线指令点错误", PARAMETER, WARNING, ACTION_NONE),
+    (75, "ERR_CHANNEL_FAULT", "通道错误", CONTROLLER, ERROR, ACTION_RESET),
+    (76, "ERR_WAIT_TIMEOUT", "等待超时", STATE, WARNING, ACTION_NONE),
+    (82, "ERR_TPD_CMD_POINT", "TPD指令点错误", PARAMETER, WARNING, ACTION_NONE),
+    (83, "ERR_TPD_CMD_TOOL", "TPD工具号错误", PARAMETER, WARNING, ACTION_NONE),
+    (94, "ERR_SPLINE_POINT", "样条指令点错误", PARAMETER, WARNING, ACTION_NONE),
+    (108, "ERR_SPIRAL_START_POINT", "螺旋线起始点错误", PARAMETER, WARNING, ACTION_NONE),
+    (112, "ERR_TARGET_POSE_CANNOT_REACHED", "目标位姿无法到达", KINEMATICS, WARNING, ACTION_NONE),
+)
+"""
+Return codes of the Fairino controller, code -> ErrorInfo.
+"""
+
+UNKNOWN_ERROR = ErrorInfo(None, "ERR_UNKNOWN", "未知错误", UNKNOWN, ERROR, ACTION_RESET)
+"""
+Codes not in ERROR_TABLE. Reset, as RobotException.revoke always did.
+"""
+
+NO_RESPONSE = ErrorInfo(None, "ERR_NO_RESPONSE", "控制器无响应", COMMUNICATION, ERROR, ACTION_RECONNECT)
+"""
+Calls that got no answer at all, see RobotTimeoutException and CircuitOpenException.
+"""
+
+
+def lookup(code) -> ErrorInfo:
+    """
+    :param code: controller return code
+    :return: its ErrorInfo, UNKNOWN_ERROR if the code is not in the table
+    """
+    return ERROR_TABLE.get(code, UNKNOWN_ERROR)
+
+
+def is_communication_error(code) -> bool:
+    info = ERROR_TABLE.get(code)
+    return info is not None and info.category == COMMUNICATION
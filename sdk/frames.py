@@ -0,0 +1,128 @@
+import json
+
+import numpy as np
+
+from sdk import apis
+from sdk.kinematics import pose_to_matrix, matrix_to_pose, invert
+from sdk.pose import Pose, PoseBatch
+
+FRAME_IDS = range(0, 15)
+"""
+Tool and workpiece numbers of the controller, 0 is the flange / the base frame.
+"""
+
+
+class FrameCache:
+    """
+    Tool and workpiece (user) frames as 4x4 transforms, to convert targets locally instead of
+    switching frames on the controller.
+
+    A target given in tool t and workpiece u is converted to the pose of a fixed tool, by
+    default the flange, in the base frame: base_T_target = U @ P @ inv(T_t) @ T_target. Motions
+    sent with that pose and the fixed tool reach the same place; see Motion.set_frames. Batches
+    of poses are converted in one vectorized pass.
+    """
+
+    def __init__(self):
+        self.tools = {0: np.eye(4)}
+        self.users = {0: np.eye(4)}
+        self.links = {}  # (tool, target_tool) -> inv(T_tool) @ T_target
+
+    @staticmethod
+    def _check(frame, kind):
+        if frame not in FRAME_IDS:
+            raise ValueError(f"Invalid {kind} {frame}")
+
+    def set_tool(self, tool, pose):
+        """
+        :param tool: tool number, [1~14]
+        :param pose: TCP in the flange frame, [x, y, z, rx, ry, rz] in [mm][°]
+        """
+        self._check(tool, "tool")
+        self.tools[tool] = pose_to_matrix(pose)
+        self.links.clear()
+        return self
+
+    def set_user(self, user, pose):
+        """
+        :param user: workpiece number, [1~14]
+        :param pose: workpiece frame in the base frame, [x, y, z, rx, ry, rz] in [mm][°]
+        """
+        self._check(user, "user")
+        self.users[user] = pose_to_matrix(pose)
+        return self
+
+    def load(self, robot, tool=None, user=None):
+        """
+        Read the active tool and workpiece frames from the controller, which only reports the
+        active ones, and cache them under their numbers.
+        :param tool: number of the active tool, None to skip it
+        :param user: number of the active workpiece, None to skip it
+        """
+        if tool is not None:
+            self.set_tool(tool, robot.call(apis.Common.get_tool_coord()))
+        if user is not None:
+            self.set_user(user, robot.call(apis.Common.get_wobj_coord()))
+        return self
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        :param path: JSON {"tools": {number: pose}, "users": {number: pose}}, as written by save
+        """
+        with open(path) as f:
+            config = json.load(f)
+        cache = cls()
+        for tool, pose in config.get("tools", {}).items():
+            cache.set_tool(int(tool), pose)
+        for user, pose in config.get("users", {}).items():
+            cache.set_user(int(user), pose)
+        return cache
+
+    def save(self, path):
+        config = {
+            "tools": {str(k): matrix_to_pose(t).tolist() for k, t in self.tools.items() if k != 0},
+            "users": {str(k): matrix_to_pose(t).tolist() for k, t in self.users.items() if k != 0},
+        }
+        with open(path, "w") as f:
+            json.dump(config, f, indent=2)
+
+    def tool(self, tool):
+        try:
+            return self.tools[tool]
+        except KeyError:
+            raise ValueError(f"Tool {tool} is not loaded") from None
+
+    def user(self, user):
+        try:
+            return self.users[user]
+        except KeyError:
+            raise ValueError(f"Workpiece {user} is not loaded") from None
+
+    def link(self, tool, target_tool):
+        link = self.links.get((tool, target_tool))
+        if link is None:
+            link = self.links[(tool, target_tool)] = invert(self.tool(tool)) @ self.tool(target_tool)
+        return link
+
+    def to_base(self, poses, tool=0, user=0, target_tool=0):
+        """
+        :param poses: Pose, [x, y, z, rx, ry, rz] or PoseBatch / (N, 6) of the TCP of tool in workpiece user
+        :param target_tool: the tool whose TCP the result is the pose of
+        :return: the poses of the TCP of target_tool in the base frame, a Pose or a PoseBatch like poses
+        """
+        t = self.user(user) @ pose_to_matrix(poses) @ self.link(tool, target_tool)
+        return _wrap(matrix_to_pose(t))
+
+    def from_base(self, poses, tool=0, user=0, source_tool=0):
+        """
+        The inverse of to_base.
+        :param poses: poses of the TCP of source_tool in the base frame
+        :return: the poses of the TCP of tool in workpiece user
+        """
+        t = invert(self.user(user)) @ pose_to_matrix(poses) @ self.link(source_tool, tool)
+        return _wrap(matrix_to_pose(t))
+
+
+def _wrap(data):
+    return Pose.wrap(data) if data.ndim == 1 else PoseBatch.wrap(data)
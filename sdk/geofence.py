@@ -0,0 +1,172 @@
+import numpy as np
+
+# 位置单位毫米(mm)，基坐标系
+
+
+class ConvexRegion:
+    def __init__(self, normals, offsets):
+        """
+        A convex region as the intersection of half-spaces normals @ p <= offsets.
+        Normals are normalized, so the slack b - A @ p of a row is the distance to its plane.
+        :param normals: (m, 3)
+        :param offsets: (m,)
+        """
+        normals = np.asarray(normals, dtype=float).reshape(-1, 3)
+        offsets = np.asarray(offsets, dtype=float).reshape(-1)
+        norm = np.linalg.norm(normals, axis=1)
+        self.normals = normals / norm[:, None]
+        self.offsets = offsets / norm
+
+    @classmethod
+    def box(cls, lower, upper):
+        """
+        :param lower: [x, y, z] minimum corner
+        :param upper: [x, y, z] maximum corner
+        """
+        eye = np.eye(3)
+        return cls(np.vstack([eye, -eye]), np.concatenate([np.asarray(upper, float), -np.asarray(lower, float)]))
+
+    @classmethod
+    def cylinder(cls, center, radius, z_min, z_max, sides=16, circumscribed=False):
+        """
+        Vertical cylinder approximated by a prism.
+        :param center: [x, y] of the axis
+        :param radius: radius
+        :param z_min: bottom
+        :param z_max: top
+        :param sides: number of side planes
+        :param circumscribed: prism around the cylinder (use for keep-out zones, so the
+                              approximation errs on the safe side) instead of inside it
+        """
+        angles = np.arange(sides) * (2 * np.pi / sides)
+        normals = np.zeros((sides + 2, 3))
+        normals[:sides, 0] = np.cos(angles)
+        normals[:sides, 1] = np.sin(angles)
+        normals[sides, 2] = 1.0
+        normals[sides + 1, 2] = -1.0
+        apothem = radius if circumscribed else radius * np.cos(np.pi / sides)
+        offsets = np.empty(sides + 2)
+        offsets[:sides] = normals[:sides, :2] @ np.asarray(center, dtype=float) + apothem
+        offsets[sides] = z_max
+        offsets[sides + 1] = -z_min
+        return cls(normals, offsets)
+
+    def inflate(self, distance):
+        """
+        :return: the region grown by distance on every side
+        """
+        return ConvexRegion(self.normals, self.offsets + distance)
+
+    def contains(self, points) -> np.ndarray:
+        """
+        :param points: (..., 3)
+        :return: (...) bool
+        """
+        return np.all(np.asarray(points, dtype=float) @ self.normals.T <= self.offsets, axis=-1)
+
+
+class Geofence:
+    """
+    Client side workspace limits for streamed setpoints.
+
+    The TCP must stay inside the workspace region and outside every keep-out region.
+    All half-spaces are stacked into one matrix at construction, so checking a step is a
+    couple of small matrix-vector products regardless of the number of zones. Steps are
+    shortened instead of rejected: the arm stops at the boundary and slows down within
+    margin of the workspace boundary, the controller never sees a target outside.
+    """
+
+    def __init__(self, workspace: ConvexRegion = None, keepouts=(), joint_limits=None, margin=20.0,
+                 clearance=5.0):
+        """
+        :param workspace: region the TCP must stay in, None for no limit
+        :param keepouts: regions the TCP must stay out of
+        :param joint_limits: 6 rows of [min, max] in [°], for clamp_joints, e.g. ArmModel.joint_limits
+        :param margin: distance from the workspace boundary where motion towards it slows down [mm]
+        :param clearance: distance kept from keep-out regions [mm]
+        """
+        self.margin = margin
+        if workspace is None:
+            workspace = ConvexRegion(np.zeros((0, 3)), np.zeros(0))
+        self.work_normals = workspace.normals
+        self.work_offsets = workspace.offsets
+
+        keepouts = [region.inflate(clearance) for region in keepouts]
+        self.n_work = len(self.work_offsets)
+        self.has_keepouts = bool(keepouts)
+        # every plane in one matrix: a step costs two matrix-vector products
+        self.normals = np.vstack([self.work_normals] + [region.normals for region in keepouts])
+        self.offsets = np.concatenate([self.work_offsets] + [region.offsets for region in keepouts])
+        sizes = [len(region.offsets) for region in keepouts]
+        self.keep_starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(int)
+
+        if joint_limits is not None:
+            limits = np.asarray(joint_limits, dtype=float).reshape(6, 2)
+            self.joint_lower, self.joint_upper = limits[:, 0], limits[:, 1]
+        else:
+            self.joint_lower = self.joint_upper = None
+
+    def contains(self, points) -> np.ndarray:
+        """
+        :param points: (..., 3) TCP positions
+        :return: (...) bool, inside the workspace and outside all keep-outs
+        """
+        inside = np.asarray(points, dtype=float) @ self.normals.T <= self.offsets
+        ok = np.all(inside[..., :self.n_work], axis=-1)
+        if self.has_keepouts:
+            in_zone = np.minimum.reduceat(inside[..., self.n_work:].astype(np.int8), self.keep_starts, axis=-1)
+            ok &= ~np.any(in_zone.astype(bool), axis=-1)
+        return ok
+
+    def limit_step(self, position, step) -> float:
+        """
+        How much of a step the TCP may take.
+        :param position: (3,) current TCP position; inside a keep-out only steps out of it are allowed
+        :param step: (3,) intended displacement
+        :return: scale in [0, 1] to apply to the step
+        """
+        towards = self.normals @ step
+        slack = self.offsets - self.normals @ position
+        scale = 1.0
+
+        n = self.n_work
+        if n:
+            # per plane moved towards: min(slack / towards, slack / margin), i.e. never past the
+            # boundary and slow down within margin of it; as one ratio to skip masking
+            toward = towards[:n]
+            ratio = float((np.maximum(toward, self.margin) * (toward > 0) / np.maximum(slack[:n], 1e-9)).max())
+            if ratio > 1.0:
+                scale = 1.0 / ratio
+
+        if self.has_keepouts:
+            # parameter range of the segment position + t * step inside each zone (Cyrus-Beck)
+            towards, slack = towards[n:], slack[n:]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = slack / towards
+            lower = np.where(towards < 0, t, -np.inf)
+            upper = np.where(towards > 0, t, np.inf)
+            # parallel to a plane and outside it: the segment misses the zone
+            upper[(towards == 0) & (slack < 0)] = -np.inf
+            t_in = np.maximum.reduceat(lower, self.keep_starts)
+            t_out = np.minimum.reduceat(upper, self.keep_starts)
+            # already inside a zone (e.g. synced there, or it was inflated around the TCP): any
+            # step that does not go deeper is allowed, so the arm can get out
+            depth = np.minimum.reduceat(slack, self.keep_starts)
+            inside = depth >= 0
+            if inside.any():
+                deeper = np.minimum.reduceat(slack - towards, self.keep_starts) > depth
+                if np.any(inside & deeper):
+                    return 0.0
+            hits = ~inside & (t_in <= t_out) & (t_in <= scale) & (t_out >= 0)
+            if hits.any():
+                scale = min(scale, float(t_in[hits].min()))
+        return max(0.0, scale)
+
+    def clamp_joints(self, joints):
+        """
+        :param joints: (..., 6) in [°]
+        :return: joints clipped to the joint limits
+        """
+        if self.joint_lower is None:
+            return joints
+        return np.clip(joints, self.joint_lower, self.joint_upper)
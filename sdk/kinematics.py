@@ -0,0 +1,302 @@
+import json
+
+import numpy as np
+
+from sdk.pose import Pose, JointState, PoseBatch
+
+# 局部运动学: 位置单位毫米(mm)，姿态单位度(°)，与控制器一致。
+# 姿态 [rx, ry, rz] 为固定轴 X-Y-Z 欧拉角: R = Rz(rz) @ Ry(ry) @ Rx(rx)
+
+
+def rpy_to_matrix(rpy):
+    """
+    :param rpy: (..., 3) [rx, ry, rz] in [°]
+    :return: (..., 3, 3) rotation matrices
+    """
+    rpy = np.radians(np.asarray(rpy, dtype=float))
+    cx, cy, cz = np.cos(rpy[..., 0]), np.cos(rpy[..., 1]), np.cos(rpy[..., 2])
+    sx, sy, sz = np.sin(rpy[..., 0]), np.sin(rpy[..., 1]), np.sin(rpy[..., 2])
+    r = np.empty(rpy.shape[:-1] + (3, 3))
+    r[..., 0, 0] = cz * cy
+    r[..., 0, 1] = cz * sy * sx - sz * cx
+    r[..., 0, 2] = cz * sy * cx + sz * sx
+    r[..., 1, 0] = sz * cy
+    r[..., 1, 1] = sz * sy * sx + cz * cx
+    r[..., 1, 2] = sz * sy * cx - cz * sx
+    r[..., 2, 0] = -sy
+    r[..., 2, 1] = cy * sx
+    r[..., 2, 2] = cy * cx
+    return r
+
+
+def matrix_to_rpy(r):
+    """
+    :param r: (..., 3, 3) rotation matrices
+    :return: (..., 3) [rx, ry, rz] in [°]
+    """
+    rx = np.arctan2(r[..., 2, 1], r[..., 2, 2])
+    ry = np.arctan2(-r[..., 2, 0], np.hypot(r[..., 2, 1], r[..., 2, 2]))
+    rz = np.arctan2(r[..., 1, 0], r[..., 0, 0])
+    return np.degrees(np.stack([rx, ry, rz], axis=-1))
+
+
+def pose_to_matrix(poses):
+    """
+    :param poses: (..., 6) [x, y, z, rx, ry, rz] in [mm][°], Pose or PoseBatch
+    :return: (..., 4, 4) homogeneous transforms, translation in [mm]
+    """
+    poses = np.asarray(poses, dtype=float)
+    t = np.zeros(poses.shape[:-1] + (4, 4))
+    t[..., :3, :3] = rpy_to_matrix(poses[..., 3:])
+    t[..., :3, 3] = poses[..., :3]
+    t[..., 3, 3] = 1.0
+    return t
+
+
+def matrix_to_pose(t):
+    """
+    :param t: (..., 4, 4) homogeneous transforms
+    :return: (..., 6) [x, y, z, rx, ry, rz] in [mm][°]
+    """
+    return np.concatenate([t[..., :3, 3], matrix_to_rpy(t[..., :3, :3])], axis=-1)
+
+
+def invert(t):
+    """
+    Invert rigid transforms without a general matrix inverse.
+    :param t: (..., 4, 4)
+    """
+    inv = np.zeros_like(t)
+    rt = np.swapaxes(t[..., :3, :3], -1, -2)
+    inv[..., :3, :3] = rt
+    inv[..., :3, 3] = -np.einsum('...ij,...j->...i', rt, t[..., :3, 3])
+    inv[..., 3, 3] = 1.0
+    return inv
+
+
+def _offset(z_length, z_angle):
+    offset = np.eye(4)
+    a = np.radians(z_angle)
+    offset[0, 0] = offset[1, 1] = np.cos(a)
+    offset[0, 1] = -np.sin(a)
+    offset[1, 0] = np.sin(a)
+    offset[2, 3] = z_length
+    return offset
+
+
+def compute_pre_pick(desc_pos, z_length, z_angle):
+    """
+    计算预抓取点，本地计算，对应 Gripper.compute_pre_pick
+    The approach pose: backed off by z_length along the tool z axis of the grasp pose
+    (which points into the part) and rotated by z_angle about it.
+    :param desc_pos: 抓取点笛卡尔位姿, (6,) or (N, 6)
+    :param z_length: z轴偏移量 [mm]
+    :param z_angle: 绕z轴旋转偏移量 [°]
+    :return: Pose, or PoseBatch for a batch
+    """
+    poses = np.asarray(desc_pos, dtype=float)
+    result = matrix_to_pose(pose_to_matrix(poses) @ _offset(-z_length, z_angle))
+    return Pose.wrap(result) if result.ndim == 1 else PoseBatch.wrap(result)
+
+
+def compute_post_pick(desc_pos, z_length, z_angle):
+    """
+    计算撤退点，本地计算，对应 Gripper.compute_post_pick
+    The retreat pose: lifted by z_length along the base z axis and rotated by z_angle
+    about the tool z axis.
+    :param desc_pos: 抓取点笛卡尔位姿, (6,) or (N, 6)
+    :param z_length: z轴偏移量 [mm]
+    :param z_angle: 绕z轴旋转偏移量 [°]
+    :return: Pose, or PoseBatch for a batch
+    """
+    t = pose_to_matrix(np.asarray(desc_pos, dtype=float)) @ _offset(0.0, z_angle)
+    t[..., 2, 3] += z_length
+    result = matrix_to_pose(t)
+    return Pose.wrap(result) if result.ndim == 1 else PoseBatch.wrap(result)
+
+
+class ArmModel:
+    def __init__(self, name, dh, joint_limits):
+        """
+        Geometry of a 6 axis arm in standard Denavit-Hartenberg form.
+        :param name: model name
+        :param dh: 6 rows of [a [mm], alpha [°], d [mm], theta offset [°]]
+        :param joint_limits: 6 rows of [min, max] in [°]
+        """
+        self.name = name
+        dh = np.asarray(dh, dtype=float).reshape(6, 4)
+        self.a = dh[:, 0]
+        self.alpha = np.radians(dh[:, 1])
+        self.d = dh[:, 2]
+        self.theta_offset = np.radians(dh[:, 3])
+        self.joint_limits = np.asarray(joint_limits, dtype=float).reshape(6, 2)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        :param config: dict, or path of a JSON file, with "name", "dh" and "joint_limits"
+        """
+        if isinstance(config, str):
+            with open(config) as f:
+                config = json.load(f)
+        return cls(config.get("name", "custom"), config["dh"], config["joint_limits"])
+
+
+def _ur_type(name, d1, a2, a3, d4, d5, d6, limits):
+    return ArmModel(name, [
+        [0.0, 90.0, d1, 0.0],
+        [a2, 0.0, 0.0, 0.0],
+        [a3, 0.0, 0.0, 0.0],
+        [0.0, 90.0, d4, 0.0],
+        [0.0, -90.0, d5, 0.0],
+        [0.0, 0.0, d6, 0.0],
+    ], limits)
+
+
+_FR_LIMITS = [[-175, 175], [-265, 85], [-160, 160], [-265, 85], [-175, 175], [-175, 175]]
+
+MODELS = {
+    "FR3": _ur_type("FR3", 140.0, -280.0, -240.0, 102.0, 102.0, 100.0, _FR_LIMITS),
+    "FR5": _ur_type("FR5", 152.0, -425.0, -395.0, 102.0, 102.0, 100.0, _FR_LIMITS),
+    "FR10": _ur_type("FR10", 180.0, -700.0, -586.0, 159.0, 114.0, 106.0, _FR_LIMITS),
+    "FR16": _ur_type("FR16", 180.0, -520.0, -400.0, 159.0, 114.0, 106.0, _FR_LIMITS),
+}
+"""
+Nominal geometry of the Fairino arms. Check a model against the controller
+(compare forward with the TCP pose reported for a few joint positions, tool 0 / user 0)
+and load a calibrated one with ArmModel.from_config where it differs.
+"""
+
+
+class Kinematics:
+    """
+    Batched forward / inverse kinematics of the flange (tool 0) in the base frame (user 0).
+
+    Every method takes a single vector (6,) or a batch (N, 6).
+    """
+
+    def __init__(self, model="FR5"):
+        """
+        :param model: an ArmModel, a name in MODELS, or a config accepted by ArmModel.from_config
+        """
+        if isinstance(model, ArmModel):
+            self.model = model
+        elif isinstance(model, str) and model in MODELS:
+            self.model = MODELS[model]
+        else:
+            self.model = ArmModel.from_config(model)
+
+    def frames(self, joints):
+        """
+        Transforms of the base and of every joint frame.
+        :param joints: (..., 6) in [°]
+        :return: (..., 7, 4, 4), index 0 is the base, index 6 the flange
+        """
+        m = self.model
+        q = np.radians(np.asarray(joints, dtype=float)) + m.theta_offset
+        ct, st = np.cos(q), np.sin(q)
+        ca, sa = np.cos(m.alpha), np.sin(m.alpha)
+        links = np.zeros(q.shape + (4, 4))
+        links[..., 0, 0] = ct
+        links[..., 0, 1] = -st * ca
+        links[..., 0, 2] = st * sa
+        links[..., 0, 3] = m.a * ct
+        links[..., 1, 0] = st
+        links[..., 1, 1] = ct * ca
+        links[..., 1, 2] = -ct * sa
+        links[..., 1, 3] = m.a * st
+        links[..., 2, 1] = sa
+        links[..., 2, 2] = ca
+        links[..., 2, 3] = m.d
+        links[..., 3, 3] = 1.0
+
+        frames = np.empty(q.shape[:-1] + (7, 4, 4))
+        frames[..., 0, :, :] = np.eye(4)
+        for i in range(6):
+            frames[..., i + 1, :, :] = frames[..., i, :, :] @ links[..., i, :, :]
+        return frames
+
+    def forward_matrix(self, joints):
+        """
+        :param joints: (..., 6) in [°]
+        :return: (..., 4, 4) flange transforms
+        """
+        return self.frames(joints)[..., 6, :, :]
+
+    def forward(self, joints):
+        """
+        正运动学
+        :param joints: (6,) or (N, 6) in [°], JointState accepted
+        :return: Pose, or PoseBatch for a batch
+        """
+        result = matrix_to_pose(self.forward_matrix(joints))
+        return Pose.wrap(result) if result.ndim == 1 else PoseBatch.wrap(result)
+
+    def jacobian(self, frames):
+        """
+        Geometric jacobian from the output of frames.
+        :return: (..., 6, 6), rows [v [mm/rad]; w [rad/rad]]
+        """
+        z = frames[..., :6, :3, 2]
+        p = frames[..., :6, :3, 3]
+        p_end = frames[..., 6:7, :3, 3]
+        j = np.empty(frames.shape[:-3] + (6, 6))
+        j[..., :3, :] = np.swapaxes(np.cross(z, p_end - p), -1, -2)
+        j[..., 3:, :] = np.swapaxes(z, -1, -2)
+        return j
+
+    def inverse(self, desc_pos, seed=None, tol=1e-3, max_iter=100, damping=1e-2, max_step=0.2):
+        """
+        逆运动学，damped least squares, all poses iterated together.
+        :param desc_pos: (6,) or (N, 6) in [mm][°], Pose or PoseBatch accepted
+        :param seed: joint position to start from, (6,) or (N, 6) in [°]; decides which of the
+                     solutions is found, pass the current joints for the nearest one
+        :param tol: convergence tolerance, position in [mm], orientation in [mrad]
+        :param max_iter: iteration limit
+        :param damping: damping factor, trades accuracy near singularities for stability
+        :param max_step: largest joint change per iteration [rad]
+        :return: (joints, ok): JointState or (N, 6) array in [°], and bool or (N,) bool array
+        """
+        target = pose_to_matrix(desc_pos)
+        single = target.ndim == 2
+        target = target.reshape(-1, 4, 4)
+        n = len(target)
+        if seed is None:
+            seed = np.array([0.0, -90.0, 90.0, -90.0, -90.0, 0.0])
+        q = np.radians(np.broadcast_to(np.asarray(seed, dtype=float), (n, 6))).copy()
+        lower, upper = np.radians(self.model.joint_limits[:, 0]), np.radians(self.model.joint_limits[:, 1])
+        eye = np.eye(6) * damping ** 2
+        ok = np.zeros(n, dtype=bool)
+        active = np.arange(n)
+
+        for _ in range(max_iter):
+            frames = self.frames(np.degrees(q[active]))
+            current = frames[:, 6]
+            error = np.empty((len(active), 6))
+            error[:, :3] = target[active, :3, 3] - current[:, :3, 3]
+            # orientation error, rotation vector of R_target @ R_current^T (small angle form)
+            r_err = target[active, :3, :3] @ np.swapaxes(current[:, :3, :3], -1, -2)
+            error[:, 3] = r_err[:, 2, 1] - r_err[:, 1, 2]
+            error[:, 4] = r_err[:, 0, 2] - r_err[:, 2, 0]
+            error[:, 5] = r_err[:, 1, 0] - r_err[:, 0, 1]
+            error[:, 3:] *= 0.5
+
+            done = (np.abs(error[:, :3]).max(axis=1) < tol) & (np.abs(error[:, 3:]).max(axis=1) < tol * 1e-3)
+            ok[active[done]] = True
+            active = active[~done]
+            if len(active) == 0:
+                break
+            error = error[~done]
+            j = self.jacobian(frames[~done])
+            # dq = J^T (J J^T + l^2 I)^-1 e
+            jjt = j @ np.swapaxes(j, -1, -2) + eye
+            dq = np.einsum('nji,nj->ni', j, np.linalg.solve(jjt, error[..., None])[..., 0])
+            # limit the step, large steps jump between solution branches and oscillate
+            step = np.abs(dq).max(axis=1, keepdims=True)
+            dq *= np.minimum(1.0, max_step / np.maximum(step, 1e-12))
+            q[active] = np.clip(q[active] + dq, lower, upper)
+
+        joints = np.degrees(q)
+        if single:
+            return JointState.wrap(joints[0]), bool(ok[0])
+        return joints, ok
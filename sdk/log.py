@@ -0,0 +1,208 @@
+import itertools
+import struct
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+RING_RECORD = struct.Struct("<qBH4d")
+"""
+Binary ring record: time.monotonic_ns(), level, message id, up to 4 numeric arguments (NaN if absent).
+"""
+
+
+class Logger:
+    """
+    Logging for the control loop that never blocks it.
+
+    A message is a format string and its arguments: the caller appends them to a deque
+    (atomic, no lock) and a background thread formats and writes them, so a slow terminal
+    or a full pipe only delays the writer. Repeats of the same message within interval are
+    counted instead of queued and reported with the next one that gets through.
+
+    Every message also goes into a preallocated binary ring, numeric arguments only, which
+    keeps the last capacity messages for dump after a fault even when the queue was behind.
+    ERROR messages are rare and mostly describe the fault in text, so the ring keeps them
+    formatted as well.
+    """
+
+    def __init__(self, stream=None, level=INFO, interval=1.0, capacity=4096, flush_interval=0.05, dump_path=None):
+        """
+        :param stream: where messages are written, sys.stderr if None
+        :param level: messages below this level are dropped
+        :param interval: repeats of one message within this many seconds are suppressed
+        :param capacity: messages kept in the binary ring
+        :param flush_interval: seconds the writer sleeps when the queue is empty
+        :param dump_path: file the ring is dumped to by on_fault, None to not dump
+        """
+        self.stream = stream
+        self.level = level
+        self.interval_ns = int(interval * 1e9)
+        self.flush_interval = flush_interval
+        self.dump_path = dump_path
+        self.queue = deque()
+        self.last = {}  # (fmt, args) -> [time of the last message written, suppressed count]
+        self.dropped = 0
+        self.writer = None
+        self.writer_lock = threading.Lock()
+
+        self.capacity = capacity
+        self.ring = bytearray(RING_RECORD.size * capacity)
+        self.sequence = itertools.count()  # next() is atomic
+        self.written = 0
+        self.messages = {}  # fmt -> id
+        self.message_list = []  # id -> fmt
+        self.texts = deque(maxlen=capacity)  # (ring index, formatted message) of ERROR messages
+
+    def log(self, level, fmt, *args):
+        """
+        :param level: DEBUG, INFO, WARNING or ERROR
+        :param fmt: %-format string, the same string for the same kind of message
+        :param args: arguments, formatted by the writer thread
+        """
+        if level < self.level:
+            return
+        now = time.monotonic_ns()
+        self.record(now, level, fmt, args)
+
+        try:
+            key = (fmt, args)
+            last = self.last.get(key)
+        except TypeError:
+            # unhashable arguments, no deduplication
+            key = last = None
+        if last is not None and now - last[0] < self.interval_ns:
+            last[1] += 1
+            return
+        suppressed = 0
+        if key is not None:
+            if last is None:
+                self.last[key] = [now, 0]
+            else:
+                suppressed = last[1]
+                last[0], last[1] = now, 0
+        self.queue.append((now, level, fmt, args, suppressed))
+        if self.writer is None:
+            self.start()
+
+    def debug(self, fmt, *args):
+        self.log(DEBUG, fmt, *args)
+
+    def info(self, fmt, *args):
+        self.log(INFO, fmt, *args)
+
+    def warning(self, fmt, *args):
+        self.log(WARNING, fmt, *args)
+
+    def error(self, fmt, *args):
+        self.log(ERROR, fmt, *args)
+
+    def record(self, now, level, fmt, args):
+        message = self.messages.get(fmt)
+        if message is None:
+            message = self.messages[fmt] = len(self.message_list)
+            self.message_list.append(fmt)
+        values = [float(arg) if isinstance(arg, (int, float)) else float("nan") for arg in args[:4]]
+        values += [float("nan")] * (4 - len(values))
+        index = next(self.sequence)
+        RING_RECORD.pack_into(self.ring, (index % self.capacity) * RING_RECORD.size, now, level, message, *values)
+        if level >= ERROR:
+            self.texts.append((index, self.message(fmt, args)))
+        self.written = index + 1
+
+    def start(self):
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run, daemon=True, name="log-writer")
+                self.writer.start()
+
+    def run(self):
+        while True:
+            if not self.queue:
+                time.sleep(self.flush_interval)
+                continue
+            self.flush()
+
+    def flush(self):
+        """
+        Write everything queued so far. Called by the writer, or directly e.g. before exit.
+        """
+        stream = self.stream if self.stream is not None else sys.stderr
+        lines = []
+        while True:
+            # the writer and a direct caller may drain concurrently
+            try:
+                item = self.queue.popleft()
+            except IndexError:
+                break
+            lines.append(self.format(*item))
+        # the dedup table only needs keys seen within interval
+        if len(self.last) > 1024:
+            limit = time.monotonic_ns() - self.interval_ns
+            for key in [key for key, last in list(self.last.items()) if last[0] < limit and not last[1]]:
+                self.last.pop(key, None)
+        if lines:
+            try:
+                stream.write("".join(lines))
+                stream.flush()
+            except (OSError, ValueError):
+                self.dropped += len(lines)
+
+    @staticmethod
+    def message(fmt, args):
+        try:
+            return fmt % args if args else fmt
+        except (TypeError, ValueError):
+            return f"{fmt} {args}"
+
+    @classmethod
+    def format(cls, now, level, fmt, args, suppressed=0):
+        message = cls.message(fmt, args)
+        if suppressed:
+            message += f" ({suppressed} repeats suppressed)"
+        return f"{now / 1e9:.6f} {LEVEL_NAMES.get(level, level)} {message}\n"
+
+    def ring_records(self):
+        """
+        :return: the records in the binary ring, oldest first, as (time ns, level, fmt, numeric args),
+                 with the formatted message instead of fmt for ERROR records
+        """
+        written = self.written
+        texts = dict(list(self.texts))
+        records = []
+        for index in range(max(0, written - self.capacity), written):
+            offset = (index % self.capacity) * RING_RECORD.size
+            now, level, message, *values = RING_RECORD.unpack_from(self.ring, offset)
+            records.append((now, level, texts.get(index, self.message_list[message]), values))
+        return records
+
+    def dump(self, path):
+        """
+        Write the binary ring as text, e.g. after a fault. Non-numeric arguments show as nan,
+        except in ERROR messages, which are written formatted.
+        :param path: output file
+        """
+        with open(path, "w") as f:
+            for now, level, fmt, values in self.ring_records():
+                f.write(f"{now / 1e9:.6f} {LEVEL_NAMES.get(level, level)} {fmt} {values}\n")
+
+    def on_fault(self):
+        """
+        Called on a fault: write what is queued, and dump the ring to dump_path if set.
+        """
+        self.flush()
+        if self.dump_path is not None:
+            self.dump(self.dump_path)
+
+
+log = Logger()
+"""
+The process wide logger used by RosJoy and the controllers.
+"""
@@ -0,0 +1,162 @@
+import numpy as np
+
+from sdk import apis
+from sdk.kinematics import pose_to_matrix, matrix_to_pose, rpy_to_matrix, compute_pre_pick, compute_post_pick
+from sdk.pose import PoseBatch
+
+GRID = "grid"
+"""
+Every layer is the same grid, the boxes form columns.
+"""
+
+INTERLOCKED = "interlocked"
+"""
+Every other layer is filled with the boxes turned by 90°, as many as fit the footprint of the first layer.
+"""
+
+ROTATED = "rotated"
+"""
+Every other layer is the first one rotated by layer_rotation about the center of the pallet.
+"""
+
+
+class PalletPattern:
+    def __init__(self, box, columns, rows, layers, gap=0.0, mode=GRID, layer_rotation=90.0, origin=None,
+                 tool_rpy=(180.0, 0.0, 0.0)):
+        """
+        The slots of a pallet. Layouts are computed once per layer parity and all slots of all
+        layers are transformed as one batch.
+        :param box: (length along the pallet x axis, width along y, height) [mm]
+        :param columns: boxes along x in the first layer
+        :param rows: boxes along y in the first layer
+        :param layers: number of layers
+        :param gap: space between neighbouring boxes [mm]
+        :param mode: GRID, INTERLOCKED or ROTATED
+        :param layer_rotation: rotation of the odd layers in ROTATED mode [°]
+        :param origin: pallet frame in the base frame, [x, y, z, rx, ry, rz], the corner of the first
+                       layer's footprint on the pallet surface, z pointing up; the base frame if None
+        :param tool_rpy: orientation of the TCP at a slot relative to the pallet frame for a box at 0°,
+                         the default points the tool z axis down into the box
+        """
+        if mode not in (GRID, INTERLOCKED, ROTATED):
+            raise ValueError(f"Invalid pallet mode {mode}")
+        if columns < 1 or rows < 1 or layers < 1:
+            raise ValueError("A pallet needs at least one column, row and layer")
+        self.box = np.asarray(box, dtype=float)
+        self.columns = columns
+        self.rows = rows
+        self.layers = layers
+        self.gap = gap
+        self.mode = mode
+        self.layer_rotation = layer_rotation
+        self.origin = pose_to_matrix(np.zeros(6) if origin is None else origin)
+        self.tool = rpy_to_matrix(tool_rpy)
+        self.footprint = np.array([columns * (self.box[0] + gap) - gap, rows * (self.box[1] + gap) - gap])
+
+    @staticmethod
+    def grid(columns, rows, pitch_x, pitch_y):
+        """
+        :return: (columns * rows, 2) centers of a grid centered on 0, row by row
+        """
+        x = (np.arange(columns) - (columns - 1) / 2.0) * pitch_x
+        y = (np.arange(rows) - (rows - 1) / 2.0) * pitch_y
+        xs, ys = np.meshgrid(x, y)
+        return np.stack([xs.ravel(), ys.ravel()], axis=-1)
+
+    def layout(self, odd):
+        """
+        :param odd: whether the layout of the odd layers is wanted
+        :return: (centers (M, 2) relative to the center of the footprint, yaw of the boxes [°])
+        """
+        length, width = self.box[0] + self.gap, self.box[1] + self.gap
+        centers = self.grid(self.columns, self.rows, length, width)
+        if not odd or self.mode == GRID:
+            return centers, 0.0
+        if self.mode == INTERLOCKED:
+            extent = self.footprint + self.gap
+            columns, rows = int(extent[0] // width), int(extent[1] // length)
+            return self.grid(columns, rows, width, length), 90.0
+        a = np.radians(self.layer_rotation)
+        rotation = np.array([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+        return centers @ rotation.T, self.layer_rotation
+
+    def plan(self, approach=100.0, retreat=100.0):
+        """
+        :param approach: distance of the approach pose above a slot along the tool z axis [mm]
+        :param retreat: lift after releasing, along the base z axis [mm]
+        :return: the PalletPlan of all slots, layer by layer
+        """
+        layouts = [self.layout(False), self.layout(True)]
+        counts = [len(layouts[layer % 2][0]) for layer in range(self.layers)]
+        layer_index = np.repeat(np.arange(self.layers), counts)
+        centers = np.concatenate([layouts[layer % 2][0] for layer in range(self.layers)])
+        yaw = np.repeat([layouts[layer % 2][1] for layer in range(self.layers)], counts)
+
+        local = np.zeros((len(centers), 4, 4))
+        local[:, :2, 3] = centers + self.footprint / 2.0
+        local[:, 2, 3] = (layer_index + 1) * self.box[2]
+        local[:, 3, 3] = 1.0
+        turns = np.zeros((len(centers), 3))
+        turns[:, 2] = yaw
+        local[:, :3, :3] = rpy_to_matrix(turns) @ self.tool
+        slots = PoseBatch.wrap(matrix_to_pose(self.origin @ local))
+        return PalletPlan(slots, compute_pre_pick(slots, approach, 0.0), compute_post_pick(slots, retreat, 0.0),
+                          layer_index, approach, retreat)
+
+
+class PalletPlan:
+    def __init__(self, slots: PoseBatch, approaches: PoseBatch, retreats: PoseBatch, layers, approach, retreat):
+        """
+        The poses of every slot of a pallet, in placing order.
+        :param slots: TCP at the top face of each placed box
+        :param approaches: above each slot
+        :param retreats: after releasing each box
+        :param layers: layer of each slot
+        """
+        self.slots = slots
+        self.approaches = approaches
+        self.retreats = retreats
+        self.layers = layers
+        self.approach = approach
+        self.retreat = retreat
+
+    def __len__(self):
+        return len(self.slots)
+
+    def program(self, motion: apis.Motion, pick=None, gripper: apis.Gripper = None, open_pos=100, close_pos=0,
+                start=0, end=None, blend_radius=20.0, vel=-1) -> list:
+        """
+        The motion sequence placing the boxes of slots start to end. Moves between approach and
+        retreat poses blend, the moves onto the pick pose and a slot stop there.
+        :param motion: the Motion, with set_kinematics the joint positions are completed locally
+        :param pick: pose where every box is picked up, None to only place
+        :param gripper: the gripper closed at pick and opened at each slot, None for no gripper commands
+        :param open_pos: gripper position releasing a box
+        :param close_pos: gripper position holding a box
+        :param start: first slot, e.g. to resume an interrupted pallet
+        :param end: slot after the last one, all remaining slots if None
+        :param blend_radius: blend radius of the approach and retreat moves [mm]
+        :param vel: speed percentage, the speed of motion if negative
+        :return: list of RobotApis
+        """
+        end = len(self) if end is None else min(end, len(self))
+        if not 0 <= start <= end:
+            raise ValueError(f"Invalid slot range {start}..{end}")
+        if pick is not None:
+            pick_approach = compute_pre_pick(pick, self.approach, 0.0)
+            pick_retreat = compute_post_pick(pick, self.retreat, 0.0)
+        program = []
+        for i in range(start, end):
+            if pick is not None:
+                program.append(motion.move_line(pick_approach, vel=vel, blend_radius=blend_radius))
+                program.append(motion.move_line(pick, vel=vel))
+                if gripper is not None:
+                    program.append(gripper.move(close_pos))
+                program.append(motion.move_line(pick_retreat, vel=vel, blend_radius=blend_radius))
+            program.append(motion.move_line(self.approaches[i], vel=vel, blend_radius=blend_radius))
+            program.append(motion.move_line(self.slots[i], vel=vel))
+            if gripper is not None:
+                program.append(gripper.move(open_pos))
+            blend = -1.0 if i == end - 1 else blend_radius
+            program.append(motion.move_line(self.retreats[i], vel=vel, blend_radius=blend))
+        return program
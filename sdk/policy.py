@@ -0,0 +1,141 @@
+import concurrent.futures
+import http.client
+import random
+import threading
+import time
+import xmlrpc.client
+
+TIMEOUT_ERRORS = (TimeoutError, concurrent.futures.TimeoutError)
+"""
+What Future.result raises on a timeout: before Python 3.11 concurrent.futures.TimeoutError is
+not the builtin TimeoutError and not an OSError.
+"""
+
+TRANSPORT_ERRORS = (OSError, xmlrpc.client.ProtocolError, http.client.HTTPException, concurrent.futures.TimeoutError)
+"""
+Exceptions meaning the controller could not be reached, as opposed to the controller
+answering with an error code. The builtin TimeoutError is an OSError.
+"""
+
+
+class CallPolicy:
+    """
+    How Robot.call runs one API: timeout, and retries for queries.
+
+    Retries only apply to APIs returning data (getters, computations), which are idempotent.
+    Commands (only_error_code APIs) are never repeated, a repeated move is not harmless.
+    Only transport failures are retried, an error code from the controller is final.
+    """
+
+    def __init__(self, timeout=None, retries=0, backoff=0.05, max_backoff=1.0, jitter=0.5):
+        """
+        :param timeout: seconds to wait for the RPC, None to wait forever
+        :param retries: extra attempts for queries after a transport failure
+        :param backoff: delay before the first retry, doubled for each further one, in seconds
+        :param max_backoff: upper bound of the delay, in seconds
+        :param jitter: fraction of the delay that is randomized, spreads out reconnect storms
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """
+        :param attempt: 0 for the first retry
+        :return: seconds to sleep before the retry
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * (1.0 - self.jitter * random.random())
+
+
+DEFAULT_POLICIES = {
+    None: CallPolicy(timeout=2.0),
+    "Common": CallPolicy(timeout=1.0, retries=2),
+    "Safety": CallPolicy(timeout=2.0, retries=2),
+    # blocking moves (blend -1) only return at the target
+    "Motion": CallPolicy(timeout=120.0),
+    "Motion.servo_cart": CallPolicy(timeout=0.5),
+    "Motion.servo_joint": CallPolicy(timeout=0.5),
+    "Motion.jog_move": CallPolicy(timeout=0.5),
+    "Motion.jog_stop": CallPolicy(timeout=0.5),
+    "Motion.jog_stop_immediately": CallPolicy(timeout=0.5),
+    "Motion.stop_motion": CallPolicy(timeout=1.0),
+    # blocking moves wait up to maxtime, at most 30 s
+    "Gripper": CallPolicy(timeout=35.0, retries=2),
+    "Safety.wait_ms": CallPolicy(timeout=None),
+    "Safety.wait_ms_internal": CallPolicy(timeout=None),
+}
+"""
+Policies by API class ("Motion") or by API name ("Motion.servo_cart"), the more specific wins.
+The None entry applies to everything else.
+"""
+
+
+class CircuitBreaker:
+    """
+    Fails fast while the controller is unreachable.
+
+    After failure_threshold consecutive transport failures the circuit opens and calls are
+    rejected without touching the network. After reset_timeout one trial call is let through;
+    its success closes the circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, reset_timeout=2.0):
+        """
+        :param failure_threshold: consecutive failures opening the circuit
+        :param reset_timeout: seconds before a trial call is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        :return: whether a call may go out now
+        """
+        if self.state == self.CLOSED:
+            return True
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def on_success(self) -> bool:
+        """
+        :return: whether this closed an open circuit
+        """
+        if self.state != self.CLOSED or self.failures:
+            with self.lock:
+                closed = self.state != self.CLOSED
+                self.state = self.CLOSED
+                self.failures = 0
+                return closed
+        return False
+
+    def on_abort(self):
+        """
+        A call failed without telling whether the controller is reachable: a trial call
+        opens the circuit again instead of leaving it half open for good.
+        """
+        if self.state == self.HALF_OPEN:
+            with self.lock:
+                if self.state == self.HALF_OPEN:
+                    self.state = self.OPEN
+                    self.opened_at = time.monotonic()
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
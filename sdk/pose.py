@@ -0,0 +1,189 @@
+import numpy as np
+
+# 机器人参数单位说明：机器人位置单位为毫米(mm)，姿态单位为度(°)。
+# SI: [m] [rad]
+
+POSE_TO_SI = np.array([1e-3, 1e-3, 1e-3, np.pi / 180.0, np.pi / 180.0, np.pi / 180.0])
+POSE_FROM_SI = 1.0 / POSE_TO_SI
+DEG_TO_RAD = np.pi / 180.0
+RAD_TO_DEG = 180.0 / np.pi
+
+
+class _Vector6:
+    __slots__ = ("data",)
+
+    def __init__(self, data=None):
+        if data is None:
+            self.data = np.zeros(6)
+        else:
+            self.data = np.array(data, dtype=float).reshape(6)
+
+    @classmethod
+    def wrap(cls, data: np.ndarray):
+        """
+        Wrap a float array of shape (6,) without copying it.
+        """
+        obj = cls.__new__(cls)
+        obj.data = data
+        return obj
+
+    def tolist(self) -> list:
+        """
+        :return: the RPC argument format, a list of 6 python floats
+        """
+        return self.data.tolist()
+
+    def copy(self):
+        return self.wrap(self.data.copy())
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __len__(self):
+        return 6
+
+    def __iter__(self):
+        return iter(self.data.tolist())
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    def __add__(self, other):
+        return self.wrap(self.data + np.asarray(other, dtype=float))
+
+    def __sub__(self, other):
+        return self.wrap(self.data - np.asarray(other, dtype=float))
+
+    def __mul__(self, other):
+        return self.wrap(self.data * np.asarray(other, dtype=float))
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return type(self) is type(other) and np.array_equal(self.data, other.data)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.data.tolist()})"
+
+
+class Pose(_Vector6):
+    """
+    笛卡尔位姿 [x, y, z, rx, ry, rz]，单位[mm][°]
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_si(cls, data):
+        """
+        :param data: [x, y, z, rx, ry, rz] in [m][rad]
+        """
+        return cls.wrap(np.asarray(data, dtype=float).reshape(6) * POSE_FROM_SI)
+
+    def to_si(self) -> np.ndarray:
+        """
+        :return: [x, y, z, rx, ry, rz] in [m][rad]
+        """
+        return self.data * POSE_TO_SI
+
+    @property
+    def position(self) -> np.ndarray:
+        return self.data[:3]
+
+    @property
+    def orientation(self) -> np.ndarray:
+        return self.data[3:]
+
+
+class JointState(_Vector6):
+    """
+    关节位置 [j1, j2, j3, j4, j5, j6]，单位[°]
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_si(cls, data):
+        """
+        :param data: joint angles in [rad]
+        """
+        return cls.wrap(np.asarray(data, dtype=float).reshape(6) * RAD_TO_DEG)
+
+    def to_si(self) -> np.ndarray:
+        """
+        :return: joint angles in [rad]
+        """
+        return self.data * DEG_TO_RAD
+
+
+class PoseBatch:
+    """
+    N 个笛卡尔位姿，shape (N, 6)，单位[mm][°]
+
+    Arithmetic broadcasts: adding a Pose offsets every pose of the batch.
+    """
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = np.array(data, dtype=float).reshape(-1, 6)
+
+    @classmethod
+    def wrap(cls, data: np.ndarray):
+        obj = cls.__new__(cls)
+        obj.data = data
+        return obj
+
+    @classmethod
+    def from_poses(cls, poses):
+        return cls.wrap(np.array([np.asarray(pose, dtype=float) for pose in poses]).reshape(-1, 6))
+
+    @classmethod
+    def from_si(cls, data):
+        return cls.wrap(np.asarray(data, dtype=float).reshape(-1, 6) * POSE_FROM_SI)
+
+    def to_si(self) -> np.ndarray:
+        return self.data * POSE_TO_SI
+
+    def tolist(self) -> list:
+        """
+        :return: one RPC argument list per pose
+        """
+        return self.data.tolist()
+
+    @property
+    def positions(self) -> np.ndarray:
+        return self.data[:, :3]
+
+    @property
+    def orientations(self) -> np.ndarray:
+        return self.data[:, 3:]
+
+    def __array__(self, dtype=None, copy=None):
+        return self.data if dtype is None else self.data.astype(dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        for row in self.data:
+            yield Pose.wrap(row)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            return Pose.wrap(self.data[item])
+        return self.wrap(self.data[item])
+
+    def __add__(self, other):
+        return self.wrap(self.data + np.asarray(other, dtype=float))
+
+    def __sub__(self, other):
+        return self.wrap(self.data - np.asarray(other, dtype=float))
+
+    def __mul__(self, other):
+        return self.wrap(self.data * np.asarray(other, dtype=float))
+
+    __rmul__ = __mul__
+
+    def __repr__(self):
+        return f"PoseBatch({len(self.data)} poses)"
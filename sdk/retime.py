@@ -0,0 +1,332 @@
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def _limits(values):
+    return np.broadcast_to(np.asarray(values, dtype=float), (6,)).copy()
+
+
+def _passes(ds, mvc, a, b):
+    """
+    Largest x = (ds/dt)² under mvc that starts and ends at rest and respects lower/upper path
+    accelerations -a - b x <= s'' <= a - b x of every joint.
+    """
+    n = len(mvc)
+    x = mvc.tolist()
+    x[0] = x[-1] = 0.0
+    a = a.tolist()
+    b = b.tolist()
+    ds = ds.tolist()
+    for i in range(n - 1):
+        xi = x[i]
+        upper = min(ai - bi * xi for ai, bi in zip(a[i], b[i]))
+        reach = xi + 2.0 * ds[i] * upper
+        if reach < x[i + 1]:
+            x[i + 1] = reach if reach > 0.0 else 0.0
+    for i in range(n - 1, 0, -1):
+        xi = x[i]
+        lower = max(-ai - bi * xi for ai, bi in zip(a[i], b[i]))
+        reach = xi - 2.0 * ds[i - 1] * lower
+        if reach < x[i - 1]:
+            x[i - 1] = reach if reach > 0.0 else 0.0
+    return np.array(x)
+
+
+def _times(ds, x):
+    root = np.sqrt(np.maximum(x, 0.0))
+    speed = root[:-1] + root[1:]
+    dt = np.where(speed > 0.0, 2.0 * ds / np.maximum(speed, 1e-12), 0.0)
+    return np.concatenate([[0.0], np.cumsum(dt)])
+
+
+def retime(path, vel, acc, jerk=None, period=0.008, iterations=8):
+    """
+    Time-optimal timing of a joint path from rest to rest, by forward and backward integration of
+    x = (ds/dt)² along the arc length s in joint space.
+
+    The path is followed exactly through its samples, which should be dense enough to be
+    interpolated linearly. Velocity and acceleration limits are met at the samples, up to the
+    discretization of the path.
+
+    The jerk limit holds for the setpoints the controller gets, the path resampled every period
+    (see resample), by finite differences. The path speed is averaged over the time the largest
+    acceleration swing takes at the limit, then slowed down locally where the setpoints still
+    exceed it, at most iterations times; whatever remains is removed by the smallest uniform
+    stretch of the whole timing that is within the limit. Paths whose curvature jumps, e.g. line
+    segments joined without blending, can need a much longer timing than without a jerk limit.
+    :param path: (N, 6) joint positions [°]
+    :param vel: velocity limit per joint, or one for all [°/s]
+    :param acc: acceleration limit per joint, or one for all [°/s²]
+    :param jerk: jerk limit per joint, or one for all [°/s³], None for no limit
+    :param period: setpoint period the jerk limit applies to [s]
+    :return: (N,) time of each sample [s], starting at 0
+    """
+    path = np.asarray(path, dtype=float)
+    n = len(path)
+    if n < 2:
+        return np.zeros(n)
+    vel, acc = _limits(vel), _limits(acc)
+    steps = np.linalg.norm(np.diff(path, axis=0), axis=1)
+    keep = np.concatenate([[True], steps > 1e-9])
+    if not keep.all():
+        # repeated samples take no time
+        inner = retime(path[keep], vel, acc, jerk, period, iterations)
+        return inner[np.cumsum(keep) - 1]
+
+    ds = steps
+    s = np.concatenate([[0.0], np.cumsum(ds)])
+    dq = np.gradient(path, s, axis=0)  # q'(s)
+    ddq = np.gradient(dq, s, axis=0)  # q''(s)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        moving = np.abs(dq) > 1e-9
+        a = np.where(moving, acc / np.abs(dq), np.inf)
+        b = np.where(moving, ddq / dq, 0.0)
+        # maximum velocity curve: joint velocity, and acceleration where a joint only curves
+        mvc = np.min(np.where(moving, (vel / np.abs(dq)) ** 2, np.inf), axis=1)
+        curving = np.where(~moving & (np.abs(ddq) > 1e-9), acc / np.abs(ddq), np.inf)
+    mvc = np.minimum(mvc, curving.min(axis=1))
+    # where |q'| is small, a and b are huge but cancel against mvc; keep the pass arithmetic finite
+    a = np.minimum(a, 1e12)
+    b = np.clip(b, -1e12, 1e12)
+
+    x = _passes(ds, mvc, a, b)
+    if jerk is None:
+        return _times(ds, x)
+    jerk = _limits(jerk)
+    # a joint acceleration swings by at most 2 acc; averaging the path speed over the time this
+    # takes at the jerk limit turns each switch of the bang-bang profile into a ramp within it
+    window = float(np.max(2.0 * acc / jerk))
+    target = mvc  # what the passes aim for, lowered where the result is too fast or too jerky
+    for _ in range(iterations):
+        times, speed = _smooth(ds, x, window)
+        over = speed ** 2 > mvc * 1.001
+        if over.any():
+            # the average overshoots ahead of dips of the maximum velocity curve: lower it there
+            target = np.where(over, target * mvc / np.maximum(speed ** 2, 1e-12), target)
+        else:
+            ratio = jerk_ratio(path, times, jerk, period)
+            if ratio.max(initial=0.0) <= 1.0:
+                return times
+            # where the path curves smoothly jerk grows with the cube of the path speed, at a
+            # corner between two samples only linearly: slow down for the latter, x is the square
+            # of the speed; setpoint k of the differences spans the times k to k + 3 periods
+            factor = np.ones(n)
+            for k in np.nonzero(ratio > 1.0)[0]:
+                first, last = np.searchsorted(times, [(k - 1) * period, (k + 4) * period])
+                factor[first:last] = np.minimum(factor[first:last], max(0.25, ratio[k] ** -2.0))
+            target = np.minimum(target, speed ** 2 * factor)
+        x = _passes(ds, target, a, b)
+    times, speed = _smooth(ds, x, window)
+    # stretching the timing by k divides the speed by k and the jerk at least by k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fast = float(np.max(np.where(mvc > 0, speed ** 2 / mvc, 0.0), initial=0.0)) ** 0.5
+    low = max(1.0, fast * 1.001)
+    if jerk_ratio(path, times * low, jerk, period).max(initial=0.0) <= 1.0:
+        return times * low
+    high = low * max(1.0, float(jerk_ratio(path, times * low, jerk, period).max())) * 1.001
+    while jerk_ratio(path, times * high, jerk, period).max(initial=0.0) > 1.0:
+        high *= 2.0
+    # the smallest stretch that is within the limit
+    for _ in range(12):
+        middle = (low + high) / 2.0
+        if jerk_ratio(path, times * middle, jerk, period).max(initial=0.0) > 1.0:
+            low = middle
+        else:
+            high = middle
+    return times * high
+
+
+def jerk_ratio(path, times, jerk, period=0.008) -> np.ndarray:
+    """
+    :return: (M,) largest ratio of setpoint jerk to the jerk limit over the joints, for the setpoints
+             of resample(path, times, period) by finite differences
+    """
+    setpoints = resample(path, times, period)
+    if len(setpoints) < 4:
+        return np.zeros(0)
+    return (np.abs(np.diff(setpoints, n=3, axis=0)) / period ** 3 / _limits(jerk)).max(axis=1)
+
+
+def _smooth(ds, x, window, resolution=0.001):
+    """
+    :return: (times, path speed at the samples) after a moving average of the path speed over window [s]
+    """
+    times = _times(ds, x)
+    s = np.concatenate([[0.0], np.cumsum(ds)])
+    steps = max(1, int(np.ceil(window / resolution)))
+    dt = window / steps
+    grid = np.arange(0.0, times[-1] + dt, dt)
+    total = np.cumsum(np.concatenate([np.zeros(steps), np.interp(grid, times, np.sqrt(np.maximum(x, 0.0))),
+                                      np.zeros(steps)]))
+    speed = (total[steps:] - total[:-steps]) / steps
+    travelled = np.concatenate([[0.0], np.cumsum((speed[:-1] + speed[1:]) / 2.0 * dt)])
+    travelled *= s[-1] / travelled[-1]
+    moving = np.concatenate([[True], np.diff(travelled) > 0.0])
+    smooth_times = np.interp(s, travelled[moving], np.arange(len(travelled))[moving] * dt)
+    return smooth_times, np.interp(s, travelled[moving], speed[moving])
+
+
+def split_points(path, stops=()):
+    """
+    Samples where the arm is at rest in any time-optimal timing: the ends, cusps where the path
+    turns back, and the given stops. Pieces between them can be timed independently.
+    """
+    path = np.asarray(path, dtype=float)
+    steps = np.diff(path, axis=0)
+    turns = np.einsum('ij,ij->i', steps[:-1], steps[1:]) < 0.0
+    points = set(np.nonzero(turns)[0] + 1) | {0, len(path) - 1} | {int(i) for i in stops if 0 < i < len(path) - 1}
+    return sorted(points)
+
+
+def resample(path, times, period=0.008):
+    """
+    The path at the setpoints of a timing. The arc length is interpolated in time with a monotone
+    cubic at rest at both ends, so the path speed is continuous between samples, and the joints
+    linearly along the arc length; the last setpoint holds the end of the path.
+    :return: (M, 6) the path sampled every period seconds along times, e.g. for Motion.servo_joint
+    """
+    path = np.asarray(path, dtype=float)
+    times = np.asarray(times, dtype=float)
+    s = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))])
+    t = np.arange(int(np.ceil(times[-1] / period - 1e-9)) + 1) * period
+    unique = np.concatenate([[True], np.diff(times) > 0])
+    knots, arc = times[unique], s[unique]
+    if len(knots) < 2:
+        return np.repeat(path[-1:], len(t), axis=0)
+    h = np.diff(knots)
+    secant = np.diff(arc) / h
+    # slope of the parabola through the neighbouring knots, limited to keep the cubic monotone
+    # (Fritsch-Carlson), 0 at the ends
+    slope = np.zeros(len(knots))
+    slope[1:-1] = (h[1:] * secant[:-1] + h[:-1] * secant[1:]) / (h[:-1] + h[1:])
+    slope[1:-1] = np.clip(slope[1:-1], 0.0, 3.0 * np.minimum(secant[:-1], secant[1:]))
+    k = np.clip(np.searchsorted(knots, t, side="right") - 1, 0, len(h) - 1)
+    u = np.clip((t - knots[k]) / h[k], 0.0, 1.0)
+    u2, u3 = u * u, u * u * u
+    arc_t = ((2 * u3 - 3 * u2 + 1) * arc[k] + (u3 - 2 * u2 + u) * h[k] * slope[k]
+             + (-2 * u3 + 3 * u2) * arc[k + 1] + (u3 - u2) * h[k] * slope[k + 1])
+    moving = np.concatenate([[True], np.diff(s) > 0])
+    return np.stack([np.interp(arc_t, s[moving], path[moving, j]) for j in range(path.shape[1])], axis=1)
+
+
+def _retime_piece(args):
+    piece, vel, acc, jerk, period = args
+    return retime(piece, vel, acc, jerk, period)
+
+
+class Retimer:
+    def __init__(self, vel=180.0, acc=720.0, jerk=None, period=0.008, workers=None, cache_size=64,
+                 cache_dir=None):
+        """
+        Retimes paths on a process pool, with a cache by path and limits.
+        :param vel: joint velocity limits at 100% [°/s]
+        :param acc: joint acceleration limits at 100% [°/s²]
+        :param jerk: joint jerk limits at 100% [°/s³], None for none
+        :param period: setpoint period the jerk limits apply to [s], see retime
+        :param workers: number of processes, one per core if None
+        :param cache_size: number of timings kept in memory
+        :param cache_dir: directory where timings are also stored as .npy, None for memory only
+        """
+        self.vel = _limits(vel)
+        self.acc = _limits(acc)
+        self.jerk = None if jerk is None else _limits(jerk)
+        self.period = period
+        self.workers = workers
+        self.executor = None
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+
+    def limits(self, motion=None):
+        """
+        :param motion: the sdk.apis.Motion whose vel and acc percentages scale the limits, 100% if None
+        :return: (vel, acc, jerk) limits
+        """
+        if motion is None:
+            return self.vel, self.acc, self.jerk
+        vel, acc = motion.vel / 100.0, motion.acc / 100.0
+        return self.vel * vel, self.acc * acc, None if self.jerk is None else self.jerk * acc
+
+    @staticmethod
+    def key(path, limits, stops, period) -> str:
+        digest = hashlib.sha1(np.ascontiguousarray(path).tobytes())
+        for limit in limits:
+            digest.update(b"-" if limit is None else np.ascontiguousarray(limit).tobytes())
+        digest.update(np.asarray(stops, dtype=np.int64).tobytes())
+        digest.update(np.float64(period).tobytes())
+        return digest.hexdigest()
+
+    def lookup(self, key):
+        """
+        :return: a copy of the cached timing, None if there is none
+        """
+        times = self.cache.get(key)
+        if times is not None:
+            self.cache.move_to_end(key)
+            return times.copy()
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + ".npy")
+            if os.path.exists(path):
+                times = np.load(path)
+                self.store(key, times, disk=False)
+                return times.copy()
+        return None
+
+    def store(self, key, times, disk=True):
+        self.cache[key] = times
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        if disk and self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(os.path.join(self.cache_dir, key + ".npy"), times)
+
+    def retime(self, paths, motion=None, stops=None) -> list:
+        """
+        Time several paths. Each path is split where the arm is at rest anyway (see split_points) and
+        all pieces of all paths not in the cache are timed in parallel; a path without cusps or stops
+        is a single piece, the passes run along it.
+        :param paths: list of (N, 6) joint paths [°]
+        :param motion: the Motion whose percentages scale the limits
+        :param stops: per path, sample indices where the arm has to stop, e.g. to grip
+        :return: per path, (N,) time of each sample [s]
+        """
+        limits = self.limits(motion)
+        paths = [np.asarray(path, dtype=float) for path in paths]
+        stops = stops if stops is not None else [()] * len(paths)
+        results = [None] * len(paths)
+        tasks, owners = [], []
+        for index, (path, path_stops) in enumerate(zip(paths, stops)):
+            key = self.key(path, limits, sorted(path_stops), self.period)
+            times = self.lookup(key)
+            if times is not None:
+                results[index] = times
+                continue
+            points = split_points(path, path_stops)
+            for start, end in zip(points[:-1], points[1:]):
+                tasks.append((path[start:end + 1], *limits, self.period))
+                owners.append((index, key, start))
+        if tasks:
+            if len(tasks) == 1:
+                pieces = [_retime_piece(tasks[0])]
+            else:
+                if self.executor is None:
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                pieces = list(self.executor.map(_retime_piece, tasks, chunksize=max(1, len(tasks) // 64)))
+            assembled = {}
+            for (index, key, start), piece in zip(owners, pieces):
+                times = assembled.setdefault(index, (key, np.zeros(len(paths[index]))))[1]
+                times[start:start + len(piece)] = times[start] + piece
+            for index, (key, times) in assembled.items():
+                self.store(key, times)
+                # the caller's copy, the cache keeps its own
+                results[index] = times.copy()
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,160 @@
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of running threads from a background thread (sys._current_frames),
+    and writes them as collapsed stacks, the input format of flamegraph.pl and speedscope.
+
+    Nothing runs until a profile is requested, so it can stay installed in production.
+    While sampling, the cost for the profiled threads is the GIL hand-over of one stack
+    walk per interval.
+    """
+
+    def __init__(self, robot=None, threads=None, interval=0.005, directory="."):
+        """
+        :param robot: the robot whose RPC statistics are written into the profile header
+        :param threads: the threads to sample (threading.Thread), all but the sampler if None
+        :param interval: time between samples [s]
+        :param directory: where profiles are written
+        """
+        self.robot = robot
+        self.threads = threads
+        self.interval = interval
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.running = None
+        self.last_path = None
+
+    def sample(self, duration) -> Counter:
+        """
+        Sample for duration seconds, in the calling thread.
+        :return: collapsed stack -> number of samples
+        """
+        stacks = Counter()
+        own = threading.get_ident()
+        idents = None if self.threads is None else {thread.ident: thread.name for thread in self.threads}
+        names = {}
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (idents is not None and ident not in idents):
+                    continue
+                if ident not in names:
+                    names[ident] = idents[ident] if idents is not None else _thread_name(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names[ident])
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+    def profile(self, duration=5.0, path=None) -> str:
+        """
+        Sample for duration seconds and write the profile.
+        :param path: output file, a timestamped one in directory if None
+        :return: the path written
+        """
+        started = time.time()
+        rpc_before = self.robot.stats.snapshot() if self.robot is not None else {}
+        stacks = self.sample(duration)
+        if path is None:
+            name = time.strftime("profile-%Y%m%d-%H%M%S.collapsed", time.localtime(started))
+            path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write(f"# profile {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started))} "
+                    f"duration {duration}s interval {self.interval}s\n")
+            if self.robot is not None:
+                f.write("# rpc name calls_in_profile mean_ms ewma_ms max_ms\n")
+                for name, stat in sorted(self.robot.stats.snapshot().items()):
+                    before = rpc_before.get(name)
+                    calls = stat["count"] - (before["count"] if before else 0)
+                    f.write(f"# rpc {name} {calls} {stat['mean_ms']:.3f} {stat['ewma_ms']:.3f} {stat['max_ms']:.3f}\n")
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self.last_path = path
+        return path
+
+    def start(self, duration=5.0) -> bool:
+        """
+        Profile in a background thread. Safe in a signal handler: it never waits for the lock,
+        which a profile requested over the socket holds for its whole duration.
+        :return: False if a profile is already running
+        """
+        if not self.lock.acquire(blocking=False):
+            return False
+        try:
+            if self.running is not None and self.running.is_alive():
+                return False
+            self.running = threading.Thread(target=self.profile, args=(duration,), daemon=True, name="profiler")
+            self.running.start()
+            return True
+        finally:
+            self.lock.release()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR2", None), duration=5.0):
+        """
+        Profile for duration seconds whenever the process receives signum, e.g. kill -USR2 <pid>.
+        The signal is ignored while a profile is running. Must be called from the main thread.
+        """
+        if signum is None:
+            raise RuntimeError("signals are not available on this platform")
+        signal.signal(signum, lambda *_: self.start(duration))
+
+    def install_socket(self, path=None):
+        """
+        Listen on a local Unix socket. Send "profile <seconds>" to it, e.g. with
+        `echo profile 10 | nc -U <path>`, and the path of the profile comes back when it is done.
+        :param path: socket path, /tmp/rosjoy-profiler-<pid>.sock if None
+        :return: the socket path
+        """
+        if path is None:
+            path = f"/tmp/rosjoy-profiler-{os.getpid()}.sock"
+        if os.path.exists(path):
+            os.unlink(path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen(1)
+        threading.Thread(target=self.serve, args=(server,), daemon=True, name="profiler-control").start()
+        return path
+
+    def serve(self, server):
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                try:
+                    words = connection.recv(256).decode(errors="replace").split()
+                    if not words or words[0] != "profile":
+                        connection.sendall(b"usage: profile [seconds]\n")
+                        continue
+                    duration = float(words[1]) if len(words) > 1 else 5.0
+                    if not self.lock.acquire(blocking=False):
+                        connection.sendall(b"busy\n")
+                        continue
+                    try:
+                        path = self.profile(min(duration, 300.0))
+                    finally:
+                        self.lock.release()
+                    connection.sendall(f"{path}\n".encode())
+                except (OSError, ValueError) as e:
+                    try:
+                        connection.sendall(f"error {e}\n".encode())
+                    except OSError:
+                        pass
+
+
+def _thread_name(ident):
+    for thread in threading.enumerate():
+        if thread.ident == ident:
+            return thread.name
+    return str(ident)
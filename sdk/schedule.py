@@ -0,0 +1,205 @@
+import time
+
+import numpy as np
+
+from sdk import apis
+from sdk.base import Robot, RobotApi
+
+ARM = "arm"
+GRIPPER = "gripper"
+INSTANT = "instant"
+
+
+class Task:
+    def __init__(self, api: RobotApi, kind, conditions, target, tolerance, name):
+        self.api = api
+        self.kind = kind
+        self.conditions = conditions
+        self.target = None if target is None else np.asarray(target, dtype=float)[:3]
+        self.tolerance = tolerance
+        self.name = name
+        self.started = None  # time.monotonic() when issued
+        self.finished = None  # time.monotonic() when seen complete
+
+    def __repr__(self):
+        return f"Task({self.name})"
+
+
+class Started:
+    def __init__(self, task: Task):
+        """
+        Satisfied once task has been issued.
+        """
+        self.task = task
+
+    def satisfied(self, graph):
+        return self.task.started is not None
+
+
+class Finished:
+    def __init__(self, task: Task):
+        """
+        Satisfied once task has completed, the scheduler polls for it.
+        """
+        self.task = task
+
+    def satisfied(self, graph):
+        return self.task.finished is not None
+
+
+class Near:
+    def __init__(self, task: Task, distance):
+        """
+        Satisfied once the TCP is within distance of the target of an arm task,
+        e.g. to start closing the gripper before the arm arrives.
+        :param task: an arm task with a target
+        :param distance: [mm]
+        """
+        if task.target is None:
+            raise ValueError(f"{task} has no target")
+        self.task = task
+        self.distance = distance
+
+    def satisfied(self, graph):
+        if self.task.finished is not None:
+            return True
+        if self.task.started is None:
+            return False
+        position = graph.tcp_position()
+        return float(np.linalg.norm(position - self.task.target)) <= self.distance
+
+
+class TaskGraph:
+    """
+    Runs RobotApi calls as a dependency graph, so independent actuators overlap.
+
+    The scheduler is a single thread: the RPC connection serializes calls anyway, and the
+    controller executes motion on its own once a non-blocking command is accepted. Tasks
+    are issued as soon as their conditions hold; completion is only polled while some
+    waiting task depends on it, with one query per actuator per poll, and the TCP pose only
+    while a Near condition is pending.
+
+    Commands have to be non-blocking for anything to overlap: move_line/move_joint with
+    a blend radius/time >= 0, and Gripper.move(block=False). Arm motions are executed by
+    the controller in the order they were issued.
+
+    Right after a non-blocking command the controller may still report the actuator idle,
+    so an idle actuator only completes its tasks once it was seen busy after the last one
+    was issued, or settle seconds after it, and for an arm task with a target once the TCP
+    is at the target.
+    """
+
+    def __init__(self, robot: Robot, poll_interval=0.01, settle=0.2):
+        """
+        :param robot: the robot
+        :param poll_interval: pause between completion polls [s]
+        :param settle: time after issuing a task within which an idle actuator that was not seen busy
+                       does not count as done [s]
+        """
+        self.robot = robot
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.tasks = []
+        self.position = None
+        self.position_time = None
+        self.last = {ARM: None, GRIPPER: None}  # the task issued last to each actuator
+        self.busy = {ARM: False, GRIPPER: False}  # whether the actuator was seen busy since
+
+    def add(self, api: RobotApi, after=(), when=(), target=None, tolerance=0.5, name=None) -> Task:
+        """
+        :param api: the API to call
+        :param after: tasks that have to finish before this one is issued
+        :param when: further conditions: Started, Finished or Near
+        :param target: [x, y, z, ...] the TCP moves to, for Near and to detect completion of an
+                       arm motion while later ones are queued behind it
+        :param tolerance: distance to target that counts as arrived [mm]
+        :param name: for reports, the API name if None
+        """
+        prefix = api.name.split(".")[0]
+        kind = ARM if prefix == "Motion" else GRIPPER if prefix == "Gripper" else INSTANT
+        conditions = [Finished(task) for task in after] + list(when)
+        task = Task(api, kind, conditions, target, tolerance, name or api.name)
+        self.tasks.append(task)
+        return task
+
+    def tcp_position(self):
+        if self.position is None:
+            self.position = np.asarray(self.robot.call(apis.Common.get_actual_tcp_pose()))[:3]
+        return self.position
+
+    def run(self, timeout=None) -> dict:
+        """
+        Issue all tasks and wait until all of them have finished.
+        :param timeout: in seconds, None to wait forever
+        :return: {task name: (start, finish)} in seconds from the start of the run
+        :raise TimeoutError: if the tasks did not finish in time
+        :raise ValueError: if some tasks can never be issued
+        """
+        begin = time.monotonic()
+        pending = list(self.tasks)
+        running = []
+        while pending or running:
+            self.position = None
+            # poll completion only where a waiting task depends on it, and at the end
+            watched = {condition.task for task in pending for condition in task.conditions
+                       if isinstance(condition, Finished)}
+            if not pending:
+                watched = set(running)
+            self.poll([task for task in running if task in watched])
+            running = [task for task in running if task.finished is None]
+
+            issued = False
+            for task in list(pending):
+                if all(condition.satisfied(self) for condition in task.conditions):
+                    self.robot.call(task.api)
+                    task.started = time.monotonic()
+                    if task.kind == INSTANT:
+                        task.finished = task.started
+                    else:
+                        running.append(task)
+                        self.last[task.kind] = task
+                        self.busy[task.kind] = False
+                    pending.remove(task)
+                    issued = True
+            if issued:
+                continue
+            if pending and not running:
+                raise ValueError(f"Unsatisfiable conditions: {pending}")
+            if timeout is not None and time.monotonic() - begin > timeout:
+                raise TimeoutError(f"Tasks not finished after {timeout}s: {pending + running}")
+            if self.poll_interval:
+                time.sleep(self.poll_interval)
+        return {task.name: (task.started - begin, task.finished - begin) for task in self.tasks}
+
+    def poll(self, tasks):
+        arm = [task for task in tasks if task.kind == ARM]
+        gripper = [task for task in tasks if task.kind == GRIPPER]
+        now = time.monotonic()
+        if arm:
+            if self.idle(ARM, self.robot.call(apis.Common.is_robot_motion_done()), now):
+                # everything issued so far has completed
+                for task in arm:
+                    task.finished = now
+            else:
+                for task in arm:
+                    if task.target is not None and \
+                            np.linalg.norm(self.tcp_position() - task.target) <= task.tolerance:
+                        task.finished = now
+        if gripper and self.idle(GRIPPER, self.robot.call(apis.Gripper.is_motion_done()), now):
+            for task in gripper:
+                task.finished = now
+
+    def idle(self, kind, done, now) -> bool:
+        """
+        :param kind: ARM or GRIPPER
+        :param done: what the actuator reports
+        :return: whether the last task issued to the actuator has completed, see TaskGraph
+        """
+        if not done:
+            self.busy[kind] = True
+            return False
+        last = self.last[kind]
+        if not self.busy[kind] and now - last.started < self.settle:
+            # maybe not started yet
+            return False
+        return last.target is None or np.linalg.norm(self.tcp_position() - last.target) <= last.tolerance
@@ -0,0 +1,576 @@
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from sdk.kinematics import Kinematics, pose_to_matrix, matrix_to_pose, compute_pre_pick, compute_post_pick
+
+# 仿真控制器：位置单位毫米(mm)，姿态/关节单位度(°)，时间为虚拟时间(s)
+
+ERR_PARAM_VALUE = 3
+ERR_EXECUTION_FAILED = 14
+ERR_INVERSE_KINEMATICS_COMPUTE_FAILED = 28
+ERR_SERVOJ_JOINT_OVERRUN = 29
+ERR_TARGET_POSE_CANNOT_REACHED = 112
+
+
+def _profile_time(distance, vel, acc):
+    """
+    Duration of a trapezoidal velocity profile from rest to rest.
+    """
+    distance = np.abs(distance)
+    ramp = vel * vel / acc
+    return np.where(distance >= ramp, distance / vel + vel / acc, 2.0 * np.sqrt(distance / acc))
+
+
+def _profile_fraction(t, duration, ramp):
+    """
+    Fraction of the distance covered at time t of a trapezoidal profile.
+    :param ramp: acceleration time as a fraction of the duration, at most 0.5
+    """
+    if t >= duration:
+        return 1.0
+    u = t / duration
+    if ramp <= 0:
+        return u
+    peak = 1.0 / (1.0 - ramp)  # normalized cruise velocity
+    if u < ramp:
+        return 0.5 * peak / ramp * u * u
+    if u > 1.0 - ramp:
+        return 1.0 - 0.5 * peak / ramp * (1.0 - u) ** 2
+    return peak * (u - 0.5 * ramp)
+
+
+def _unwrap(reference, pose):
+    """
+    The pose with its angles shifted by multiples of 360° to be closest to those of reference,
+    so interpolating between the two does not turn the long way around.
+    """
+    pose = np.array(pose, dtype=float)
+    pose[3:] = reference[3:] + (pose[3:] - reference[3:] + 180.0) % 360.0 - 180.0
+    return pose
+
+
+class Segment:
+    __slots__ = ("start", "end", "q0", "q1", "ramp")
+
+    def __init__(self, start, end, q0, q1, ramp):
+        self.start = start
+        self.end = end
+        self.q0 = q0
+        self.q1 = q1
+        self.ramp = ramp
+
+    def at(self, t):
+        return self.q0 + (self.q1 - self.q0) * _profile_fraction(t - self.start, self.end - self.start, self.ramp)
+
+
+class SimRobot:
+    """
+    Kinematic stand-in for the Fairino RPC object: Robot(instance=SimRobot()).
+
+    Motions are not executed in real time but on a virtual clock: a blocking move advances
+    the clock by its duration, non-blocking moves are queued after each other, servo commands
+    advance it by their cmd_time and every other call by latency. Durations follow trapezoidal
+    profiles under the velocity and acceleration limits, scaled by the speed percentages.
+    Poses are those of the flange in the base frame (tool 0, user 0); tool and user numbers
+    are ignored. There is no dynamics and no randomness, so a run is deterministic.
+
+    Limit violations are recorded in faults and put the simulated controller into an error
+    state, which rejects motion until ResetAllError, like the real one.
+    """
+
+    HOME = [0.0, -90.0, 90.0, -90.0, -90.0, 0.0]
+
+    def __init__(self, model="FR5", joints=None, joint_vel=180.0, joint_acc=720.0, cart_vel=1000.0,
+                 cart_acc=5000.0, gripper_time=1.0, latency=0.001, enabled=True):
+        """
+        :param model: arm model accepted by Kinematics
+        :param joints: initial joint position [°], HOME if None
+        :param joint_vel: joint velocity at 100% [°/s]
+        :param joint_acc: joint acceleration at 100% [°/s²]
+        :param cart_vel: TCP velocity at 100% [mm/s]
+        :param cart_acc: TCP acceleration at 100% [mm/s²]
+        :param gripper_time: full stroke time of the gripper at 100% speed [s]
+        :param latency: virtual time of one RPC round trip [s]
+        :param enabled: whether the robot starts enabled
+        """
+        self.kinematics = Kinematics(model)
+        self.joint_vel = joint_vel
+        self.joint_acc = joint_acc
+        self.cart_vel = cart_vel
+        self.cart_acc = cart_acc
+        self.gripper_time = gripper_time
+        self.latency = latency
+
+        self.time = 0.0
+        self.joints = np.array(self.HOME if joints is None else joints, dtype=float)
+        self.segments = []
+        self.speed = 100.0
+        self.enabled = enabled
+        self.servoing = False
+        self.drag_teach = False
+        self.error = 0
+        self.faults = []  # (time, command, code)
+        self.commands = Counter()
+        self.sys_vars = {i: 0.0 for i in range(1, 21)}
+        self.gripper_active = False
+        self.gripper_pos = 0.0
+        self.gripper_done_at = 0.0
+        self.jog_ref = None
+
+    # virtual time
+
+    def advance(self, dt):
+        self.time += dt
+        self.settle()
+
+    def settle(self):
+        while self.segments and self.segments[0].end <= self.time:
+            self.joints = self.segments.pop(0).q1
+
+    def current_joints(self):
+        self.settle()
+        if self.segments and self.segments[0].start < self.time:
+            return self.segments[0].at(self.time)
+        return self.joints
+
+    def busy_until(self):
+        return self.segments[-1].end if self.segments else self.time
+
+    def tick(self, name):
+        self.commands[name] += 1
+        self.advance(self.latency)
+
+    def fault(self, name, code, enter_error=True):
+        self.faults.append((self.time, name, code))
+        if enter_error:
+            self.error = code
+        return code
+
+    def report(self) -> dict:
+        """
+        :return: virtual time, command counts and faults of the run so far
+        """
+        return {"time": self.busy_until(), "commands": dict(self.commands), "faults": list(self.faults)}
+
+    # motion helpers
+
+    def check_motion(self, name):
+        if self.error:
+            return self.error
+        if not self.enabled or self.drag_teach:
+            return self.fault(name, ERR_EXECUTION_FAILED, enter_error=False)
+        return 0
+
+    def in_limits(self, joints):
+        limits = self.kinematics.model.joint_limits
+        return bool(np.all((joints >= limits[:, 0] - 1e-6) & (joints <= limits[:, 1] + 1e-6)))
+
+    def scales(self, vel, acc, ovl):
+        speed = max(vel, 1e-3) / 100.0 * ovl / 100.0 * self.speed / 100.0
+        accel = (acc if acc > 0 else 100.0) / 100.0
+        return speed, accel
+
+    def queue(self, q1, duration, ramp, blocking):
+        q1 = np.asarray(q1, dtype=float)
+        start = self.busy_until()
+        q0 = self.segments[-1].q1 if self.segments else self.current_joints()
+        self.segments.append(Segment(start, start + max(duration, 0.0), q0, q1, min(ramp, 0.5)))
+        if blocking:
+            self.advance(self.busy_until() - self.time)
+
+    def joint_motion_time(self, q0, q1, speed, accel):
+        vel = self.joint_vel * speed
+        acc = self.joint_acc * accel
+        duration = float(_profile_time(q1 - q0, vel, acc).max())
+        return duration, min(0.5, vel / acc / duration) if duration > 0 else 0.0
+
+    def cart_motion_time(self, length, speed, accel):
+        vel = self.cart_vel * speed
+        acc = self.cart_acc * accel
+        duration = float(_profile_time(length, vel, acc))
+        return duration, min(0.5, vel / acc / duration) if duration > 0 else 0.0
+
+    def solve(self, desc_pos, seed):
+        joints, ok = self.kinematics.inverse(np.asarray(desc_pos, dtype=float), seed=seed)
+        return np.asarray(joints), ok
+
+    def end_joints(self):
+        return self.segments[-1].q1 if self.segments else self.current_joints()
+
+    # queries
+
+    def GetSDKVersion(self):
+        self.tick("GetSDKVersion")
+        return 0, ["SimRobot", "sim"]
+
+    def GetControllerIP(self):
+        self.tick("GetControllerIP")
+        return 0, "sim"
+
+    def GetDefaultTransVel(self):
+        self.tick("GetDefaultTransVel")
+        return 0, self.speed
+
+    def IsInDragTeach(self):
+        self.tick("IsInDragTeach")
+        return 0, int(self.drag_teach)
+
+    def GetSysVarValue(self, var_id):
+        self.tick("GetSysVarValue")
+        return 0, self.sys_vars[var_id]
+
+    def SetSysVarValue(self, var_id, value):
+        self.tick("SetSysVarValue")
+        self.sys_vars[var_id] = value
+        return 0
+
+    def GetRobotMotionDone(self):
+        self.tick("GetRobotMotionDone")
+        return 0, int(not self.segments)
+
+    def GetActualTCPPose(self, flag=1):
+        self.tick("GetActualTCPPose")
+        return 0, self.kinematics.forward(self.current_joints()).tolist()
+
+    def GetActualJointPosDegree(self, flag=1):
+        self.tick("GetActualJointPosDegree")
+        return 0, self.current_joints().tolist()
+
+    def GetCurToolCoord(self):
+        self.tick("GetCurToolCoord")
+        return 0, [0.0] * 6
+
+    def GetCurWObjCoord(self):
+        self.tick("GetCurWObjCoord")
+        return 0, [0.0] * 6
+
+    def GetRobotErrorCode(self):
+        self.tick("GetRobotErrorCode")
+        return 0, [self.error, 0]
+
+    def ComputePrePick(self, desc_pos, z_length, z_angle):
+        self.tick("ComputePrePick")
+        return 0, compute_pre_pick(desc_pos, z_length, z_angle).tolist()
+
+    def ComputePostPick(self, desc_pos, z_length, z_angle):
+        self.tick("ComputePostPick")
+        return 0, compute_post_pick(desc_pos, z_length, z_angle).tolist()
+
+    # state
+
+    def SetSpeed(self, vel):
+        self.tick("SetSpeed")
+        self.speed = float(vel)
+        return 0
+
+    def ResetAllError(self):
+        self.tick("ResetAllError")
+        self.error = 0
+        return 0
+
+    def Mode(self, mode):
+        self.tick("Mode")
+        return 0
+
+    def DragTeachSwitch(self, state):
+        self.tick("DragTeachSwitch")
+        self.drag_teach = bool(state)
+        return 0
+
+    def RobotEnable(self, state):
+        self.tick("RobotEnable")
+        self.enabled = bool(state)
+        if not self.enabled:
+            self.stop()
+        return 0
+
+    def WaitMs(self, t_ms):
+        self.tick("WaitMs")
+        self.advance(t_ms / 1000.0)
+        return 0
+
+    def stop(self):
+        self.joints = self.current_joints()
+        self.segments = []
+        self.jog_ref = None
+
+    def StopMotion(self):
+        self.tick("StopMotion")
+        self.stop()
+        return 0
+
+    # point to point
+
+    def MoveJ(self, joint_pos, tool, user, desc_pos, vel, acc, ovl, exaxis_pos, blend_time, offset_flag, offset_pos):
+        self.tick("MoveJ")
+        code = self.check_motion("MoveJ")
+        if code:
+            return code
+        target = np.asarray(joint_pos, dtype=float)
+        if not self.in_limits(target):
+            return self.fault("MoveJ", ERR_PARAM_VALUE, enter_error=False)
+        speed, accel = self.scales(vel, acc, ovl)
+        duration, ramp = self.joint_motion_time(self.end_joints(), target, speed, accel)
+        self.queue(target, duration, ramp, blend_time < 0)
+        return 0
+
+    def MoveCart(self, desc_pos, tool, user, vel, acc, ovl, blend_time, config):
+        self.tick("MoveCart")
+        code = self.check_motion("MoveCart")
+        if code:
+            return code
+        target, ok = self.solve(desc_pos, self.end_joints())
+        if not ok:
+            return self.fault("MoveCart", ERR_TARGET_POSE_CANNOT_REACHED, enter_error=False)
+        speed, accel = self.scales(vel, acc, ovl)
+        duration, ramp = self.joint_motion_time(self.end_joints(), target, speed, accel)
+        self.queue(target, duration, ramp, blend_time < 0)
+        return 0
+
+    def cartesian_path(self, name, points, vel, acc, ovl, blend_radius):
+        """
+        Queue a TCP path given as (k, 6) poses, the last is the target.
+        """
+        seed = self.end_joints()
+        start = self.kinematics.forward(seed).data
+        path = np.vstack([start, points])
+        joints = np.empty((len(points), 6))
+        for i, pose in enumerate(points):
+            solution, ok = self.solve(pose, seed)
+            if not ok:
+                return self.fault(name, ERR_TARGET_POSE_CANNOT_REACHED, enter_error=False)
+            joints[i] = seed = solution
+        length = float(np.linalg.norm(np.diff(path[:, :3], axis=0), axis=1).sum())
+        speed, accel = self.scales(vel, acc, ovl)
+        duration, ramp = self.cart_motion_time(length, speed, accel)
+        # not faster than the joints allow either
+        duration = max(duration, self.joint_motion_time(self.end_joints(), joints[-1], speed, accel)[0])
+        self.queue(joints[-1], duration, ramp, blend_radius < 0)
+        return 0
+
+    def MoveL(self, desc_pos, tool, user, joint_pos, vel, acc, ovl, blend_radius, exaxis_pos, search, offset_flag,
+              offset_pos):
+        self.tick("MoveL")
+        code = self.check_motion("MoveL")
+        if code:
+            return code
+        start = self.kinematics.forward(self.end_joints()).data
+        target = _unwrap(start, desc_pos)
+        # intermediate points, the line has to stay reachable
+        fractions = np.linspace(0.0, 1.0, 9)[1:, None]
+        points = start + (target - start) * fractions
+        points[-1] = target
+        return self.cartesian_path("MoveL", points, vel, acc, ovl, blend_radius)
+
+    def MoveC(self, desc_pos_p, tool_p, user_p, desc_pos_t, tool_t, user_t, joint_pos_p, joint_pos_t, vel_p, acc_p,
+              exaxis_pos_p, offset_flag_p, vel_t, acc_t, exaxis_pos_t, offset_flag_t, offset_pos_t, ovl,
+              blend_radius):
+        self.tick("MoveC")
+        code = self.check_motion("MoveC")
+        if code:
+            return code
+        start = self.kinematics.forward(self.end_joints()).data
+        via = _unwrap(start, desc_pos_p)
+        target = _unwrap(via, desc_pos_t)
+        points = np.vstack([start + (via - start) * f for f in (0.25, 0.5, 0.75)]
+                           + [via] + [via + (target - via) * f for f in (0.25, 0.5, 0.75)] + [target])
+        points[:, :3] = self.arc(start[:3], via[:3], target[:3], len(points))
+        return self.cartesian_path("MoveC", points, min(vel_p, vel_t), acc_t, ovl, blend_radius)
+
+    @staticmethod
+    def arc(a, b, c, count):
+        """
+        :return: count points on the circle through a, b, c from after a to c, the chord if collinear
+        """
+        ab, ac = b - a, c - a
+        normal = np.cross(ab, ac)
+        n2 = normal @ normal
+        if n2 < 1e-9:
+            return a + ac * np.linspace(0.0, 1.0, count + 1)[1:, None]
+        center = a + (np.cross(normal, ab) * (ac @ ac) + np.cross(ac, normal) * (ab @ ab)) / (2.0 * n2)
+        u = a - center
+        radius = np.linalg.norm(u)
+        u /= radius
+        v = np.cross(normal / np.sqrt(n2), u)
+
+        def angle_of(p):
+            return np.arctan2((p - center) @ v, (p - center) @ u) % (2 * np.pi)
+
+        end = angle_of(c)
+        if angle_of(b) > end:
+            # the short way around misses the via point
+            end -= 2 * np.pi
+        angles = np.linspace(0.0, end, count + 1)[1:, None]
+        return center + radius * (np.cos(angles) * u + np.sin(angles) * v)
+
+    # jog
+
+    def StartJOG(self, ref, nb, direction, max_dis, vel, acc):
+        self.tick("StartJOG")
+        code = self.check_motion("StartJOG")
+        if code:
+            return code
+        self.stop()
+        sign = 1.0 if direction else -1.0
+        speed, accel = self.scales(vel, acc, 100.0)
+        if ref == 0:
+            target = self.joints.copy()
+            target[nb - 1] += sign * max_dis
+            limits = self.kinematics.model.joint_limits[nb - 1]
+            target[nb - 1] = np.clip(target[nb - 1], limits[0], limits[1])
+            duration, ramp = self.joint_motion_time(self.joints, target, speed, accel)
+        else:
+            delta = np.zeros(6)
+            delta[nb - 1] = sign * max_dis
+            t = self.kinematics.forward_matrix(self.joints)
+            step = pose_to_matrix(delta)
+            pose = matrix_to_pose(t @ step if ref == 4 else self._base_step(t, step))
+            target, ok = self.solve(pose, self.joints)
+            if not ok:
+                return self.fault("StartJOG", ERR_TARGET_POSE_CANNOT_REACHED, enter_error=False)
+            duration, ramp = self.cart_motion_time(max_dis, speed, accel)
+        self.jog_ref = ref
+        self.queue(target, duration, ramp, False)
+        return 0
+
+    @staticmethod
+    def _base_step(t, step):
+        # translate in the base frame, rotate about the TCP with base-aligned axes
+        result = t.copy()
+        result[:3, :3] = step[:3, :3] @ t[:3, :3]
+        result[:3, 3] += step[:3, 3]
+        return result
+
+    def StopJOG(self, ref):
+        self.tick("StopJOG")
+        self.stop()
+        return 0
+
+    def ImmStopJOG(self):
+        self.tick("ImmStopJOG")
+        self.stop()
+        return 0
+
+    # servo
+
+    def ServoMoveStart(self):
+        self.tick("ServoMoveStart")
+        self.servoing = True
+        return 0
+
+    def ServoMoveEnd(self):
+        self.tick("ServoMoveEnd")
+        self.servoing = False
+        return 0
+
+    def servo_to(self, name, target, cmd_time):
+        self.commands[name] += 1
+        code = self.check_motion(name)
+        if code:
+            self.advance(cmd_time)
+            return code
+        current = self.current_joints()
+        if not self.in_limits(target):
+            self.advance(cmd_time)
+            return self.fault(name, ERR_SERVOJ_JOINT_OVERRUN)
+        rate = np.abs(target - current).max() / max(cmd_time, 1e-6)
+        if rate > self.joint_vel:
+            self.advance(cmd_time)
+            return self.fault(name, ERR_SERVOJ_JOINT_OVERRUN)
+        self.segments = []
+        self.joints = np.asarray(target, dtype=float)
+        self.advance(cmd_time)
+        return 0
+
+    def ServoJ(self, joint_pos, acc, vel, cmd_time, filter_time, gain):
+        return self.servo_to("ServoJ", np.asarray(joint_pos, dtype=float), cmd_time)
+
+    def ServoCart(self, mode, desc_pos, pos_gain, acc, vel, cmd_time, filter_time, gain):
+        desc_pos = np.asarray(desc_pos, dtype=float)
+        if pos_gain is not None:
+            desc_pos = desc_pos * np.asarray(pos_gain, dtype=float)
+        current = self.current_joints()
+        if mode == 0:
+            pose = desc_pos
+        else:
+            t = self.kinematics.forward_matrix(current)
+            step = pose_to_matrix(desc_pos)
+            pose = matrix_to_pose(t @ step if mode == 2 else self._base_step(t, step))
+        target, ok = self.solve(pose, current)
+        if not ok:
+            self.commands["ServoCart"] += 1
+            self.advance(cmd_time)
+            return self.fault("ServoCart", ERR_INVERSE_KINEMATICS_COMPUTE_FAILED, enter_error=False)
+        return self.servo_to("ServoCart", target, cmd_time)
+
+    # gripper
+
+    def ActGripper(self, index, action):
+        self.tick("ActGripper")
+        self.gripper_active = bool(action)
+        return 0
+
+    def GetGripperConfig(self):
+        self.tick("GetGripperConfig")
+        return 0, [1, 1, 0, 0]
+
+    def SetGripperConfig(self, company, device, soft_version, bus):
+        self.tick("SetGripperConfig")
+        return 0
+
+    def MoveGripper(self, index, pos, vel, force, maxtime, block):
+        self.tick("MoveGripper")
+        if not self.gripper_active:
+            return self.fault("MoveGripper", ERR_EXECUTION_FAILED, enter_error=False)
+        duration = abs(pos - self.gripper_pos) / 100.0 * self.gripper_time * 100.0 / max(vel, 1.0)
+        duration = min(duration, maxtime / 1000.0)
+        self.gripper_pos = float(pos)
+        self.gripper_done_at = self.time + duration
+        if block == 0:
+            self.advance(duration)
+        return 0
+
+    def GetGripperMotionDone(self):
+        self.tick("GetGripperMotionDone")
+        return 0, [0, int(self.time >= self.gripper_done_at)]
+
+
+def sim_robot(**kwargs):
+    """
+    A Robot on a SimRobot. Call timeouts are off: virtual time does not pass while waiting.
+    :param kwargs: passed to SimRobot
+    """
+    from sdk.base import Robot
+    from sdk.policy import CallPolicy, DEFAULT_POLICIES
+    policies = {key: CallPolicy(timeout=None) for key in DEFAULT_POLICIES}
+    return Robot(instance=SimRobot(**kwargs), policies=policies)
+
+
+def _run_scenario(scenario):
+    function, kwargs = scenario
+    robot = sim_robot(**kwargs)
+    error = None
+    result = None
+    try:
+        result = function(robot)
+    except Exception as e:  # a failing scenario is a result, not a crash of the batch
+        error = repr(e)
+    report = robot.instance.report()
+    report["result"] = result
+    report["error"] = error
+    return report
+
+
+def run_scenarios(scenarios, workers=None):
+    """
+    Run scenarios on simulated robots in parallel processes.
+    :param scenarios: list of (function, kwargs): function(robot) is called with a fresh
+                      sim_robot(**kwargs) and must be picklable, i.e. defined at module level
+    :param workers: number of processes, one per core if None
+    :return: per scenario, in order: SimRobot.report() plus "result" (the return value of the
+             function) and "error" (repr of the exception it raised, or None)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_scenario, scenarios))
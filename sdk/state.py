@@ -0,0 +1,158 @@
+AUTO = 0
+MANUAL = 1
+
+FIELDS = ("error", "enabled", "mode", "servoing", "gripper_active")
+
+VOLATILE = ("error", "enabled")
+"""
+States the controller changes on its own, e.g. on a fault, an e-stop or from the teach pendant,
+without the SDK seeing an error. Their cached value is not trusted: a transition to them is
+always issued.
+"""
+
+PREREQUISITES = ("error", "enabled", "mode")
+"""
+States other transitions depend on: the controller rejects or mishandles the later ones while
+an error is set, the arm is disabled or in the wrong mode. Transitions to them are sent one at a
+time, and nothing after a failed one is sent.
+"""
+
+RUNNING = {"error": 0, "enabled": True, "mode": AUTO, "servoing": True, "gripper_active": True}
+"""
+Ready for teleop: no error, enabled, automatic mode, servoing, gripper activated.
+"""
+
+STOPPED = {"servoing": False, "error": 0, "gripper_active": False, "enabled": False}
+"""
+Servoing ended, errors cleared, gripper reset, disabled.
+"""
+
+
+class ControllerState:
+    """
+    What the SDK last set the controller to, None where unknown.
+
+    The APIs changing one of these states record it when the controller accepted the command.
+    Every RobotException makes all of it unknown, since the controller may have changed state
+    on its own, e.g. disabled on an error; so does invalidate, e.g. after using the teach pendant.
+    """
+
+    def __init__(self):
+        self.error = None  # 0 once cleared
+        self.enabled = None
+        self.mode = None  # AUTO or MANUAL
+        self.servoing = None
+        self.gripper_active = None
+
+    def invalidate(self):
+        for field in FIELDS:
+            setattr(self, field, None)
+
+    def snapshot(self) -> dict:
+        return {field: getattr(self, field) for field in FIELDS}
+
+
+class StateSequencer:
+    def __init__(self, robot, gripper=None):
+        """
+        Brings the controller into a desired state with only the transitions the cached
+        ControllerState says are missing, plus those to the VOLATILE states.
+
+        Transitions to PREREQUISITES go out one at a time through Robot.call, in the order of the
+        desired dict, and the first rejected one ends the sequence. The controller runs every call
+        of a multicall even if an earlier one failed, so only runs of the other, independent
+        transitions between them are batched, as one RobotApi in one XML-RPC system.multicall round
+        trip where the connection supports it, one after another otherwise, see sdk.sysvar.multi_call.
+        :param robot: the robot
+        :param gripper: the sdk.apis.Gripper for gripper_active, None if not managed
+        """
+        self.robot = robot
+        self.gripper = gripper
+
+    def transition(self, field, value):
+        """
+        :return: (RPC method, arguments, RobotApi) setting field to value
+        """
+        from sdk import apis
+        if field == "error":
+            if value != 0:
+                raise ValueError("Only the error state 0 can be requested")
+            return "ResetAllError", (), apis.Safety.clear_error()
+        if field == "enabled":
+            return "RobotEnable", (int(bool(value)),), apis.Safety.enable_robot(value)
+        if field == "mode":
+            return "Mode", (value,), apis.Safety.mode_switch(value)
+        if field == "servoing":
+            if value:
+                return "ServoMoveStart", (), apis.Motion.servo_start()
+            return "ServoMoveEnd", (), apis.Motion.servo_end()
+        if field == "gripper_active":
+            if self.gripper is None:
+                return None
+            api = self.gripper.activate() if value else self.gripper.reset()
+            return "ActGripper", (self.gripper.index, int(bool(value))), api
+        raise ValueError(f"Unknown state {field}")
+
+    def plan(self, desired: dict) -> list:
+        """
+        :param desired: field -> value, transitions are issued in the order of the dict
+        :return: [(field, value, (method, args, api))] of the transitions needed
+        """
+        state = self.robot.state
+        plan = []
+        for field, value in desired.items():
+            if field in VOLATILE or getattr(state, field) != value:
+                transition = self.transition(field, value)
+                if transition is not None:
+                    plan.append((field, value, transition))
+        return plan
+
+    def apply(self, desired: dict) -> int:
+        """
+        :param desired: e.g. RUNNING or STOPPED
+        :return: the number of transitions issued
+        :raise RobotException: if the controller rejected one of them
+        """
+        plan = self.plan(desired)
+        batch = []
+        for step in plan:
+            if step[0] in PREREQUISITES:
+                self.send(batch)
+                batch = []
+                self.send([step])
+            else:
+                batch.append(step)
+        self.send(batch)
+        return len(plan)
+
+    def send(self, steps):
+        """
+        :param steps: transitions from plan, sent in one round trip
+        :raise RobotException: if the controller rejected one of them
+        """
+        if len(steps) == 1:
+            self.robot.call(steps[0][2][2])
+        elif steps:
+            self.robot.call(self.transitions(steps))
+
+    @staticmethod
+    def transitions(plan):
+        """
+        :param plan: independent transitions from plan
+        :return: the RobotApi issuing all transitions of plan at once and recording them in robot.state
+        """
+        from sdk.sysvar import multi_call
+        from sdk.util import RobotApiBuilder
+
+        def call(robot):
+            results = multi_call(robot, [(method, args) for _, _, (method, args, _) in plan])
+            for (field, value, _), ret in zip(plan, results):
+                if ret != 0:
+                    return ret
+                setattr(robot.state, field, value)
+            return 0
+
+        return (RobotApiBuilder()
+                .set_only_error_code()
+                .api_call(call)
+                .build())
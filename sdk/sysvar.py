@@ -0,0 +1,180 @@
+import threading
+import time
+import xmlrpc.client
+
+SYS_VAR_IDS = range(1, 21)
+"""
+The controller has 20 system variables, ids 1 to 20.
+"""
+
+
+def _check_ids(var_ids):
+    for var_id in var_ids:
+        if var_id not in SYS_VAR_IDS:
+            raise ValueError(f"Invalid system variable id {var_id}")
+
+
+def batch_call(robot, method, args_list):
+    """
+    Call one RPC method with several argument tuples in a single round trip (XML-RPC
+    system.multicall), one call after another if the controller does not support it.
+    :param robot: the robot
+    :param method: name of the RPC method, e.g. "GetSysVarValue"
+    :param args_list: list of argument tuples
+    :return: list of the raw return values, in order
+    """
+    return multi_call(robot, [(method, args) for args in args_list])
+
+
+def multi_call(robot, calls):
+    """
+    Call several RPC methods in a single round trip (XML-RPC system.multicall), one call after
+    another if the controller does not support it. The controller runs them in order.
+
+    Runs on the caller's thread against robot.instance: call it from inside a RobotApi, so it
+    goes out through Robot.call like any other RPC.
+    :param robot: the robot
+    :param calls: list of (RPC method name, argument tuple)
+    :return: list of the raw return values, in order
+    """
+    proxy = getattr(robot.instance, "robot", None)
+    if len(calls) > 1 and isinstance(proxy, xmlrpc.client.ServerProxy) and getattr(robot, "multicall", True):
+        multicall = xmlrpc.client.MultiCall(proxy)
+        for method, args in calls:
+            getattr(multicall, method)(*args)
+        try:
+            return list(multicall())
+        except xmlrpc.client.Fault as e:
+            if not _method_missing(e):
+                # a fault of one of the calls
+                raise
+            # system.multicall not implemented, do not try again
+            robot.multicall = False
+    return [getattr(robot.instance, method)(*args) for method, args in calls]
+
+
+def _method_missing(fault: xmlrpc.client.Fault) -> bool:
+    """
+    Whether the fault says system.multicall does not exist: the XML-RPC "method not found" code,
+    or the message of servers without a code for it such as Python's SimpleXMLRPCServer.
+    """
+    return fault.faultCode == -32601 or "system.multicall" in str(fault.faultString)
+
+
+class SysVarCache:
+    """
+    Last known values of the system variables of one robot.
+
+    Writes through Common.set_sys_vars skip variables whose cached value is already the one
+    to write; this assumes the variables are only written through this cache, pass force
+    where a program or the PLC writes them too. Reads through Common.get_sys_vars refresh it.
+    The robot clears it when its circuit breaker closes again after the controller was unreachable.
+
+    wait_for lets any number of threads wait on variables: one poller thread reads all
+    variables that are waited on with a single bulk call per period and wakes the waiters.
+    """
+
+    def __init__(self, robot, period=0.05):
+        """
+        :param robot: the robot the variables belong to
+        :param period: poll period of wait_for in seconds
+        """
+        self.robot = robot
+        self.period = period
+        self.values = {}
+        self.condition = threading.Condition()
+        self.watched = {}  # var_id -> number of waiters
+        self.poller = None
+        self.error = None
+
+    def get(self, var_id, default=None):
+        return self.values.get(var_id, default)
+
+    def is_cached(self, var_id, value):
+        return self.values.get(var_id, _MISSING) == value
+
+    def update(self, values: dict):
+        """
+        Store values read from or written to the controller, and wake the waiters on a change.
+        """
+        with self.condition:
+            changed = False
+            for var_id, value in values.items():
+                if self.values.get(var_id, _MISSING) != value:
+                    self.values[var_id] = value
+                    changed = True
+            if changed:
+                self.condition.notify_all()
+
+    def invalidate(self, var_ids=None):
+        with self.condition:
+            if var_ids is None:
+                self.values.clear()
+            else:
+                for var_id in var_ids:
+                    self.values.pop(var_id, None)
+
+    def wait_for(self, var_id, value=None, predicate=None, timeout=None) -> bool:
+        """
+        Block until a variable reaches a value.
+        :param var_id: variable id, [1~20]
+        :param value: the value to wait for
+        :param predicate: alternatively, a function of the value returning True when done
+        :param timeout: in seconds, None to wait forever
+        :return: False on timeout
+        :raise RobotException: if the poller cannot read the variables, or the error it got otherwise
+        """
+        _check_ids([var_id])
+        if predicate is None:
+            def predicate(current):
+                return current == value
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            self.watched[var_id] = self.watched.get(var_id, 0) + 1
+            # a fresh read, the cached value may be stale
+            self.values.pop(var_id, None)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, daemon=True, name="sysvar-poller")
+                self.poller.start()
+            try:
+                while True:
+                    if self.error is not None:
+                        raise self.error
+                    if var_id in self.values and predicate(self.values[var_id]):
+                        return True
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.watched[var_id] -= 1
+                if not self.watched[var_id]:
+                    del self.watched[var_id]
+
+    def poll(self):
+        from sdk.apis import Common
+        try:
+            while True:
+                with self.condition:
+                    if not self.watched:
+                        self.poller = None
+                        self.error = None
+                        return
+                    var_ids = sorted(self.watched)
+                try:
+                    # refreshes the cache and wakes the waiters
+                    self.robot.call(Common.get_sys_vars(var_ids))
+                    self.error = None
+                except Exception as e:
+                    with self.condition:
+                        self.error = e
+                        self.condition.notify_all()
+                time.sleep(self.period)
+        finally:
+            with self.condition:
+                # if this one died, the next wait_for starts a new poller
+                if self.poller is threading.current_thread():
+                    self.poller = None
+
+
+_MISSING = object()
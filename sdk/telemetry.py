@@ -0,0 +1,262 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+from sdk.base import Robot
+from sdk.log import log
+
+TELEMETRY_FRAME = struct.Struct("<4sHHIq6f6fffii")
+"""
+Layout of one telemetry frame, little-endian, 84 bytes:
+magic b"RJTL", version uint16, flags uint16, sequence uint32, time int64 (time.monotonic_ns() of
+the publisher), TCP pose 6 float32 [mm][°], joint positions 6 float32 [°], TCP speed float32 [mm/s],
+speed percentage float32, main and sub error code int32.
+"""
+
+TELEMETRY_MAGIC = b"RJTL"
+TELEMETRY_VERSION = 1
+
+FLAG_GRIPPER_FAULT = 0x1
+FLAG_GRIPPER_DONE = 0x2
+FLAG_STALE = 0x4
+"""
+A query failed in this tick, its fields hold the previous values.
+"""
+
+QUERIES = [
+    ("GetActualTCPPose", (1,)),
+    ("GetActualJointPosDegree", (1,)),
+    ("GetRobotErrorCode", ()),
+    ("GetDefaultTransVel", ()),
+    ("GetGripperMotionDone", ()),
+]
+"""
+The RPCs of one tick: TCP pose, joints, error code, speed percentage and gripper state.
+"""
+
+SUBSCRIBE = b"subscribe"
+UNSUBSCRIBE = b"unsubscribe"
+
+
+def decode_telemetry(raw) -> dict:
+    """
+    Decode one telemetry frame, the counterpart of ctrl.source.decode_joy_packet for clients.
+    :param raw: the frame, see TELEMETRY_FRAME
+    :return: the frame as a dict
+    :raise ValueError: if it is not a telemetry frame of this version
+    """
+    if len(raw) != TELEMETRY_FRAME.size:
+        raise ValueError(f"Telemetry frame of {len(raw)} bytes, expected {TELEMETRY_FRAME.size}")
+    values = TELEMETRY_FRAME.unpack(raw)
+    if values[0] != TELEMETRY_MAGIC or values[1] != TELEMETRY_VERSION:
+        raise ValueError(f"Not a telemetry frame of version {TELEMETRY_VERSION}")
+    flags = values[2]
+    return {
+        "sequence": values[3],
+        "time": values[4],
+        "tcp_pose": list(values[5:11]),
+        "joints": list(values[11:17]),
+        "tcp_speed": values[17],
+        "speed": values[18],
+        "error_code": [values[19], values[20]],
+        "gripper_fault": bool(flags & FLAG_GRIPPER_FAULT),
+        "gripper_done": bool(flags & FLAG_GRIPPER_DONE),
+        "stale": bool(flags & FLAG_STALE),
+    }
+
+
+class TelemetryPublisher(threading.Thread):
+    """
+    Publishes the robot state as one TELEMETRY_FRAME per tick to any number of subscribers.
+
+    The state is queried once per tick, whatever the number of subscribers, and packed into
+    one preallocated buffer that is sent to each of them, so HMIs no longer poll the controller
+    themselves. A client subscribes by sending any datagram (e.g. SUBSCRIBE) to the UDP port or
+    the Unix socket, and has to renew it within lease seconds; UNSUBSCRIBE ends it right away.
+    """
+
+    def __init__(self, robot: Robot, host='127.0.0.1', port=25658, path=None, period=0.05, lease=5.0):
+        """
+        :param robot: the robot to publish
+        :param host: address of the UDP socket, None for no UDP
+        :param port: port of the UDP socket
+        :param path: path of a Unix datagram socket, None for none
+        :param period: time between frames [s]
+        :param lease: time after which a subscription that was not renewed ends [s]
+        """
+        super().__init__(daemon=True, name="telemetry")
+        self.robot = robot
+        self.period = period
+        self.lease = lease
+        self.buffer = bytearray(TELEMETRY_FRAME.size)
+        self.view = memoryview(self.buffer)
+        self.sockets = []
+        if host is not None:
+            udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            udp.bind((host, port))
+            self.sockets.append(udp)
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            unix = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            unix.bind(path)
+            self.sockets.append(unix)
+        for sock in self.sockets:
+            sock.setblocking(False)
+        self.subscribers = {}  # (socket, address) -> expiry, time.monotonic(), None for no expiry
+        self.sequence = 0
+        self.pose = [0.0] * 6
+        self.joints = [0.0] * 6
+        self.speed = 0.0
+        self.error_code = [0, 0]
+        self.gripper = [0, 0]
+        self.prev_pose = None
+        self.prev_time = None
+        self.stopped = False
+
+    def subscribe(self, address, lease=None):
+        """
+        Add a subscriber from this side, e.g. a fixed HMI.
+        :param address: (host, port) for UDP, a path for the Unix socket
+        :param lease: seconds until it ends, None for never
+        """
+        family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+        sock = next(sock for sock in self.sockets if sock.family == family)
+        self.subscribers[(sock, address)] = None if lease is None else time.monotonic() + lease
+
+    def accept(self, now):
+        """
+        Handle the subscription requests that arrived since the last tick.
+        """
+        for sock in self.sockets:
+            while True:
+                try:
+                    data, address = sock.recvfrom(64)
+                except OSError:
+                    # BlockingIOError once drained
+                    break
+                if not address:
+                    # an unbound Unix client cannot receive anything
+                    continue
+                if data.strip() == UNSUBSCRIBE:
+                    self.subscribers.pop((sock, address), None)
+                elif (sock, address) not in self.subscribers or self.subscribers[(sock, address)] is not None:
+                    # renew, subscribers added by subscribe without a lease keep it
+                    self.subscribers[(sock, address)] = now + self.lease
+        for key, expiry in list(self.subscribers.items()):
+            if expiry is not None and expiry < now:
+                del self.subscribers[key]
+
+    @staticmethod
+    def snapshot():
+        """
+        :return: the RobotApi reading all QUERIES in one round trip (XML-RPC multicall, one by one
+                 if the controller lacks it), so a tick holds the RPC worker once instead of five times
+        """
+        from sdk.sysvar import multi_call
+        from sdk.util import RobotApiBuilder
+
+        def call(robot):
+            values = []
+            for ret in multi_call(robot, QUERIES):
+                if not isinstance(ret, (tuple, list)):
+                    return ret
+                if ret[0] != 0:
+                    return ret[0]
+                # the raw multicall result is [code, *values], the SDK returns (code, values)
+                values.append(ret[1] if len(ret) == 2 else list(ret[1:]))
+            return 0, values
+
+        return (RobotApiBuilder()
+                .api_call(call)
+                .build())
+
+    def gather(self) -> int:
+        """
+        Query the state once.
+        :return: the flags of the frame
+        """
+        flags = 0
+        try:
+            pose, joints, error_code, speed, gripper = self.robot.call(self.snapshot())
+            # converted before any is stored, a malformed answer leaves the whole frame stale
+            state = list(pose), list(joints), list(error_code), float(speed), list(gripper)
+            self.pose, self.joints, self.error_code, self.speed, self.gripper = state
+        except Exception as e:
+            # any failure, not only RobotException: the publisher thread must keep running
+            log.error("telemetry query failed: %r", e)
+            flags |= FLAG_STALE
+        if self.gripper[0]:
+            flags |= FLAG_GRIPPER_FAULT
+        if self.gripper[1] == 1:
+            flags |= FLAG_GRIPPER_DONE
+        return flags
+
+    def pack(self, flags, now_ns):
+        tcp_speed = 0.0
+        if self.prev_pose is not None and now_ns > self.prev_time:
+            distance = sum((a - b) ** 2 for a, b in zip(self.pose[:3], self.prev_pose[:3])) ** 0.5
+            tcp_speed = distance / ((now_ns - self.prev_time) / 1e9)
+        self.prev_pose = self.pose
+        self.prev_time = now_ns
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        TELEMETRY_FRAME.pack_into(self.buffer, 0, TELEMETRY_MAGIC, TELEMETRY_VERSION, flags, self.sequence,
+                                  now_ns, *self.pose, *self.joints, tcp_speed, self.speed, *self.error_code)
+
+    def publish(self):
+        """
+        Send the current frame to every subscriber.
+        """
+        for key in list(self.subscribers):
+            sock, address = key
+            try:
+                sock.sendto(self.view, address)
+            except BlockingIOError:
+                # the send buffer is full, this subscriber misses one frame
+                pass
+            except OSError:
+                # gone, e.g. the Unix client removed its socket
+                self.subscribers.pop(key, None)
+
+    def tick(self):
+        self.accept(time.monotonic())
+        if not self.subscribers:
+            # nobody listens, do not load the controller
+            self.prev_pose = None
+            return
+        flags = self.gather()
+        self.pack(flags, time.monotonic_ns())
+        self.publish()
+
+    def run(self):
+        deadline = time.monotonic()
+        try:
+            while not self.stopped:
+                self.tick()
+                deadline += self.period
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    time.sleep(remaining)
+                else:
+                    # fell behind, e.g. on a slow query: do not try to catch up with a burst
+                    deadline = time.monotonic()
+        finally:
+            self.close()
+
+    def stop(self):
+        """
+        Stop publishing, the sockets are closed by the thread after its current tick.
+        """
+        self.stopped = True
+
+    def close(self):
+        for sock in self.sockets:
+            if sock.family == socket.AF_UNIX:
+                path = sock.getsockname()
+                sock.close()
+                if path and os.path.exists(path):
+                    os.unlink(path)
+            else:
+                sock.close()
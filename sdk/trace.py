@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from collections import deque
+
+
+class Tracer:
+    """
+    Collects timing spans of the control loop and exports them as Chrome trace JSON
+    (chrome://tracing, Perfetto).
+
+    All timestamps are time.monotonic_ns(). Spans recorded while handling one input packet
+    carry the same packet number, so receive -> decode -> controller -> rpc of a packet
+    line up in the viewer. Recording is a no-op while the tracer is disabled.
+    """
+
+    def __init__(self, capacity=200000):
+        """
+        :param capacity: number of spans kept, older spans are dropped
+        """
+        self.enabled = False
+        self.packet = 0
+        self.events = deque(maxlen=capacity)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self.events.clear()
+
+    def next_packet(self):
+        """
+        Start a new packet, the following spans are tagged with it.
+        """
+        self.packet += 1
+
+    def span(self, name, start_ns, end_ns):
+        """
+        Record a span. deque.append is atomic, so any thread may record.
+        :param name: span name
+        :param start_ns: start, time.monotonic_ns()
+        :param end_ns: end, time.monotonic_ns()
+        """
+        if self.enabled:
+            self.events.append((name, start_ns, end_ns, threading.get_ident(), self.packet))
+
+    def instant(self, name, at_ns):
+        """
+        Record a point in time, e.g. the arrival of a packet.
+        """
+        if self.enabled:
+            self.events.append((name, at_ns, None, threading.get_ident(), self.packet))
+
+    def to_chrome(self) -> dict:
+        pid = os.getpid()
+        events = []
+        for name, start, end, tid, packet in list(self.events):
+            event = {"name": name, "pid": pid, "tid": tid, "ts": start / 1000.0, "args": {"packet": packet}}
+            if end is None:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = (end - start) / 1000.0
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome(self, path):
+        """
+        Write the recorded spans as Chrome trace JSON.
+        :param path: output file
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f)
+
+
+tracer = Tracer()
+"""
+The process wide tracer used by the input sources, RosJoy and Robot.call.
+"""
+
+
+class RpcStats:
+    """
+    Per-API round trip statistics of Robot.call, keyed by RobotApi.name.
+    """
+
+    def __init__(self, alpha=0.1):
+        """
+        :param alpha: weight of the newest sample in the moving average
+        """
+        self.alpha = alpha
+        self.stats = {}
+        self.last_ns = 0
+        self.ewma_ns = 0.0
+
+    def record(self, name, duration_ns):
+        stat = self.stats.get(name)
+        if stat is None:
+            # count, total, last, max, moving average
+            stat = self.stats[name] = [0, 0, 0, 0, float(duration_ns)]
+        stat[0] += 1
+        stat[1] += duration_ns
+        stat[2] = duration_ns
+        if duration_ns > stat[3]:
+            stat[3] = duration_ns
+        stat[4] += self.alpha * (duration_ns - stat[4])
+        self.last_ns = duration_ns
+        if self.ewma_ns:
+            self.ewma_ns += self.alpha * (duration_ns - self.ewma_ns)
+        else:
+            self.ewma_ns = float(duration_ns)
+
+    def get(self, name) -> dict:
+        """
+        :param name: the api name, e.g. "Motion.servo_cart"
+        :return: {"count", "mean_ms", "last_ms", "max_ms", "ewma_ms"} or None if never called
+        """
+        stat = self.stats.get(name)
+        if stat is None:
+            return None
+        count, total, last, maximum, ewma = stat
+        return {
+            "count": count,
+            "mean_ms": total / count / 1e6,
+            "last_ms": last / 1e6,
+            "max_ms": maximum / 1e6,
+            "ewma_ms": ewma / 1e6,
+        }
+
+    def ewma_ms(self, name, default=0.0) -> float:
+        """
+        Cheap accessor for the hot path.
+        :param name: the api name
+        :return: moving average round trip in milliseconds, default if never called
+        """
+        stat = self.stats.get(name)
+        return default if stat is None else stat[4] / 1e6
+
+    def snapshot(self) -> dict:
+        """
+        :return: api name -> statistics, see get
+        """
+        return {name: self.get(name) for name in list(self.stats)}
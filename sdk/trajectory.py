@@ -0,0 +1,286 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from sdk import apis
+from sdk.base import Robot
+from sdk.collision import CollisionException
+from sdk.log import log
+
+
+class TrajectoryFile:
+    def __init__(self, path, dtype="<f8", columns=6, header=0, joints=None):
+        """
+        A joint trajectory on disk, memory-mapped: opening it reads nothing, and only the pages of
+        the samples that are read are loaded (and can be dropped again by the OS).
+        :param path: a .npy file of shape (N, columns), or a file of fixed records of columns values
+        :param dtype: value type of a fixed-record file, ignored for .npy
+        :param columns: values per record of a fixed-record file, ignored for .npy
+        :param header: bytes before the first record of a fixed-record file
+        :param joints: the columns holding j1..j6 [°], the last 6 if None, e.g. after a time column
+        """
+        if str(path).endswith(".npy"):
+            data = np.load(path, mmap_mode="r")
+        else:
+            dtype = np.dtype(dtype)
+            data = np.memmap(path, dtype=dtype, mode="r", offset=header)
+            data = data[:len(data) - len(data) % columns].reshape(-1, columns)
+        if data.ndim != 2 or data.shape[1] < 6:
+            raise ValueError(f"Trajectory {path} has shape {data.shape}, expected (N, >= 6)")
+        self.data = data
+        self.joints = list(joints) if joints is not None else list(range(data.shape[1] - 6, data.shape[1]))
+
+    def __len__(self):
+        return len(self.data)
+
+    def read(self, start, count) -> np.ndarray:
+        """
+        :return: (n, 6) joint positions of samples start to start + count, a copy
+        """
+        return np.asarray(self.data[start:start + count, self.joints], dtype=float)
+
+
+class TrajectoryStream:
+    def __init__(self, trajectory: TrajectoryFile, chunk=1024, prefetch=2, checker=None):
+        """
+        Reads a trajectory lazily in chunks from a background thread, prefetch chunks ahead of
+        the consumer, so page faults do not stall the servo loop and memory stays at
+        prefetch + 1 chunks whatever the length of the trajectory.
+        :param trajectory: the samples
+        :param chunk: samples per chunk
+        :param prefetch: chunks read ahead
+        :param checker: sdk.collision.AsyncCollisionChecker validating every chunk while the previous one
+                        streams, None for no check
+        """
+        self.trajectory = trajectory
+        self.chunk = chunk
+        self.checker = checker
+        self.chunks = queue.Queue(maxsize=prefetch)
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)  # notified on seek and close
+        self.generation = 0
+        self.next_read = 0  # first sample of the next chunk to read
+        self.current = None  # (start, samples) of the chunk being consumed
+        self.position = 0  # next sample to hand out
+        self.stopped = False
+        self.reader = threading.Thread(target=self.prefetch, daemon=True, name="trajectory-prefetch")
+        self.reader.start()
+
+    def __len__(self):
+        return len(self.trajectory)
+
+    def prefetch(self):
+        while not self.stopped:
+            with self.lock:
+                generation, start = self.generation, self.next_read
+                self.next_read = min(start + self.chunk, len(self.trajectory))
+            if start >= len(self.trajectory):
+                # at the end: wait for a seek
+                item = (generation, start, None, None, None)
+            else:
+                try:
+                    samples = self.trajectory.read(start, self.chunk)
+                    check = self.checker.submit(samples) if self.checker is not None else None
+                    item = (generation, start, samples, check, None)
+                except Exception as e:
+                    # handed to the consumer, which raises it; the reader waits for a seek
+                    item = (generation, start, None, None, e)
+            while not self.stopped:
+                with self.lock:
+                    if generation != self.generation:
+                        break
+                try:
+                    self.chunks.put(item, timeout=0.05)
+                    break
+                except queue.Full:
+                    pass
+            if item[2] is None:
+                # at the end or failed
+                with self.changed:
+                    self.changed.wait_for(lambda: generation != self.generation or self.stopped)
+
+    def seek(self, index):
+        """
+        Continue from sample index. Chunks read ahead are dropped.
+        """
+        if not 0 <= index <= len(self.trajectory):
+            raise IndexError(f"Sample {index} outside the trajectory of {len(self.trajectory)}")
+        with self.lock:
+            self.generation += 1
+            self.next_read = index
+            self.position = index
+            self.current = None
+            while True:
+                try:
+                    self.chunks.get_nowait()
+                except queue.Empty:
+                    break
+            self.changed.notify_all()
+
+    def load(self, timeout=None):
+        """
+        Make the chunk holding position current.
+        :return: False at the end of the trajectory
+        :raise CollisionException: if a sample of the chunk collides, with the index in the trajectory
+        :raise queue.Empty: if the chunk is not read within timeout
+        :raise Exception: what reading or submitting the chunk raised in the prefetch thread
+        """
+        while True:
+            generation, start, samples, check, error = self.chunks.get(timeout=timeout)
+            if generation != self.generation:
+                continue
+            if error is not None:
+                raise error
+            if samples is None:
+                return False
+            if check is not None:
+                index = check.result(timeout)
+                if index >= 0:
+                    raise CollisionException(start + index)
+            self.current = (start, samples)
+            return True
+
+    def peek(self, timeout=None):
+        """
+        :return: the next sample without consuming it, None at the end
+        """
+        current = self.current
+        if current is None or self.position >= current[0] + len(current[1]):
+            if self.position >= len(self.trajectory) or not self.load(timeout):
+                return None
+            current = self.current
+        return current[1][self.position - current[0]]
+
+    def next(self, timeout=None):
+        """
+        :return: the next sample, None at the end
+        """
+        sample = self.peek(timeout)
+        if sample is not None:
+            self.position += 1
+        return sample
+
+    def close(self):
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+
+
+class ServoSender(threading.Thread):
+    def __init__(self, robot: Robot, stream: TrajectoryStream, period=0.008, max_jump=1.0, stall=5,
+                 start_timeout=5.0, geofence=None):
+        """
+        Sends one sample per period with Motion.servo_joint, at a fixed rate on a deadline grid.
+
+        Any failure while servoing, a rejected command, a collision, a sample that is not ready
+        within stall periods or an error of the prefetch thread, stops the arm and ends servoing.
+        :param robot: the robot
+        :param stream: the samples
+        :param period: time between samples [s], also the cmd_time
+        :param max_jump: largest joint distance between the arm and the next sample resume accepts [°]
+        :param stall: periods to wait for a sample while servoing
+        :param start_timeout: time to wait for the first sample before servoing starts [s]
+        :param geofence: sdk.geofence.Geofence whose joint limits every sample is clamped to, None for none
+        """
+        super().__init__(daemon=True, name="servo-sender")
+        self.robot = robot
+        self.stream = stream
+        self.period = period
+        self.max_jump = max_jump
+        self.stall = stall
+        self.start_timeout = start_timeout
+        self.geofence = geofence
+        self.running = threading.Event()
+        self.running.set()
+        self.parked = threading.Event()  # set while the sender holds after a pause, or has ended
+        self.stopped = False
+        self.sent = 0
+        self.late = 0  # ticks that started after their deadline
+        self.error = None
+
+    def pause(self, timeout=None) -> bool:
+        """
+        Stop sending after the current sample; the arm holds its position.
+        :param timeout: time to wait for the sender to hold [s], None to wait until it does
+        :return: whether it holds, only then seek is allowed
+        """
+        self.running.clear()
+        return self.parked.wait(timeout)
+
+    def resume(self, check=True):
+        """
+        :param check: whether to verify that the arm is within max_jump of the next sample,
+                      needed after a seek
+        :raise ValueError: if it is not
+        """
+        if check:
+            sample = self.stream.peek()
+            if sample is not None:
+                actual = np.asarray(self.robot.call(apis.Common.get_actual_joint_pos()))
+                jump = float(np.abs(actual - sample).max())
+                if jump > self.max_jump:
+                    raise ValueError(f"Next sample {self.stream.position} is {jump:.1f}° away from the arm")
+        self.parked.clear()
+        self.running.set()
+
+    def seek(self, index):
+        """
+        Continue from sample index. Pause first, move the arm there, and resume.
+        """
+        if self.running.is_set() or not self.parked.is_set():
+            raise RuntimeError("Pause before seeking")
+        self.stream.seek(index)
+
+    def stop(self):
+        self.stopped = True
+        self.running.set()
+
+    def run(self):
+        period_ns = int(self.period * 1e9)
+        servoing = False
+        try:
+            if self.stream.peek(self.start_timeout) is None:
+                return
+            servoing = True
+            self.robot.call(apis.Motion.servo_start())
+            deadline = time.monotonic_ns()
+            while not self.stopped:
+                if not self.running.is_set():
+                    self.parked.set()
+                    self.running.wait()
+                    deadline = time.monotonic_ns()
+                    continue
+                sample = self.stream.next(self.stall * self.period)
+                if sample is None:
+                    break
+                if self.geofence is not None:
+                    sample = self.geofence.clamp_joints(sample)
+                self.robot.call(apis.Motion.servo_joint(sample, cmd_time=self.period))
+                self.sent += 1
+                deadline += period_ns
+                remaining = deadline - time.monotonic_ns()
+                if remaining > 0:
+                    time.sleep(remaining / 1e9)
+                else:
+                    self.late += 1
+                    deadline = time.monotonic_ns()
+        except Exception as e:
+            # e.g. RobotException, CollisionException, queue.Empty when the prefetch stalls,
+            # an OSError reading the file
+            self.error = e
+            log.error("trajectory stopped at sample %d: %r", self.stream.position, e)
+            if servoing:
+                try:
+                    self.robot.call(apis.Motion.stop_motion())
+                except Exception as e:
+                    log.error("stopping the arm failed: %r", e)
+        finally:
+            if servoing:
+                try:
+                    self.robot.call(apis.Motion.servo_end())
+                except Exception as e:
+                    log.error("ending servo mode failed: %r", e)
+            self.stream.close()
+            self.parked.set()
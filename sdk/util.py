@@ -17,6 +17,8 @@ class RobotApiBuilder(RobotApi):
 
     def api_call(self, api_call):
         self.__call_api__ = api_call
+        # "Motion.servo_cart.<locals>.<lambda>" -> "Motion.servo_cart"
+        self.name = api_call.__qualname__.split(".<locals>")[0]
         return self
 
     def post_data_process(self, post_data_process):
@@ -26,3 +28,18 @@ class RobotApiBuilder(RobotApi):
     def set_only_error_code(self):
         self.only_error_code = True
         return self
+
+    def set_urgent(self):
+        self.urgent = True
+        return self
+
+
+def to_rpc_list(value):
+    """
+    Turn a Pose, JointState, numpy array or any sequence into the plain list the RPC expects.
+    """
+    if value is None or isinstance(value, list):
+        return value
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return list(value)